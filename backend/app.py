@@ -3,6 +3,9 @@ from config import Config
 from extensions import db, login_manager, cors, migrate, init_app_extensions
 from blueprints.auth import auth_bp
 from blueprints.recommendations import recommendations_bp, load_recommender_assets 
+from blueprints.metrics import metrics_bp
+from blueprints.admin import admin_bp
+from metrics import init_app_metrics
 from models import User # Import User model to be known by login_manager, also for db.create_all()
 
 def create_app():
@@ -11,13 +14,17 @@ def create_app():
 
     # Initialize extensions with the app
     init_app_extensions(app)
+    init_app_metrics(app) # Request latency histograms and the opt-in Server-Timing header
     
     # Register Blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(recommendations_bp)
+    app.register_blueprint(metrics_bp) # Prometheus scrape endpoint at /metrics
+    app.register_blueprint(admin_bp) # Model reload / rollback, needs ADMIN_TOKEN
 
     # --- Load Recommender Assets HERE ---
-    # This ensures models and data are loaded once when the app starts
+    # This ensures models and data are loaded when the app starts; later versions are
+    # swapped in without a restart (see model_registry.py)
 
     load_recommender_assets()
     return app
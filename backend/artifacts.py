@@ -0,0 +1,301 @@
+# artifacts.py
+"""Versioned, memory-mappable bundle of the recommender's model artifacts.
+
+A bundle is a directory of raw .npy arrays plus a small manifest.json. The
+backend opens every array with np.load(mmap_mode='r'), so gunicorn workers on
+the same host share one copy of the factors, content index and metadata
+through the OS page cache instead of each unpickling and parsing its own.
+
+    python artifacts.py export [--out DIR]       # build a bundle from the legacy artifacts
+    python artifacts.py report [--workers N]     # startup time / RSS of legacy loader vs bundle
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from content_index import ContentIndex
+from svd_scoring import SVDScorer
+
+BUNDLE_FORMAT = 1
+MANIFEST_NAME = 'manifest.json'
+
+
+def _csr_arrays(prefix, matrix):
+    # Round-trip through csr_matrix so the index arrays already have the dtype scipy
+    # picks on load; otherwise scipy casts (copies) the memory-mapped arrays.
+    matrix = sparse.csr_matrix(matrix)
+    return {
+        f'{prefix}_data': matrix.data,
+        f'{prefix}_indices': matrix.indices,
+        f'{prefix}_indptr': matrix.indptr,
+    }
+
+
+def export_bundle(bundle_dir, svd_scorer, content_index, movie_ids, combined_data, popular_movies_data,
+                  blending_alpha, recommendation_top_n, version=None, popularity=None):
+    """Writes a bundle directory atomically (written next to bundle_dir, then renamed into place)."""
+    movie_ids = np.asarray(movie_ids, dtype=np.int64)
+    metadata = combined_data.set_index('movieId').reindex(movie_ids)
+
+    arrays = {
+        'movie_ids': movie_ids,
+        'svd_bu': svd_scorer.bu,
+        'svd_bi': svd_scorer.bi,
+        'svd_pu': svd_scorer.pu,
+        'svd_qi': svd_scorer.qi,
+        'svd_known_items': svd_scorer.known_items,
+        'svd_user_raw_ids': svd_scorer.user_raw_ids,
+        'meta_title': metadata['title'].fillna('').to_numpy(dtype=str),
+        'meta_content': metadata['content'].fillna('').to_numpy(dtype=str),
+        'meta_tmdb_id': metadata['tmdbId'].to_numpy(dtype=np.float64), # NaN where TMDB has no id
+        'popular_movie_ids': popular_movies_data['movieId'].to_numpy(dtype=np.int64),
+        'popular_title': popular_movies_data['title'].to_numpy(dtype=str),
+        'popular_num_ratings': popular_movies_data['num_ratings'].to_numpy(dtype=np.int64),
+        'popular_genre': popular_movies_data['genre'].to_numpy(dtype=str),
+    }
+    if popularity is not None:
+        arrays['popularity'] = np.asarray(popularity, dtype=np.int64) # Ratings per movie, for candidate generation
+    arrays.update(_csr_arrays('content_neighbors', content_index.neighbors))
+    if content_index.features is not None:
+        arrays.update(_csr_arrays('content_features', content_index.features))
+        n_features = content_index.features.shape[1]
+    else:
+        n_features = None
+
+    if version is None:
+        digest = hashlib.blake2b(digest_size=4)
+        for name in sorted(arrays):
+            digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+        version = f"{datetime.now():%Y%m%d%H%M%S}-{digest.hexdigest()}"
+
+    bundle_dir = os.path.abspath(bundle_dir)
+    tmp_dir = f"{bundle_dir}.tmp-{os.getpid()}"
+    os.makedirs(tmp_dir)
+    manifest_arrays = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), array, allow_pickle=False)
+        manifest_arrays[name] = {'file': f'{name}.npy', 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'version': version,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'n_movies': int(len(movie_ids)),
+        'n_factors': int(svd_scorer.n_factors),
+        'n_content_features': n_features,
+        'svd': {
+            'global_mean': svd_scorer.global_mean,
+            'rating_scale': list(svd_scorer.rating_scale),
+            'biased': svd_scorer.biased,
+        },
+        'blending_alpha': float(blending_alpha),
+        'recommendation_top_n': int(recommendation_top_n),
+        'arrays': manifest_arrays,
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    if os.path.exists(bundle_dir):
+        shutil.rmtree(bundle_dir)
+    os.rename(tmp_dir, bundle_dir)
+    return manifest
+
+
+class ArtifactBundle:
+    """Read-only view of a bundle; arrays are memory-mapped, nothing is copied up front."""
+
+    def __init__(self, bundle_dir, mmap_mode='r'):
+        self.bundle_dir = bundle_dir
+        with open(os.path.join(bundle_dir, MANIFEST_NAME)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f"Unsupported bundle format {self.manifest.get('format')} in {bundle_dir}")
+        self.arrays = {
+            name: np.load(os.path.join(bundle_dir, spec['file']), mmap_mode=mmap_mode, allow_pickle=False)
+            for name, spec in self.manifest['arrays'].items()
+        }
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    def svd_scorer(self):
+        svd = self.manifest['svd']
+        return SVDScorer(
+            global_mean=svd['global_mean'],
+            bu=self.arrays['svd_bu'],
+            bi=self.arrays['svd_bi'],
+            pu=self.arrays['svd_pu'],
+            qi=self.arrays['svd_qi'],
+            user_raw_ids=self.arrays['svd_user_raw_ids'],
+            rating_scale=svd['rating_scale'],
+            biased=svd['biased'],
+            known_items=self.arrays['svd_known_items'],
+        ) # version is the hash of qi/bi, the bundle version is only a label
+
+    def _csr(self, prefix, n_cols):
+        return sparse.csr_matrix(
+            (self.arrays[f'{prefix}_data'], self.arrays[f'{prefix}_indices'], self.arrays[f'{prefix}_indptr']),
+            shape=(self.manifest['n_movies'], n_cols), copy=False,
+        )
+
+    def content_index(self):
+        n_movies = self.manifest['n_movies']
+        features = None
+        if 'content_features_data' in self.arrays:
+            features = self._csr('content_features', self.manifest['n_content_features'])
+        return ContentIndex(features=features, neighbors=self._csr('content_neighbors', n_movies))
+
+    def combined_data(self):
+        return pd.DataFrame({
+            'movieId': self.arrays['movie_ids'],
+            'title': self.arrays['meta_title'],
+            'content': self.arrays['meta_content'],
+            'tmdbId': self.arrays['meta_tmdb_id'],
+        })
+
+    def popular_movies_data(self):
+        return pd.DataFrame({
+            'movieId': self.arrays['popular_movie_ids'],
+            'title': self.arrays['popular_title'],
+            'num_ratings': self.arrays['popular_num_ratings'],
+            'genre': self.arrays['popular_genre'],
+        })
+
+    def popularity(self):
+        """Number of ratings per movie; None for bundles exported before it was added."""
+        return self.arrays.get('popularity')
+
+
+def open_bundle(bundle_dir, mmap_mode='r'):
+    return ArtifactBundle(bundle_dir, mmap_mode=mmap_mode)
+
+
+# --- Command line: export and startup/RSS report ---
+
+def _proc_status_kb(pid='self'):
+    fields = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'VmHWM', 'RssAnon', 'RssFile'):
+                fields[key] = int(value.split()[0])
+    return fields
+
+
+def _pss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+_SAMPLE_PREFIX = 'ARTIFACT_SAMPLE ' # Marks the child's report line among whatever the loaders print
+
+
+def _report_child(loader, bundle_dir):
+    """Loads the assets one way, touches them like a request would, then reports and waits."""
+    import blueprints.recommendations as rec
+
+    start = time.perf_counter()
+    if loader == 'legacy':
+        assets = rec.load_legacy_assets()
+    else:
+        assets = rec.load_bundle_assets(bundle_dir)
+    load_seconds = time.perf_counter() - start
+    assets['svd_scorer'].score_factors(0.0, np.zeros(assets['svd_scorer'].n_factors))
+    assets['content_index'].scores([0, 1, 2])
+
+    stats = _proc_status_kb()
+    print(_SAMPLE_PREFIX + json.dumps({'loader': loader, 'load_seconds': round(load_seconds, 3), **stats}), flush=True)
+    sys.stdin.readline() # Stay alive until the parent has sampled PSS for all workers
+
+
+def _read_sample(child):
+    """Skips the child's loader output up to its report line and returns the parsed sample."""
+    skipped = []
+    for line in child.stdout:
+        if line.startswith(_SAMPLE_PREFIX):
+            return json.loads(line[len(_SAMPLE_PREFIX):])
+        skipped.append(line)
+    raise RuntimeError(f"Report worker exited without a sample:\n{''.join(skipped[-20:])}")
+
+
+def report(bundle_dir, workers):
+    """Starts `workers` processes per loader and reports load time, RSS and PSS (shared-page aware)."""
+    results = {}
+    for loader in ('legacy', 'bundle'):
+        children = [
+            subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '_child', loader, bundle_dir],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            for _ in range(workers)
+        ]
+        samples = [_read_sample(child) for child in children]
+        for child, sample in zip(children, samples):
+            sample['Pss'] = _pss_kb(child.pid)
+        for child in children:
+            child.communicate('\n')
+        results[loader] = {
+            'workers': workers,
+            'load_seconds_max': max(s['load_seconds'] for s in samples),
+            'rss_kb_per_worker': max(s['VmRSS'] for s in samples),
+            'anon_kb_per_worker': max(s['RssAnon'] for s in samples),
+            'file_backed_kb_per_worker': max(s['RssFile'] for s in samples),
+            'pss_kb_total': sum(s['Pss'] or 0 for s in samples),
+        }
+    print(json.dumps(results, indent=2))
+    return results
+
+
+def main(argv=None):
+    default_bundle = os.environ.get('MODEL_BUNDLE_DIR')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    export_parser = sub.add_parser('export', help='build a bundle from the legacy joblib/npy/csv artifacts')
+    export_parser.add_argument('--out', default=default_bundle)
+    export_parser.add_argument('--version')
+    report_parser = sub.add_parser('report', help='compare startup time and memory of both loaders')
+    report_parser.add_argument('--bundle', default=default_bundle)
+    report_parser.add_argument('--workers', type=int, default=2)
+    child_parser = sub.add_parser('_child')
+    child_parser.add_argument('loader')
+    child_parser.add_argument('bundle')
+    args = parser.parse_args(argv)
+
+    if args.command == '_child':
+        return _report_child(args.loader, args.bundle)
+
+    import blueprints.recommendations as rec
+    if args.command == 'export':
+        assets = rec.load_legacy_assets()
+        manifest = export_bundle(
+            args.out or rec.MODEL_BUNDLE_DIR, assets['svd_scorer'], assets['content_index'],
+            assets['movie_ids_list'], assets['combined_data'], assets['popular_movies_data'],
+            assets['blending_alpha'], assets['recommendation_top_n'], version=args.version,
+            popularity=assets['popularity'],
+        )
+        print(f"Wrote bundle {manifest['version']} to {args.out or rec.MODEL_BUNDLE_DIR}")
+    elif args.command == 'report':
+        report(args.bundle or rec.MODEL_BUNDLE_DIR, args.workers)
+
+
+if __name__ == '__main__':
+    main()
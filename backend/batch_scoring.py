@@ -0,0 +1,177 @@
+# batch_scoring.py
+"""Micro-batched SVD scoring: concurrent requests share one (users x factors) @ (factors x movies) product.
+
+See ScoringBatcher; the SCORING_* constants are the defaults for the env
+overrides in blueprints/recommendations.py.
+"""
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from ranking import batch_top_n, top_n_indices
+
+SCORING_BATCH_WINDOW_MS = 2.0 # How long the first request of a batch waits for others; 0 turns batching off
+SCORING_MAX_BATCH = 32 # Users scored by one (users x factors) @ (factors x movies) multiply
+SCORING_MAX_QUEUE = 256 # Requests waiting for the batcher; further ones score on their own thread
+SCORING_TIMEOUT = 1.0 # Seconds a request waits for its batch before scoring itself
+
+
+class _Job:
+    __slots__ = ('scorer', 'bias', 'factors', 'n', 'exclude_mask', 'result', 'error', 'done')
+
+    def __init__(self, scorer, bias, factors, n, exclude_mask):
+        self.scorer = scorer
+        self.bias = bias
+        self.factors = factors
+        self.n = n
+        self.exclude_mask = exclude_mask
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+def score_top_direct(scorer, bias, factors, n, exclude_mask=None):
+    """(SVD scores of every movie, indices of the n best allowed ones) for one user."""
+    scores = scorer.score_factors(bias, factors)
+    return scores, top_n_indices(scores, n, exclude_mask)
+
+
+class ScoringBatcher:
+    """Scores the SVD model for concurrent requests together.
+
+    Every swipe re-solves the user's factors, so each POST /recommend scores the
+    whole catalog (a factors x movies matrix-vector product) and takes the CF
+    candidates from it. When several requests get there at once, `score_top`
+    queues them for a single scoring thread that gathers up to `max_batch`
+    users within `window_ms`, scores them with one matrix product, runs the
+    top-n row-wise and wakes each caller with its own row. A request that is
+    the only one scoring right now skips the queue and scores on its own
+    thread, so a quiet server pays no window; so does a batch that ends up
+    with a single user. A full queue or a batch slower than `timeout` also
+    falls back to direct scoring, the request is never turned away.
+    """
+
+    def __init__(self, window_ms=SCORING_BATCH_WINDOW_MS, max_batch=SCORING_MAX_BATCH, max_queue=SCORING_MAX_QUEUE,
+                 timeout=SCORING_TIMEOUT):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread_pid = None # Started on first use so forked workers each start their own thread
+        self._in_flight = 0 # Callers inside score_top
+        self._queued = 0 # Of those, the ones waiting for a batch (queued or being collected)
+        self._direct = 0 # Of those, the ones scoring on their own thread
+        self._counts = dict.fromkeys(('direct', 'batched', 'single', 'overflow', 'timed_out', 'batches'), 0)
+        self._batch_sizes = 0
+
+    @property
+    def enabled(self):
+        return self.window > 0 and self.max_batch > 1
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name='scoring-batcher', daemon=True).start()
+
+    def _count(self, key):
+        with self._lock:
+            self._counts[key] += 1
+
+    def score_top(self, scorer, bias, factors, n, exclude_mask=None):
+        """Like score_top_direct, batched with the other requests scoring at the same time."""
+        if not self.enabled:
+            return score_top_direct(scorer, bias, factors, n, exclude_mask)
+        with self._lock:
+            self._in_flight += 1
+            alone = self._in_flight == 1
+            if alone:
+                self._direct += 1
+                self._counts['direct'] += 1
+        try:
+            if alone:
+                return score_top_direct(scorer, bias, factors, n, exclude_mask)
+            job = _Job(scorer, bias, factors, n, exclude_mask)
+            self._ensure_thread()
+            try:
+                with self._lock:
+                    self._queue.put_nowait(job)
+                    self._queued += 1
+            except queue.Full:
+                self._count('overflow')
+                return score_top_direct(scorer, bias, factors, n, exclude_mask)
+            if not job.done.wait(self.timeout):
+                self._count('timed_out')
+                return score_top_direct(scorer, bias, factors, n, exclude_mask)
+            if job.error is not None:
+                raise job.error
+            return job.result
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._direct -= alone
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                with self._lock:
+                    # Nobody else is scoring right now: waiting out the window would only add latency
+                    nothing_coming = self._queued <= len(batch) and self._in_flight - self._direct <= self._queued
+                if remaining <= 0 or nothing_coming:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Requests that started before a model reload bring the previous scorer
+            groups = {}
+            for job in batch:
+                groups.setdefault(id(job.scorer), []).append(job)
+            for jobs in groups.values():
+                self._score(jobs)
+
+    def _score(self, jobs):
+        try:
+            if len(jobs) == 1:
+                job = jobs[0]
+                job.result = score_top_direct(job.scorer, job.bias, job.factors, job.n, job.exclude_mask)
+            else:
+                n_movies = len(jobs[0].scorer.bi)
+                scores = jobs[0].scorer.score_factors_batch(
+                    [job.bias for job in jobs], np.vstack([job.factors for job in jobs])
+                )
+                exclude = np.vstack([
+                    np.zeros(n_movies, dtype=bool) if job.exclude_mask is None else job.exclude_mask for job in jobs
+                ])
+                tops = batch_top_n(scores, max(job.n for job in jobs), exclude)
+                for job, row, top in zip(jobs, scores, tops):
+                    job.result = (row.copy(), top[:job.n]) # Copy so a cached row does not pin the whole batch
+        except Exception as e:
+            for job in jobs:
+                job.error = e
+        with self._lock:
+            self._queued -= len(jobs)
+            self._counts['single' if len(jobs) == 1 else 'batched'] += len(jobs)
+            self._counts['batches'] += 1
+            self._batch_sizes += len(jobs)
+        for job in jobs:
+            job.done.set()
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            return {
+                'window_ms': self.window * 1000,
+                'max_batch': self.max_batch,
+                'queue_depth': self._queue.qsize(),
+                **counts,
+                'mean_batch_size': round(self._batch_sizes / counts['batches'], 2) if counts['batches'] else None,
+            }
@@ -0,0 +1,97 @@
+# benchmarks/bench_batching.py
+"""Throughput and tail latency of the ranking path with and without micro-batched SVD scoring.
+
+Each thread plays one user who keeps swiping: every call drops the user's
+cached SVD scores (as a fold-in does) and runs rank_movies() like POST
+/recommend. Concurrency levels are run once per batching window; window 0 is
+direct scoring on the request thread.
+
+    cd backend
+    python benchmarks/bench_batching.py --concurrency 1 2 4 8 16 32 --window-ms 0 1 2 --out batching.json
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from common import add_report_arguments, finish, summarize, write_report
+
+
+def make_states(rec, n_users, liked_per_user, rng):
+    """Synthetic logged-in users: random likes and folded-in factors."""
+    from user_state import UserState
+    model = rec.current_model()
+    states = []
+    for user_id in range(n_users):
+        liked = rng.choice(model.movie_ids_list, liked_per_user, replace=False).tolist()
+        state = UserState(user_id, [(movie_id, 5.0) for movie_id in liked], (len(liked), None),
+                          model.content_index, model.movie_id_to_index_map, model.version)
+        state.svd_factors = (rng.normal(0, 0.1), rng.normal(0, 0.1, model.svd_scorer.n_factors))
+        states.append((state, liked[-5:][::-1]))
+    return states
+
+
+def run_level(rec, states, concurrency, calls):
+    """Closed loop: `concurrency` threads, each ranking for its own user until `calls` rankings were done."""
+    per_thread = max(1, calls // concurrency)
+
+    def user_loop(i):
+        state, seeds = states[i % len(states)]
+        latencies = []
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            state.svd_scores = None # Every swipe re-solves the factors
+            rec.rank_movies(state, seeds, state.content_scores)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = [latency for thread in pool.map(user_loop, range(concurrency)) for latency in thread]
+    return latencies, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--window-ms', type=float, nargs='+', default=[0, 1, 2], help='batching windows, 0 = direct')
+    parser.add_argument('--max-batch', type=int, default=32)
+    parser.add_argument('--calls', type=int, default=640, help='rankings per concurrency level')
+    parser.add_argument('--liked', type=int, default=20, help='likes per synthetic user')
+    parser.add_argument('--seed', type=int, default=7)
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+
+    import blueprints.recommendations as rec
+    from batch_scoring import ScoringBatcher
+
+    rec.load_recommender_assets()
+    rng = np.random.default_rng(args.seed)
+    states = make_states(rec, max(args.concurrency), args.liked, rng)
+    results = {}
+    for window_ms in args.window_ms:
+        for concurrency in args.concurrency:
+            rec.scoring_batcher = ScoringBatcher(window_ms=window_ms, max_batch=args.max_batch)
+            run_level(rec, states, concurrency, min(args.calls, 4 * concurrency)) # Warm up threads and BLAS
+            rec.scoring_batcher = ScoringBatcher(window_ms=window_ms, max_batch=args.max_batch)
+            latencies, wall = run_level(rec, states, concurrency, args.calls)
+            name = 'direct' if window_ms <= 0 else f'window_{window_ms:g}ms'
+            stats = rec.scoring_batcher.stats()
+            results[f'{name}/c{concurrency}'] = {
+                **summarize(latencies, wall),
+                'mean_batch_size': stats['mean_batch_size'],
+                'batched': stats['batched'],
+                'direct': stats['direct'] + stats['single'] + stats['overflow'] + stats['timed_out'],
+            }
+
+    params = {k: v for k, v in vars(args).items() if k not in ('out', 'baseline')}
+    params['n_movies'] = len(rec.current_model().movie_ids_list)
+    params['n_factors'] = rec.current_model().svd_scorer.n_factors
+    report = write_report('batching', results, args.out, params)
+    return finish(report, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+# benchmarks/bench_endpoints.py
+"""Latency / throughput benchmark of the Flask endpoints against a synthetic user population.
+
+Builds the real app (app.py -> create_app()) on a throwaway SQLite database, with
+TMDB replaced by the local stub in tmdb_stub.py, creates users with histories of
+several sizes and drives /login, /recommend/initial and /recommend through Flask
+test clients. With --storm-logins it finally fires a burst of logins while
+swipes are being served, to show what bcrypt does to recommendation latency
+(compare BCRYPT_WORKERS=0 against the default bcrypt pool, and USER_CACHE_TTL=0
+or SESSION_IDENTITY=1 against the default user cache for the swipe numbers).
+
+    cd backend
+    python benchmarks/bench_endpoints.py --history-sizes 0 10 100 1000 --requests 100 --out bench.json
+    python benchmarks/bench_endpoints.py --baseline bench.json   # exit code 1 on p95 regressions
+    python benchmarks/bench_endpoints.py --history-sizes 100 --storm-logins 60 --concurrency 4
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from common import add_report_arguments, finish, summarize, write_report
+
+BENCH_PASSWORD = 'bench-password'
+
+
+def run_load(tasks, concurrency, statuses=False):
+    """Runs zero-argument callables returning a status code; returns (latencies, errors, wall seconds).
+
+    With statuses=True the middle item is the list of status codes instead of the error count.
+    """
+    def timed(task):
+        start = time.perf_counter()
+        status = task()
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, tasks))
+    wall = time.perf_counter() - start
+    latencies = [latency for latency, _ in outcomes]
+    if statuses:
+        return latencies, [status for _, status in outcomes], wall
+    errors = sum(1 for _, status in outcomes if status >= 400)
+    return latencies, errors, wall
+
+
+def populate(flask_app, history_sizes, users_per_size, seed):
+    """Creates bench users with random like/dislike histories; returns {history_size: [username, ...]}."""
+    import bcrypt
+    from extensions import db
+    from models import User, UserInteraction
+    import blueprints.recommendations as rec
+
+    rng = random.Random(seed)
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    usernames = {}
+    with flask_app.app_context():
+        for size in history_sizes:
+            users = [User(username=f'bench-h{size}-{i}', password=password_hash) for i in range(users_per_size)]
+            db.session.add_all(users)
+            db.session.flush()
+            rows = []
+            start = datetime.now() - timedelta(days=30)
+            for user in users:
+                for n, movie_id in enumerate(rng.sample(rec.current_model().movie_ids_list, size)):
+                    rows.append({
+                        'user_id': user.id,
+                        'movie_id': movie_id,
+                        'rating': 5.0 if rng.random() < 0.6 else 1.0,
+                        'timestamp': start + timedelta(seconds=n),
+                    })
+            if rows:
+                db.session.execute(UserInteraction.__table__.insert(), rows)
+            db.session.commit()
+            usernames[size] = [user.username for user in users]
+    return usernames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history-sizes', type=int, nargs='+', default=[0, 10, 100, 1000])
+    parser.add_argument('--users-per-size', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=50, help='requests per endpoint and history size')
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--swipes', type=int, default=5, help='movies swiped per POST /recommend')
+    parser.add_argument('--storm-logins', type=int, default=0, help='logins fired during a swipe run (0 skips it)')
+    parser.add_argument('--storm-concurrency', type=int, default=16, help='logins in flight at once during the storm')
+    parser.add_argument('--tmdb-delay', type=float, default=0.02, help='seconds the TMDB stub waits per lookup')
+    parser.add_argument('--seed', type=int, default=7)
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+
+    from tmdb_stub import start_stub_server
+
+    workdir = tempfile.mkdtemp(prefix='moviescout-bench-')
+    stub, stub_url, stub_stats = start_stub_server(delay=args.tmdb_delay)
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'TMDB_API_KEY': 'bench',
+        'TMDB_IMAGES_BASE_URL': stub_url,
+        'TMDB_IMAGE_CDN_BASE_URL': 'https://image.tmdb.invalid/t/p/w500',
+        'POSTER_CACHE_PATH': os.path.join(workdir, 'posters.sqlite3'),
+    })
+
+    boot_start = time.perf_counter()
+    import app as app_module # Runs create_app(), loads the recommender assets and creates the tables
+    boot_seconds = time.perf_counter() - boot_start
+    import blueprints.recommendations as rec
+    flask_app = app_module.app
+
+    usernames = populate(flask_app, args.history_sizes, args.users_per_size, args.seed)
+    rng = random.Random(args.seed)
+    results = {}
+
+    # /login: full bcrypt check per request
+    login_users = [name for names in usernames.values() for name in names]
+
+    def login_task(username):
+        return lambda: flask_app.test_client().post(
+            '/login', json={'username': username, 'password': BENCH_PASSWORD}
+        ).status_code
+
+    latencies, errors, wall = run_load(
+        [login_task(rng.choice(login_users)) for _ in range(args.logins)], args.concurrency
+    )
+    results['login'] = {**summarize(latencies, wall), 'errors': errors}
+
+    for size, names in usernames.items():
+        clients = []
+        for username in names:
+            client = flask_app.test_client()
+            client.post('/login', json={'username': username, 'password': BENCH_PASSWORD})
+            clients.append(client)
+
+        def initial_task(client):
+            return lambda: client.get('/recommend/initial').status_code
+
+        def swipe_task(client):
+            swiped = rng.sample(rec.current_model().movie_ids_list, args.swipes)
+            liked = swiped[: (args.swipes + 1) // 2]
+            disliked = swiped[len(liked):]
+            return lambda: client.post(
+                '/recommend', json={'likedMovieIds': liked, 'dislikedMovieIds': disliked}
+            ).status_code
+
+        for name, make_task in (('recommend_initial', initial_task), ('recommend_post', swipe_task)):
+            tasks = [make_task(clients[i % len(clients)]) for i in range(args.requests)]
+            latencies, errors, wall = run_load(tasks, args.concurrency)
+            results[f'{name}/history_{size}'] = {**summarize(latencies, wall), 'errors': errors}
+
+    if args.storm_logins:
+        # Login storm: a burst of logins competes with steady swipes from already logged-in users
+        storm_clients = []
+        for username in usernames[args.history_sizes[-1]]:
+            client = flask_app.test_client()
+            client.post('/login', json={'username': username, 'password': BENCH_PASSWORD})
+            storm_clients.append(client)
+        swipe_tasks = [swipe_task(storm_clients[i % len(storm_clients)]) for i in range(args.requests)]
+        login_tasks = [login_task(rng.choice(login_users)) for _ in range(args.storm_logins)]
+        storm = []
+
+        def login_storm():
+            storm.extend(run_load(login_tasks, args.storm_concurrency, statuses=True))
+
+        storm_thread = threading.Thread(target=login_storm)
+        storm_thread.start()
+        latencies, errors, wall = run_load(swipe_tasks, args.concurrency)
+        storm_thread.join()
+        results['login_storm/recommend_post'] = {**summarize(latencies, wall), 'errors': errors}
+        login_latencies, statuses, login_wall = storm
+        results['login_storm/login'] = {
+            **summarize(login_latencies, login_wall),
+            'ok': statuses.count(200),
+            'throttled': sum(status in (429, 503) for status in statuses),
+            'errors': sum(status >= 400 and status not in (429, 503) for status in statuses),
+        }
+
+    from blueprints.auth import password_hasher
+    from metrics import USER_LOADS
+    results['auth'] = {
+        'bcrypt': password_hasher.stats(),
+        'user_loads': {source: USER_LOADS.value(source=source) for source in ('session', 'cache', 'db')},
+    }
+    results['prefetch'] = rec.page_prefetcher.stats() # Hit rate of the next-page prefetcher over the run
+    stub.shutdown()
+    params = {**vars(args), 'boot_seconds': round(boot_seconds, 3), 'tmdb_stub_requests': stub_stats['requests']}
+    params.pop('out', None)
+    params.pop('baseline', None)
+    report = write_report('endpoints', results, args.out, params)
+    return finish(report, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
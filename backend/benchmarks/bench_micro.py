@@ -0,0 +1,91 @@
+# benchmarks/bench_micro.py
+"""Micro-benchmarks of the per-request hot path, isolated from Flask and the database.
+
+Times SVD scoring, content scoring, top-N selection, candidate generation and
+response assembly on the loaded recommender assets, for several history sizes.
+
+    cd backend
+    python benchmarks/bench_micro.py --repeat 200 --out micro.json
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from common import add_report_arguments, finish, time_calls, write_report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history-sizes', type=int, nargs='+', default=[5, 50, 500])
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=7)
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+
+    from tmdb_stub import start_stub_server
+
+    workdir = tempfile.mkdtemp(prefix='moviescout-micro-')
+    stub, stub_url, _ = start_stub_server()
+    os.environ.update({
+        'TMDB_API_KEY': 'bench',
+        'TMDB_IMAGES_BASE_URL': stub_url,
+        'TMDB_IMAGE_CDN_BASE_URL': 'https://image.tmdb.invalid/t/p/w500',
+        'POSTER_CACHE_PATH': os.path.join(workdir, 'posters.sqlite3'),
+    })
+    import blueprints.recommendations as rec
+    from ranking import exclusion_mask, top_n_indices
+    from user_state import UserState
+
+    rec.load_recommender_assets()
+    model = rec.current_model()
+    rng = np.random.default_rng(args.seed)
+    n_movies = len(model.movie_ids_list)
+    results = {}
+
+    user_bias = 0.1
+    user_factors = rng.normal(0, 0.1, model.svd_scorer.n_factors)
+    results['svd_scores'] = time_calls(lambda: model.svd_scorer.score_factors(user_bias, user_factors), args.repeat)
+
+    for size in args.history_sizes:
+        history = rng.choice(model.movie_ids_list, size, replace=False).tolist()
+        liked = history[: (size + 1) // 2]
+        scores = rng.random(n_movies)
+        results[f'content_scores/liked_{len(liked)}'] = time_calls(
+            lambda: rec.get_content_scores(liked), args.repeat
+        )
+        results[f'top_n/history_{size}'] = time_calls(
+            lambda: top_n_indices(
+                scores, model.recommendation_top_n, exclusion_mask(history, model.movie_id_index, n_movies)
+            ),
+            args.repeat,
+        )
+        # Candidate generation plus the blend over the candidates, as POST /recommend runs it
+        state = UserState(0, [(movie_id, 5.0) for movie_id in liked], (len(liked), None),
+                          model.content_index, model.movie_id_to_index_map)
+        state.svd_factors = (user_bias, user_factors)
+        state.svd_scores = model.svd_scorer.score_factors(user_bias, user_factors)
+        seeds = liked[-5:][::-1]
+        results[f'candidates/liked_{len(liked)}'] = time_calls(
+            lambda: rec.rank_movies(state, seeds, state.content_scores), args.repeat
+        )
+
+    # Response assembly: cold (every poster is a cache miss) then warm (served from the tables)
+    recommended = rng.choice(model.movie_ids_list, model.recommendation_top_n * args.repeat, replace=False).tolist()
+    pages = iter([recommended[i:i + model.recommendation_top_n] for i in range(0, len(recommended), model.recommendation_top_n)])
+    results['metadata_assembly/cold_posters'] = time_calls(
+        lambda: rec.build_recommendation_records(next(pages)), args.repeat - 3, warmup=3
+    )
+    page = recommended[:model.recommendation_top_n]
+    results['metadata_assembly/warm'] = time_calls(lambda: rec.build_recommendation_records(page), args.repeat)
+
+    stub.shutdown()
+    params = {k: v for k, v in vars(args).items() if k not in ('out', 'baseline')}
+    report = write_report('micro', results, args.out, params)
+    return finish(report, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
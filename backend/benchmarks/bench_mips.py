@@ -0,0 +1,95 @@
+# benchmarks/bench_mips.py
+"""Recall@K and latency of the MIPS index against exhaustive SVD scoring.
+
+Queries are the trained model's user vectors. Recall@K is the share of the
+exhaustive top K (score_factors over the whole catalog) that is still in the top
+K after re-scoring only the index's candidates exactly, as the routes do.
+
+    cd backend
+    python benchmarks/bench_mips.py --nprobe 4 8 16 32 --k 10 --out mips.json
+    python benchmarks/bench_mips.py --synthetic 60000 --factors 100 --pq 0 26   # ml-25m sized random catalog
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from common import add_report_arguments, finish, time_calls, write_report
+
+
+def synthetic_scorer(n_movies, n_factors, n_users, rng):
+    """Random SVD model of the given size, for catalogs larger than the local dataset."""
+    from svd_scoring import SVDScorer
+    return SVDScorer(
+        global_mean=3.5,
+        bu=rng.normal(0, 0.3, n_users),
+        bi=rng.normal(0, 0.3, n_movies),
+        pu=rng.normal(0, 0.1, (n_users, n_factors)),
+        qi=rng.normal(0, 0.1, (n_movies, n_factors)),
+        user_raw_ids=np.arange(n_users),
+        rating_scale=(0.5, 5.0),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16, 32])
+    parser.add_argument('--lists', type=int, help='IVF lists (default sqrt(catalog size))')
+    parser.add_argument('--pq', type=int, nargs='+', default=[0], help='PQ bytes per movie, 0 = exact vectors')
+    parser.add_argument('--candidates', type=int, default=300)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--synthetic', type=int, help='use a random catalog of this many movies')
+    parser.add_argument('--factors', type=int, default=100, help='factors of the synthetic model')
+    parser.add_argument('--seed', type=int, default=7)
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+
+    from mips_index import MIPSIndex
+    from ranking import top_n_indices
+
+    rng = np.random.default_rng(args.seed)
+    if args.synthetic:
+        scorer = synthetic_scorer(args.synthetic, args.factors, args.queries, rng)
+    else:
+        import blueprints.recommendations as rec
+        rec.load_recommender_assets()
+        scorer = rec.current_model().svd_scorer
+
+    users = rng.choice(len(scorer.pu), min(args.queries, len(scorer.pu)), replace=False)
+    queries = [(scorer.bu[u], scorer.pu[u]) for u in users]
+    exact_top = [set(top_n_indices(scorer.score_factors(bias, factors), args.k).tolist()) for bias, factors in queries]
+
+    results = {}
+    calls = iter(range(10 ** 9))
+
+    def exhaustive():
+        bias, factors = queries[next(calls) % len(queries)]
+        top_n_indices(scorer.score_factors(bias, factors), args.k)
+
+    results['exhaustive'] = time_calls(exhaustive, len(queries))
+
+    for pq in args.pq:
+        index = MIPSIndex.build(scorer, n_lists=args.lists, pq_subspaces=pq, seed=args.seed)
+        for nprobe in args.nprobe:
+            def retrieve(query_idx):
+                bias, factors = queries[query_idx]
+                candidates = np.sort(index.search(MIPSIndex.query_vector(factors), args.candidates, nprobe))
+                return candidates[top_n_indices(scorer.score_factors(bias, factors, candidates), args.k)]
+
+            recall = np.mean([
+                len(exact_top[q] & set(retrieve(q).tolist())) / args.k for q in range(len(queries))
+            ])
+            name = f"ivf{index.n_lists}{f'_pq{pq}' if pq else ''}/nprobe_{nprobe}"
+            results[name] = time_calls(lambda: retrieve(next(calls) % len(queries)), len(queries))
+            results[name][f'recall_at_{args.k}'] = round(float(recall), 4)
+            results[name]['scanned_fraction'] = round(min(1.0, nprobe / index.n_lists), 4)
+
+    params = {k: v for k, v in vars(args).items() if k not in ('out', 'baseline')}
+    params.update({'n_movies': len(scorer.bi), 'n_factors': scorer.n_factors})
+    report = write_report('mips', results, args.out, params)
+    return finish(report, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
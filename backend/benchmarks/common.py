@@ -0,0 +1,109 @@
+# benchmarks/common.py
+"""Shared helpers for the benchmark scripts: timing, percentiles, RSS and JSON reports."""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR) # Backend modules are imported by name, like app.py does
+
+
+def summarize(latencies_s, wall_s=None):
+    """p50/p95/p99/mean in milliseconds plus throughput for a list of per-call latencies."""
+    if not latencies_s:
+        return {'count': 0}
+    ordered = sorted(latencies_s)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    wall_s = wall_s if wall_s is not None else sum(latencies_s)
+    return {
+        'count': len(ordered),
+        'p50_ms': round(pct(50), 3),
+        'p95_ms': round(pct(95), 3),
+        'p99_ms': round(pct(99), 3),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'throughput_per_s': round(len(ordered) / wall_s, 1) if wall_s > 0 else None,
+    }
+
+
+def time_calls(fn, repeat, warmup=3):
+    """Calls fn() repeatedly and returns summarize() of the individual call times."""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        call_start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(usage / 1024 / (1024 if sys.platform == 'darwin' else 1), 1) # bytes on macOS, KiB on Linux
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(suite, results, out_path=None, params=None):
+    """Prints (or writes) a JSON report: {"suite", "git_rev", "python", "params", "peak_rss_mb", "results"}."""
+    report = {
+        'suite': suite,
+        'git_rev': git_revision(),
+        'python': platform.python_version(),
+        'params': params or {},
+        'peak_rss_mb': peak_rss_mb(),
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if out_path:
+        with open(out_path, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    return report
+
+
+def compare_to_baseline(report, baseline_path, tolerance, metric='p95_ms'):
+    """Returns the names of results whose `metric` got worse than baseline * (1 + tolerance)."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    for name, result in report['results'].items():
+        before = baseline.get(name, {}).get(metric)
+        after = result.get(metric)
+        if before and after and after > before * (1 + tolerance):
+            regressions.append(f"{name}: {metric} {before} -> {after}")
+    return regressions
+
+
+def add_report_arguments(parser):
+    parser.add_argument('--out', help='write the JSON report to this file as well as stdout')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against; exits 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 slowdown vs the baseline')
+
+
+def finish(report, args):
+    """Applies --baseline / --tolerance and returns the process exit code."""
+    if not args.baseline:
+        return 0
+    regressions = compare_to_baseline(report, args.baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
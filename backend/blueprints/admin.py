@@ -0,0 +1,57 @@
+# blueprints/admin.py
+from flask import Blueprint, request, jsonify
+import hmac
+import os
+from blueprints.recommendations import model_registry, page_prefetcher
+
+admin_bp = Blueprint('admin_bp', __name__)
+
+# Admin endpoints are off unless ADMIN_TOKEN is set; callers send it in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+
+@admin_bp.before_request
+def require_admin_token():
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Not found."}), 404
+    token = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        return jsonify({"error": "Invalid admin token."}), 403
+
+
+@admin_bp.route('/admin/model', methods=['GET'])
+def model_status():
+    """Serving model version, the versions kept for rollback and the last reload's outcome (this worker)."""
+    return jsonify(model_registry.status())
+
+
+@admin_bp.route('/admin/model/reload', methods=['POST'])
+def reload_model():
+    """Loads the artifacts on disk in the background and swaps them in once they validate.
+
+    ?wait=1 blocks until the reload finished and reports its outcome. Only this
+    worker reloads; set MODEL_WATCH_INTERVAL to have every worker follow the files.
+    """
+    if request.args.get('wait') == '1':
+        try:
+            model_registry.reload()
+        except Exception as e:
+            return jsonify({"error": f"Reload failed, the previous model keeps serving: {e}", **model_registry.status()}), 422
+        return jsonify(model_registry.status())
+
+    started = model_registry.reload_in_background()
+    return jsonify({"started": started, **model_registry.status()}), 202
+
+
+@admin_bp.route('/admin/model/rollback', methods=['POST'])
+def rollback_model():
+    """Serves the previous model again, without reloading anything from disk."""
+    if model_registry.rollback() is None:
+        return jsonify({"error": "No previous model to roll back to.", **model_registry.status()}), 409
+    return jsonify(model_registry.status())
+
+
+@admin_bp.route('/admin/prefetch/stats', methods=['GET'])
+def prefetch_stats():
+    """Queue depth, hit rate and staleness of the next-page prefetcher in this worker."""
+    return jsonify(page_prefetcher.stats())
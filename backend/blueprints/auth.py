@@ -1,12 +1,39 @@
 # blueprints/auth.py
 from flask import Blueprint, request, jsonify, session, render_template, redirect, url_for, flash
+import os
 from extensions import db, login_manager # Import shared extensions
-from models import User # Import shared User model
+from models import User, user_cache, SESSION_IDENTITY # Import shared User model
 from flask_login import login_user, logout_user, login_required, current_user
-import bcrypt
+from metrics import LOGIN_THROTTLED, Gauge, stage
+from passwords import PasswordHasher, PasswordHasherBusy, BCRYPT_MAX_PENDING, BCRYPT_TIMEOUT, BCRYPT_WORKERS
+from user_cache import SESSION_IDENTITY_KEY, store_session_identity
 
 auth_bp = Blueprint('auth_bp', __name__)
 
+# bcrypt runs on its own bounded pool (see passwords.py); BCRYPT_WORKERS=0 hashes on the request thread
+password_hasher = PasswordHasher(
+    max_workers=int(os.environ.get('BCRYPT_WORKERS', BCRYPT_WORKERS)),
+    max_pending=int(os.environ.get('BCRYPT_MAX_PENDING', BCRYPT_MAX_PENDING)),
+    timeout=float(os.environ.get('BCRYPT_TIMEOUT', BCRYPT_TIMEOUT)),
+)
+
+Gauge('moviescout_bcrypt_pending', 'Password checks running or queued on the bcrypt pool.',
+      function=lambda: password_hasher.stats()['pending'])
+Gauge('moviescout_user_cache_size', 'Logged-in users cached by the user loader.', function=lambda: len(user_cache))
+
+
+def _throttled(reason):
+    LOGIN_THROTTLED.inc(reason=reason)
+    if reason == 'busy':
+        return jsonify({"error": "Too many login attempts right now, please try again in a moment."}), 429, {"Retry-After": "1"}
+    return jsonify({"error": "Login is taking too long right now, please try again."}), 503, {"Retry-After": "2"}
+
+
+def _log_in(user):
+    login_user(user)
+    if SESSION_IDENTITY:
+        store_session_identity(session, user)
+
 @auth_bp.route('/login', methods=['GET'])
 def show_login():
     return jsonify({"message": "Please log in"}), 401 
@@ -30,18 +57,23 @@ def signup():
     if User.query.filter_by(username=username).first():
         return jsonify({"error": "Username already exists. Please choose a different one."}), 409
 
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
+    try:
+        with stage('bcrypt'):
+            hashed_password = password_hasher.hash(password)
+    except PasswordHasherBusy:
+        return _throttled('busy')
+    except TimeoutError:
+        return _throttled('timeout')
     
     new_user = User(
         username=username,
-        password=hashed_password.decode('utf-8'),
+        password=hashed_password,
     )
     
     try:
         db.session.add(new_user)
         db.session.commit()
-        login_user(new_user) # Log the user in after signup
+        _log_in(new_user) # Log the user in after signup
         return jsonify({"message": "Sign Up successful!", "user_id": new_user.id, "username": new_user.username}), 201
     except Exception as e:
         db.session.rollback()
@@ -58,9 +90,16 @@ def login():
         return jsonify({"error": "Username and password are required."}), 400
     
     user = User.query.filter_by(username=username).first()
+    try:
+        with stage('bcrypt'):
+            password_ok = bool(user) and password_hasher.check(password, user.password)
+    except PasswordHasherBusy:
+        return _throttled('busy')
+    except TimeoutError:
+        return _throttled('timeout')
 
-    if user and bcrypt.checkpw(password.encode('utf-8'), user.password.encode('utf-8')):
-        login_user(user) # Log the user in
+    if password_ok:
+        _log_in(user) # Log the user in
         return jsonify({"message": "Login successful!", "user_id": user.id, "username": user.username}), 200
     else:
         return jsonify({"error": "Invalid username or password."}), 400
@@ -68,6 +107,8 @@ def login():
 @auth_bp.route('/logout', methods=['POST'])
 @login_required
 def logout():
+    user_cache.invalidate(current_user.id)
+    session.pop(SESSION_IDENTITY_KEY, None)
     logout_user()
     return jsonify({"message":"logged out successfully"}), 200
 
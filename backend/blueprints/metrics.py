@@ -0,0 +1,30 @@
+# blueprints/metrics.py
+from flask import Blueprint, Response, request, jsonify
+import hmac
+import os
+from metrics import render_metrics
+
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+# /metrics shows per-worker internals (prefetch hit rate, queue depths...), so it is off unless METRICS_TOKEN
+# (or ADMIN_TOKEN) is set. Prometheus sends it as `Authorization: Bearer <token>` (scrape config
+# `authorization: {credentials: ...}`); X-Admin-Token works too, like the admin endpoints.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or os.environ.get('ADMIN_TOKEN')
+
+
+@metrics_bp.before_request
+def require_metrics_token():
+    if not METRICS_TOKEN:
+        return jsonify({"error": "Not found."}), 404
+    token = request.headers.get('X-Admin-Token', '')
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        token = authorization[len('Bearer '):]
+    if not hmac.compare_digest(token.encode('utf-8'), METRICS_TOKEN.encode('utf-8')):
+        return jsonify({"error": "Invalid metrics token."}), 403
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint for this worker's metrics."""
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
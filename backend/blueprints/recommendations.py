@@ -1,28 +1,49 @@
 # blueprints/recommendations.py
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, g, has_app_context, request, jsonify
 from extensions import db # Import shared db instance
-from models import UserInteraction # Import shared models
+from models import UserInteraction, UserFactors, MaterializedRecommendation # Import shared models
 from flask_login import login_required, current_user # For accessing logged-in user
 import os
 import time
+import hashlib
 import pandas as pd
-import requests
 import numpy as np
 import joblib
 from datetime import datetime
+from functools import partial
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from svd_scoring import SVDScorer
+from content_index import ContentIndex
+from artifacts import open_bundle, MANIFEST_NAME
+from ranking import blend_scores, build_id_index, exclusion_mask, top_n_indices
+from metadata import MovieMetadata
+from mips_index import MIPSIndex, MIPS_NPROBE
+from model_registry import ArtifactWatcher, ModelRegistry, ModelSnapshot, MODEL_HISTORY, MODEL_WATCH_INTERVAL
+from candidates import (CANDIDATE_QUOTAS, CONTENT_SEEDS, PopularityIndex, content_neighbor_candidates,
+                        load_popularity, merge_candidates, movie_genres)
+from posters import PosterCache, PosterResolver
+from metrics import (ASSET_LOAD_SECONDS, ASSET_LOADS, FALLBACKS, MATERIALIZED, MODEL_RELOAD_FAILURES, MODEL_SWAPS,
+                     USER_STATE_CACHE, Gauge, stage)
+from batch_scoring import (ScoringBatcher, SCORING_BATCH_WINDOW_MS, SCORING_MAX_BATCH, SCORING_MAX_QUEUE,
+                           SCORING_TIMEOUT)
+from prefetch import (PagePrefetcher, PREFETCH_MAX_MISSED_SWIPES, PREFETCH_MAX_QUEUE, PREFETCH_TTL,
+                      PREFETCH_WORKERS)
+from user_state import UserState, UserStateCache, USER_STATE_CACHE_SIZE, LIKE_RATING, content_seed_movie_ids
 recommendations_bp = Blueprint('recommendations_bp', __name__)
 
-# --- Model Loading and Global Variables ---
-# Global variables to hold loaded models and data
-svd_model = None
-
-content_sim_matrix = None
-movies_data_df = None
-movie_ids_list = None
-movie_id_to_index_map = None
-blending_alpha = None
-recommendation_top_n = None
-movie_popularity_counts = None # For initial recommendations
+# --- Model Loading ---
+# The loaded models and data live in one immutable ModelSnapshot (see model_registry.py) that a reload
+# replaces as a whole. Read it through current_model():
+#   svd_scorer             vectorized SVD model aligned with movie_ids_list
+#   content_index          sparse content similarity (see content_index.py)
+#   movie_metadata         combined_data indexed by movieId for response assembly
+#   movie_id_index         dense movieId -> position array for vectorized exclusion masks
+#   mips_index             approximate SVD retrieval for large catalogs (see mips_index.py), or None
+#   popularity_index       most rated movies overall and per genre (see candidates.py)
+#   version                identifies the SVD model, content index and blend weight (see materialize.py)
 
 # Paths to your saved model components
 current_file_dir = os.path.dirname(os.path.abspath(__file__))
@@ -35,34 +56,185 @@ TRAINED_MODELS_DIR = os.path.join(MODELS_DIR, 'trained_models')
 
 LINKS_DATASET_PATH = os.path.join(DATASET_DIR, 'links.csv')
 SVD_MODEL_PATH = os.path.join(TRAINED_MODELS_DIR, 'trained_svd.joblib')
-CONTENT_SIM_PATH = os.path.join(TRAINED_MODELS_DIR, 'trained_content_model.npy')
+CONTENT_SIM_PATH = os.path.join(TRAINED_MODELS_DIR, 'trained_content_model.npy') # Legacy dense N x N export
+CONTENT_INDEX_PATH = os.path.join(TRAINED_MODELS_DIR, 'trained_content_index.npz')
 MOVIES_DATA_PATH = os.path.join(DATASET_DIR, 'movies.csv')
 MAPPING_DATA_PATH = os.path.join(TRAINED_MODELS_DIR, 'recommender_mappings.joblib')
 COMBINED_DATA_PATH = os.path.join(DATASET_DIR, 'combined_data.csv')
 POPULAR_MOVIES_DATA_PATH = os.path.join(DATASET_DIR, 'popular_movies.csv')
+RATINGS_DATASET_PATH = os.path.join(DATASET_DIR, 'ratings.csv')
+POPULARITY_PATH = os.path.join(TRAINED_MODELS_DIR, 'trained_popularity.npy') # Ratings per movie, written by train.py
+# Memory-mapped artifact bundle (see artifacts.py); used instead of the files above when present
+MODEL_BUNDLE_DIR = os.environ.get('MODEL_BUNDLE_DIR') or os.path.join(TRAINED_MODELS_DIR, 'bundle')
+# Approximate MIPS index over the SVD item vectors, built offline with `python mips_index.py build`
+MIPS_INDEX_PATH = os.environ.get('MIPS_INDEX_PATH') or os.path.join(TRAINED_MODELS_DIR, 'trained_mips_index.npz')
+# Lists scanned per query (MIPS_NPROBE, default mips_index.MIPS_NPROBE, at least 1): higher = better recall, slower
+SERVING_MIPS_NPROBE = max(1, int(os.environ.get('MIPS_NPROBE', MIPS_NPROBE)))
+# Below this catalog size scoring every movie is already well under a millisecond
+MIPS_MIN_CATALOG = int(os.environ.get('MIPS_MIN_CATALOG', 20000))
+# Movies each candidate source contributes to the blend (CANDIDATES_CF, CANDIDATES_CONTENT, CANDIDATES_POPULAR,
+# defaults in candidates.CANDIDATE_QUOTAS)
+SERVING_CANDIDATE_QUOTAS = {
+    source: int(os.environ.get(f'CANDIDATES_{source.upper()}', quota)) for source, quota in CANDIDATE_QUOTAS.items()
+}
 DEFAULT_POSTER_URL = "https://critics.io/img/movies/poster-placeholder.png"
 
+# Concurrent requests score the SVD model together (see batch_scoring.py); SCORING_BATCH_WINDOW_MS=0 turns it off
+scoring_batcher = ScoringBatcher(
+    window_ms=float(os.environ.get('SCORING_BATCH_WINDOW_MS', SCORING_BATCH_WINDOW_MS)),
+    max_batch=int(os.environ.get('SCORING_MAX_BATCH', SCORING_MAX_BATCH)),
+    max_queue=int(os.environ.get('SCORING_MAX_QUEUE', SCORING_MAX_QUEUE)),
+    timeout=float(os.environ.get('SCORING_TIMEOUT', SCORING_TIMEOUT)),
+)
+
+# Per-user recommendation state kept between requests (see user_state.py)
+user_state_cache = UserStateCache(int(os.environ.get('USER_STATE_CACHE_SIZE', USER_STATE_CACHE_SIZE)))
+# Check each cached state against the DB with one aggregate query, needed when several workers serve a user
+USER_STATE_VALIDATE = os.environ.get('USER_STATE_VALIDATE', '1') != '0'
+
+
+def load_legacy_assets():
+    """Loads the joblib / npy / csv artifacts written by model_training.ipynb."""
+    svd_model = joblib.load(SVD_MODEL_PATH)
+    if os.path.exists(CONTENT_INDEX_PATH):
+        content_index = ContentIndex.load(CONTENT_INDEX_PATH)
+    else:
+        # Older exports only have the dense matrix; memory-map it instead of reading it all in
+        print(f"{CONTENT_INDEX_PATH} not found, falling back to the dense {CONTENT_SIM_PATH}. Re-run the notebook export to save memory.")
+        content_index = ContentIndex.from_dense(np.load(CONTENT_SIM_PATH, mmap_mode='r'))
+    mapping_data = joblib.load(MAPPING_DATA_PATH)
+    movie_ids_list = mapping_data['Movie_ids']
+    popular_movies_data = pd.read_csv(POPULAR_MOVIES_DATA_PATH)
+    return {
+        'artifact_version': None,
+        'svd_model': svd_model,
+        'svd_scorer': SVDScorer.from_surprise(svd_model, movie_ids_list),
+        'content_index': content_index,
+        'movies_data_df': pd.read_csv(MOVIES_DATA_PATH),
+        'combined_data': pd.read_csv(COMBINED_DATA_PATH),
+        'popular_movies_data': popular_movies_data,
+        'popularity': load_popularity(POPULARITY_PATH, RATINGS_DATASET_PATH, popular_movies_data, build_id_index(movie_ids_list)),
+        'movie_ids_list': movie_ids_list,
+        'movie_id_to_index_map': mapping_data['Movie_id_to_idx'],
+        'blending_alpha': mapping_data['ALPHA'],
+        'recommendation_top_n': mapping_data['TOP_N'],
+    }
+
+
+def load_bundle_assets(bundle_dir):
+    """Opens a memory-mapped artifact bundle; all workers share its pages through the OS cache."""
+    bundle = open_bundle(bundle_dir)
+    movie_ids_list = bundle.arrays['movie_ids'].tolist()
+    combined_data = bundle.combined_data()
+    return {
+        'artifact_version': bundle.version,
+        'svd_model': None, # Not needed, svd_scorer reads the factors straight from the bundle
+        'svd_scorer': bundle.svd_scorer(),
+        'content_index': bundle.content_index(),
+        'movies_data_df': combined_data[['movieId', 'title']],
+        'combined_data': combined_data,
+        'popular_movies_data': bundle.popular_movies_data(),
+        'popularity': bundle.popularity(),
+        'movie_ids_list': movie_ids_list,
+        'movie_id_to_index_map': {movie_id: idx for idx, movie_id in enumerate(movie_ids_list)},
+        'blending_alpha': bundle.manifest['blending_alpha'],
+        'recommendation_top_n': bundle.manifest['recommendation_top_n'],
+    }
+
+
+def load_model_snapshot():
+    """Loads all pre-trained model components and data into a new ModelSnapshot (validated by the registry)."""
+    print("Loading recommender assets...")
+    start = time.perf_counter()
+    if os.path.exists(os.path.join(MODEL_BUNDLE_DIR, MANIFEST_NAME)):
+        assets = load_bundle_assets(MODEL_BUNDLE_DIR)
+        source, path = 'bundle', MODEL_BUNDLE_DIR
+    else:
+        assets = load_legacy_assets()
+        source, path = 'legacy', TRAINED_MODELS_DIR
+
+    svd_scorer = assets['svd_scorer']
+    content_index = assets['content_index']
+    combined_data = assets['combined_data']
+    movie_ids_list = assets['movie_ids_list']
+    movie_id_index = build_id_index(movie_ids_list)
+    popularity = assets['popularity']
+    if popularity is None: # Bundle exported before popularity was added
+        popularity = load_popularity(POPULARITY_PATH, RATINGS_DATASET_PATH, assets['popular_movies_data'], movie_id_index)
+    catalog_content = combined_data.set_index('movieId')['content'].reindex(movie_ids_list).fillna('')
+    snapshot = ModelSnapshot(
+        version=compute_recommender_version(svd_scorer, content_index, assets['blending_alpha']),
+        artifact_version=assets['artifact_version'],
+        source=source,
+        path=path,
+        loaded_at=datetime.now(),
+        svd_model=assets['svd_model'],
+        svd_scorer=svd_scorer,
+        content_index=content_index,
+        movies_data_df=assets['movies_data_df'],
+        combined_data=combined_data,
+        movie_metadata=MovieMetadata.from_dataframe(combined_data),
+        popular_movies_data=assets['popular_movies_data'],
+        movie_ids_list=movie_ids_list,
+        movie_id_to_index_map=assets['movie_id_to_index_map'],
+        movie_id_index=movie_id_index,
+        mips_index=load_mips_index(svd_scorer, len(movie_ids_list)),
+        popularity_index=PopularityIndex.build(popularity, [movie_genres(content) for content in catalog_content]),
+        blending_alpha=assets['blending_alpha'],
+        recommendation_top_n=assets['recommendation_top_n'],
+    )
+    ASSET_LOAD_SECONDS.set(time.perf_counter() - start, source=source)
+    ASSET_LOADS.inc(source=source)
+    print(f"Recommender assets loaded successfully from {source} {path} in {time.perf_counter() - start:.2f}s!")
+    return snapshot
+
+
+def artifact_fingerprint():
+    """Modification times of the files load_model_snapshot() reads; None when there is nothing to load."""
+    paths = [os.path.join(MODEL_BUNDLE_DIR, MANIFEST_NAME)]
+    if not os.path.exists(paths[0]):
+        paths = [SVD_MODEL_PATH, MAPPING_DATA_PATH, CONTENT_INDEX_PATH, COMBINED_DATA_PATH]
+        if not os.path.exists(SVD_MODEL_PATH):
+            return None
+    paths += [POPULARITY_PATH, MIPS_INDEX_PATH]
+    return tuple((path, os.stat(path).st_mtime_ns if os.path.exists(path) else None) for path in paths)
+
+
+# Keeps the serving model and the MODEL_HISTORY before it; reloaded by the admin endpoints
+# (blueprints/admin.py) or, with MODEL_WATCH_INTERVAL > 0, when the artifact files change
+model_registry = ModelRegistry(
+    load_model_snapshot, history=int(os.environ.get('MODEL_HISTORY', MODEL_HISTORY)),
+    on_failure=lambda error: MODEL_RELOAD_FAILURES.inc(),
+)
+model_watcher = ArtifactWatcher(
+    model_registry, artifact_fingerprint, interval=float(os.environ.get('MODEL_WATCH_INTERVAL', MODEL_WATCH_INTERVAL)),
+)
+
+
+def current_model():
+    """The ModelSnapshot to rank with.
+
+    Pinned on the app context (flask.g) on first use, so a request or prefetch
+    job that started before a reload finishes with the model it started with.
+    """
+    if not has_app_context():
+        return model_registry.current
+    model = g.get('model')
+    if model is None:
+        model = g.model = model_registry.current
+        model_watcher.start() # No-op once this worker's watcher runs (or when it is turned off)
+    return model
+
+
+@model_registry.on_swap
+def count_model_swap(old, new, kind):
+    MODEL_SWAPS.inc(kind=kind)
+
 
 def load_recommender_assets():
-    """Loads all pre-trained model components and data into global variables."""
-    global svd_model, tfidf_vectorizer, content_sim_matrix, movies_data_df, combined_data, \
-           movie_ids_list, movie_id_to_index_map, blending_alpha, popular_movies_data, \
-           recommendation_top_n
-
+    """Loads the recommender model at startup and makes it the serving snapshot."""
     try:
-        print("Loading recommender assets...")
-        svd_model = joblib.load(SVD_MODEL_PATH)
-        content_sim_matrix = np.load(CONTENT_SIM_PATH)
-        movies_data_df = pd.read_csv(MOVIES_DATA_PATH)
-        mapping_data = joblib.load(MAPPING_DATA_PATH)
-        combined_data = pd.read_csv(COMBINED_DATA_PATH)
-        popular_movies_data = pd.read_csv(POPULAR_MOVIES_DATA_PATH)
-
-        movie_ids_list = mapping_data['Movie_ids']
-        movie_id_to_index_map = mapping_data['Movie_id_to_idx']
-        blending_alpha = mapping_data['ALPHA']
-        recommendation_top_n = mapping_data['TOP_N']
-        print("Recommender assets loaded successfully!")
+        model_registry.reload()
     except FileNotFoundError as e:
         print(f"Error loading model assets: {e}")
         print("Please ensure you have run your training script to create the 'trained_models' directory and its contents.")
@@ -73,177 +245,504 @@ def load_recommender_assets():
         raise RuntimeError("Failed to load recommender assets.") from e
     
 
+def compute_recommender_version(scorer, content, alpha):
+    """Short digest of everything the hybrid ranking depends on; stamps materialized recommendations."""
+    parts = [scorer.version, content.version, alpha]
+    return hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+
+
+def load_mips_index(scorer, n_movies):
+    """Loads the MIPS index when the catalog is large enough to need it and it matches the SVD model."""
+    if n_movies < MIPS_MIN_CATALOG or not os.path.exists(MIPS_INDEX_PATH):
+        return None
+    index = MIPSIndex.load(MIPS_INDEX_PATH)
+    # Movies appended since the build are unknown to the model (same version) and simply not indexed
+    if index.model_version != scorer.version or len(index) > n_movies:
+        print(f"{MIPS_INDEX_PATH} was built for a different model, scoring the full catalog. Rebuild it with mips_index.py build.")
+        return None
+    print(f"Loaded MIPS index with {index.n_lists} lists "
+          f"(nprobe={SERVING_MIPS_NPROBE}, candidates={SERVING_CANDIDATE_QUOTAS['cf']})")
+    return index
+
+
 def get_svd_scores(user_id):
-    """Calculates SVD-based prediction scores for all movies for a given user."""
-    scores = np.zeros(len(movie_ids_list))
-    for idx, movie_id in enumerate(movie_ids_list):
+    """Calculates SVD-based prediction scores for all movies for a given app user.
+
+    App users are not MovieLens training users, so their bias and factors come from
+    the folded-in UserFactors row rather than from the trained model's user ids.
+    """
+    svd_scorer = current_model().svd_scorer
+    user_factors = load_user_factors(user_id)
+    if user_factors is None:
+        FALLBACKS.inc(path='svd_unknown_user')
+        return svd_scorer.unknown_user_scores.copy() # No usable ratings yet, same as an unknown SVD user
+    with stage('svd_scores'):
+        return svd_scorer.score_factors(user_factors.bias, np.frombuffer(user_factors.factors, dtype=np.float64))
+
+
+def _solve_user_factors(svd_scorer, user_factors, gram, rhs):
+    bias, factors = svd_scorer.fold_in_solve(gram, rhs)
+    user_factors.bias = bias
+    user_factors.factors = factors.tobytes()
+    user_factors.gram = gram.tobytes()
+    user_factors.rhs = rhs.tobytes()
+
+
+def lock_user_factors(user_id):
+    """Returns the user's UserFactors row locked until the transaction ends, creating it the first time.
+
+    Swipe batches read the stored normal equations, update them and write them
+    back; state.lock only orders that within one worker, so two workers taking
+    batches of the same user would otherwise drop one batch's ratings. The row is
+    locked with SELECT ... FOR UPDATE (PostgreSQL); SQLite has no row locks, but
+    the upsert below already takes its database-wide write lock. A new row is an
+    empty placeholder (no model_version) inserted with ON CONFLICT DO NOTHING, so
+    two first fold-ins cannot collide, and is filled by rebuild_user_factors().
+    """
+    row = {'user_id': int(user_id), 'model_version': '', 'bias': 0.0, 'factors': b'', 'gram': b'', 'rhs': b'',
+           'n_ratings': 0}
+    upsert = _UPSERT_BY_DIALECT.get(db.session.get_bind().dialect.name)
+    if upsert is not None:
+        db.session.execute(upsert(UserFactors).values(row).on_conflict_do_nothing(index_elements=['user_id']))
+    elif db.session.get(UserFactors, user_id) is None:
         try:
-            # Attempt to convert user_id to int for SVD if possible, otherwise SVD will handle cold-start
-            user_id_for_svd = int(user_id) # SVD expects integer user IDs
-        except ValueError:
-            user_id_for_svd = user_id # Keep as string if it's a UUID, SVD will treat as cold-start
-
-        scores[idx] = svd_model.predict(user_id_for_svd, movie_id).est
-    return scores
-
-def get_content_scores(user_liked_movie_ids):
-    """Calculates content-based similarity scores for all movies based on user's liked movies."""
-    scores = np.zeros(len(movie_ids_list))
-    valid_liked_count = 0
-    for liked_id in user_liked_movie_ids:
-        # movie_id_to_index_map and content_sim_matrix are loaded globally
-        if liked_id in movie_id_to_index_map:
-            idx = movie_id_to_index_map[liked_id]
-            scores += content_sim_matrix[idx]
-            valid_liked_count += 1
-    return scores / max(1, valid_liked_count) # Avoid division by zero
+            with db.session.begin_nested():
+                db.session.execute(UserFactors.__table__.insert(), [row])
+        except IntegrityError:
+            pass # Another worker created it first
+    return db.session.query(UserFactors).filter_by(user_id=user_id).with_for_update().populate_existing().one()
+
+
+def rebuild_user_factors(user_id):
+    """Folds a user into the SVD model from their full interaction history. Caller commits."""
+    model = current_model()
+    svd_scorer, movie_id_to_index_map = model.svd_scorer, model.movie_id_to_index_map
+    user_history = UserInteraction.query.filter_by(user_id=user_id).all()
+    indexed = [
+        (movie_id_to_index_map[interaction.movie_id], interaction.rating)
+        for interaction in user_history if interaction.movie_id in movie_id_to_index_map
+    ]
+    gram, rhs = svd_scorer.fold_in_history([idx for idx, _ in indexed], [rating for _, rating in indexed])
+
+    user_factors = lock_user_factors(user_id)
+    user_factors.model_version = svd_scorer.version
+    user_factors.n_ratings = len(user_history)
+    _solve_user_factors(svd_scorer, user_factors, gram, rhs)
+    return user_factors
+
+
+def update_user_factors(user_id, changes):
+    """Applies stored (movie_id, old_rating, new_rating) changes to the user's folded-in factors. Caller commits.
+
+    Each rating is a rank-1 update of the stored normal equations followed by one
+    small solve, so swipes personalize the SVD scores without retraining. A changed
+    rating first removes the old one (old_rating is None for new interactions).
+    The changes must have been read under lock_user_factors(), as
+    ingest_interactions() does; stored equations that do not add up to the
+    current interaction count are rebuilt instead of updated.
+    """
+    model = current_model()
+    svd_scorer, movie_id_to_index_map = model.svd_scorer, model.movie_id_to_index_map
+    user_factors = lock_user_factors(user_id)
+    if user_factors.model_version != svd_scorer.version:
+        # First fold-in, or the factors were solved against a different model: start from the history
+        return rebuild_user_factors(user_id)
+    n_new = sum(old_rating is None for _, old_rating, _ in changes)
+    if user_factors.n_ratings + n_new != UserInteraction.query.filter_by(user_id=user_id).count():
+        return rebuild_user_factors(user_id) # Some batch was not folded into these equations
+
+    size = svd_scorer.n_factors + 1
+    gram = np.frombuffer(user_factors.gram, dtype=np.float64).reshape(size, size).copy()
+    rhs = np.frombuffer(user_factors.rhs, dtype=np.float64).copy()
+    for movie_id, old_rating, new_rating in changes:
+        if movie_id not in movie_id_to_index_map:
+            continue
+        movie_idx = movie_id_to_index_map[movie_id]
+        if old_rating is not None:
+            svd_scorer.fold_in_add(gram, rhs, movie_idx, old_rating, weight=-1.0)
+        svd_scorer.fold_in_add(gram, rhs, movie_idx, new_rating)
+    user_factors.n_ratings += n_new
+    _solve_user_factors(svd_scorer, user_factors, gram, rhs)
+    return user_factors
+
+
+def load_user_factors(user_id):
+    """Returns the user's UserFactors, folding them in on first use; None if the user has no history."""
+    user_factors = db.session.get(UserFactors, user_id)
+    if user_factors is not None and user_factors.model_version == current_model().svd_scorer.version:
+        return user_factors
+    if not UserInteraction.query.filter_by(user_id=user_id).first():
+        return None
+    try:
+        user_factors = rebuild_user_factors(user_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error folding in SVD factors for user {user_id}: {e}")
+        return None
+    return user_factors
+
+def get_content_scores(user_liked_movie_ids, indices=None):
+    """Calculates content-based similarity scores for all movies (or the given catalog indices) based on user's liked movies."""
+    model = current_model()
+    liked_indices = [model.movie_id_to_index_map[liked_id] for liked_id in user_liked_movie_ids if liked_id in model.movie_id_to_index_map]
+    with stage('content_scores'):
+        return model.content_index.scores(liked_indices, indices)
 
 
  
-def save_interaction(user_id, movie_id, r):#save a new interaction in the database
-    
-    new_interaction = UserInteraction(
-        user_id=int(user_id),  # Ensure user_id is a string
-        movie_id=int(movie_id), # Ensure movie_id is an integer
-        rating=float(r),  # Ensure rating is a float
-        timestamp=datetime.now()
+_UPSERT_BY_DIALECT = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}
+
+def ingest_interactions(user_id, liked_movie_ids, disliked_movie_ids, history=None, now=None):
+    """Stores a batch of swipes in one statement and returns (history, changes). Caller commits.
+
+    `history` is the user's {movie_id: rating} map. When the caller already has it,
+    only the swiped ids are checked against the DB with one IN query; otherwise the
+    user's rows are read once, which also serves as the existence check. Rows that
+    are new or whose rating changed are written with a single bulk upsert on the
+    (user_id, movie_id) unique constraint, so resubmitting a batch is a no-op.
+    `changes` lists (movie_id, old_rating, new_rating) with old_rating None for new rows.
+    The old ratings are read under lock_user_factors(), so a batch of the same user
+    in another worker commits either before them or after this transaction.
+    """
+    swiped = {}
+    for movie_id in liked_movie_ids:
+        swiped[int(movie_id)] = 5.0
+    for movie_id in disliked_movie_ids:
+        swiped[int(movie_id)] = 1.0 # A dislike in the same batch wins, it was processed last before too
+    if swiped:
+        lock_user_factors(user_id)
+
+    rating_query = db.session.query(UserInteraction.movie_id, UserInteraction.rating).filter(
+        UserInteraction.user_id == user_id
     )
-    
-    db.session.add(new_interaction)
-    db.session.commit()
-    
-def generate_recommendations_from_user_history(user_id):
-    
-    user_history = UserInteraction.query.filter_by(user_id=user_id).order_by(UserInteraction.timestamp.desc()).all()
-    all_interacted_movie_ids = {interaction.movie_id for interaction in user_history}
+    if history is None:
+        history = dict(rating_query.all())
+    elif swiped:
+        history.update(rating_query.filter(UserInteraction.movie_id.in_(list(swiped))).all())
+
+    changes = [
+        (movie_id, history.get(movie_id), rating)
+        for movie_id, rating in swiped.items()
+        if history.get(movie_id) != rating
+    ]
+    if not changes:
+        return history, changes
 
-    liked_movies = [i.movie_id for i in user_history if i.rating == 5.0]
-    disliked_movies = [i.movie_id for i in user_history if i.rating == 1.0]
+    now = now or datetime.now()
+    rows = [
+        {'user_id': int(user_id), 'movie_id': movie_id, 'rating': rating, 'timestamp': now}
+        for movie_id, _, rating in changes
+    ]
+    upsert = _UPSERT_BY_DIALECT.get(db.session.get_bind().dialect.name)
+    if upsert is not None:
+        statement = upsert(UserInteraction).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id', 'movie_id'],
+            set_={'rating': statement.excluded.rating, 'timestamp': statement.excluded.timestamp},
+        )
+        db.session.execute(statement)
+    else:
+        new_rows = [row for row, (_, old_rating, _) in zip(rows, changes) if old_rating is None]
+        if new_rows:
+            db.session.execute(UserInteraction.__table__.insert(), new_rows)
+        for row, (_, old_rating, _) in zip(rows, changes):
+            if old_rating is not None:
+                UserInteraction.query.filter_by(user_id=row['user_id'], movie_id=row['movie_id']).update(
+                    {'rating': row['rating'], 'timestamp': now}
+                )
+
+    history.update((movie_id, rating) for movie_id, _, rating in changes)
+    return history, changes
+
+def history_stamp(user_id):
+    """(interaction count, latest interaction timestamp) for a user, straight from the DB."""
+    count, latest = db.session.query(
+        func.count(UserInteraction.id), func.max(UserInteraction.timestamp)
+    ).filter(UserInteraction.user_id == user_id).one()
+    return count, latest
+
+
+def load_user_state(user_id):
+    """Returns the user's cached UserState, rebuilding it from the DB when missing, stale or from another model."""
+    state = user_state_cache.get(user_id)
+    if state is not None:
+        if state.model_version == current_model().version and (
+            not USER_STATE_VALIDATE or state.stamp == history_stamp(user_id)
+        ):
+            USER_STATE_CACHE.inc(result='hit')
+            return state
+        USER_STATE_CACHE.inc(result='stale')
+        user_state_cache.invalidate(user_id) # Another worker wrote interactions for this user
+    else:
+        USER_STATE_CACHE.inc(result='miss')
+
+    with stage('load_user_state'):
+        state = _build_user_state(user_id)
+    user_state_cache.put(state)
+    return state
+
+
+def _build_user_state(user_id):
+    model = current_model()
+    user_history = db.session.query(
+        UserInteraction.movie_id, UserInteraction.rating, UserInteraction.timestamp
+    ).filter(UserInteraction.user_id == user_id).order_by(UserInteraction.timestamp, UserInteraction.id).all()
+    timestamps = [interaction.timestamp for interaction in user_history if interaction.timestamp is not None]
+    stamp = (len(user_history), max(timestamps) if timestamps else None)
+    return UserState(
+        user_id, [(interaction.movie_id, interaction.rating) for interaction in user_history],
+        stamp, model.content_index, model.movie_id_to_index_map, model.version,
+    )
 
-    # Take latest 5 liked or fill with disliked
-    selected_movie_ids = liked_movies[:5]
-    if len(selected_movie_ids) < 5:
-        selected_movie_ids += disliked_movies[:5 - len(selected_movie_ids)]
 
-    if not selected_movie_ids:
-        return [], all_interacted_movie_ids
+def invalidate_user_state(user_id):
+    """Drops the cached state; call whenever a user's interactions change outside /recommend."""
+    user_state_cache.invalidate(user_id)
+
+
+def get_state_svd_scores(state):
+    """SVD scores for the user, cached on the state until their factors change."""
+    if state.svd_scores is None:
+        state.svd_scores = get_svd_scores(state.user_id)
+    return state.svd_scores
+
+
+def get_state_svd_factors(state):
+    """(bias, factors) of the user's folded-in SVD model, cached on the state; None before any usable rating."""
+    if state.svd_factors is None:
+        user_factors = load_user_factors(state.user_id)
+        if user_factors is not None:
+            state.svd_factors = (user_factors.bias, np.frombuffer(user_factors.factors, dtype=np.float64))
+    return state.svd_factors
+
+
+def cf_candidates(state, n, exclude_mask):
+    """Catalog indices of the user's n best SVD scores; from the MIPS index when there is one."""
+    model = current_model()
+    mips_index = model.mips_index
+    svd_factors = get_state_svd_factors(state) if mips_index is not None else None
+    if svd_factors is not None:
+        with stage('mips_search'):
+            return mips_index.search(MIPSIndex.query_vector(svd_factors[1]), n, SERVING_MIPS_NPROBE, exclude_mask)
+    if state.svd_scores is None:
+        svd_factors = get_state_svd_factors(state)
+        if svd_factors is not None:
+            # Scored in one matrix product with the other requests scoring right now (when batching is on)
+            with stage('svd_scores'):
+                state.svd_scores, top = scoring_batcher.score_top(model.svd_scorer, *svd_factors, n, exclude_mask)
+            return top
+    return top_n_indices(get_state_svd_scores(state), n, exclude_mask)
+
+
+def generate_candidates(state, seed_movie_ids, exclude_mask):
+    """Movies worth blending for the user: top CF items, content neighbours of the seed movies
+    and popular movies in the seeds' genres, each cut to its quota (see candidates.py)."""
+    model = current_model()
+    with stage('candidates'):
+        seed_rows = [model.movie_id_to_index_map[movie_id] for movie_id in seed_movie_ids if movie_id in model.movie_id_to_index_map]
+        seed_genres = list(dict.fromkeys(
+            genre for movie_id in seed_movie_ids if movie_id in model.movie_metadata
+            for genre in model.movie_metadata.get(movie_id)[2]
+        ))
+        return merge_candidates([
+            cf_candidates(state, SERVING_CANDIDATE_QUOTAS['cf'], exclude_mask),
+            content_neighbor_candidates(
+                model.content_index.neighbors, seed_rows, SERVING_CANDIDATE_QUOTAS['content'], exclude_mask,
+            ),
+            model.popularity_index.diverse(SERVING_CANDIDATE_QUOTAS['popular'], exclude_mask, seed_genres),
+        ])
+
+
+def candidate_svd_scores(state, candidates):
+    """Exact SVD scores of the candidates, without scoring the rest of the catalog."""
+    if state.svd_scores is not None:
+        return state.svd_scores[candidates]
+    svd_scorer = current_model().svd_scorer
+    svd_factors = get_state_svd_factors(state)
+    if svd_factors is None:
+        FALLBACKS.inc(path='svd_unknown_user')
+        return svd_scorer.unknown_user_scores[candidates]
+    with stage('svd_scores'):
+        return svd_scorer.score_factors(svd_factors[0], svd_factors[1], candidates)
+
+
+def rank_movies(state, seed_movie_ids, content_scores, exclude_mask=None):
+    """Catalog indices of the best recommendation_top_n movies for the user, skipping interacted ones.
+
+    Only the candidates from generate_candidates() get the blended score.
+    `content_scores(indices=None)` returns the user's content scores for those
+    catalog indices (all movies when None). `exclude_mask` defaults to the
+    user's interacted movies.
+    """
+    model = current_model()
+    if exclude_mask is None:
+        exclude_mask = state.interacted
+    candidates = generate_candidates(state, seed_movie_ids, exclude_mask)
+    if len(candidates) >= model.recommendation_top_n:
+        svd_scores = candidate_svd_scores(state, candidates)
+        with stage('rank'):
+            final_scores = blend_scores(svd_scores, content_scores(candidates), model.blending_alpha)
+            return candidates[top_n_indices(final_scores, model.recommendation_top_n)]
+    FALLBACKS.inc(path='full_scan') # Nearly the whole catalog has been swiped
+
+    svd_scores = get_state_svd_scores(state)
+    with stage('rank'):
+        final_scores = blend_scores(svd_scores, content_scores(), model.blending_alpha)
+        return top_n_indices(final_scores, model.recommendation_top_n, exclude_mask)
+
+
+def popular_movie_ids(exclude_mask):
+    """recommendation_top_n popular movies the user has not interacted with, spread over genres."""
+    model = current_model()
+    return [model.movie_ids_list[i] for i in model.popularity_index.diverse(model.recommendation_top_n, exclude_mask)]
+
+
+def generate_recommendations_from_user_history(user_id, state=None):
+    
+    if state is None:
+        state = load_user_state(user_id)
+    with state.lock: # Prefetch jobs and swipe batches update the same cached state
+        all_interacted_movie_ids = set(state.history)
 
-    # Generate content + SVD hybrid scores
-    content_scores = get_content_scores(selected_movie_ids)
-    svd_scores = get_svd_scores(user_id)
-    final_scores = blending_alpha * svd_scores + (1 - blending_alpha) * content_scores
+        # Take latest 5 liked or fill with disliked
+        selected_movie_ids = content_seed_movie_ids(state.history)
 
-    # Filter out already interacted movies
-    filtered_indices = [
-        i for i in range(len(movie_ids_list))
-        if movie_ids_list[i] not in all_interacted_movie_ids
-    ]
-    
-    if not filtered_indices:
-        return [], all_interacted_movie_ids
+        if not selected_movie_ids:
+            return [], all_interacted_movie_ids
 
-    top_indices = sorted(filtered_indices, key=lambda i: final_scores[i], reverse=True)[:recommendation_top_n]
-    recommended_movie_ids = [movie_ids_list[i] for i in top_indices]
+        # Generate content + SVD hybrid scores for the candidates, filter out already
+        # interacted movies and keep the best recommendation_top_n
+        top_indices = rank_movies(state, selected_movie_ids, partial(get_content_scores, selected_movie_ids))
+    recommended_movie_ids = [current_model().movie_ids_list[i] for i in top_indices]
 
     return recommended_movie_ids, all_interacted_movie_ids
 
+def load_materialized_recommendations(state):
+    """The user's batch-computed top movie ids, or None unless they were ranked from the current model and history."""
+    model = current_model()
+    with stage('materialized'):
+        row = db.session.get(MaterializedRecommendation, state.user_id)
+    if row is None:
+        MATERIALIZED.inc(result='miss')
+        return None
+    if row.model_version != model.version or (row.n_interactions, row.latest_interaction) != state.stamp:
+        MATERIALIZED.inc(result='stale')
+        return None
+    MATERIALIZED.inc(result='hit')
+    return np.frombuffer(row.movie_ids, dtype=np.int64)[:model.recommendation_top_n].tolist()
+
 TMDB_API_KEY = os.environ.get("TMDB_API_KEY") 
 
 TMDB_IMAGES_BASE_URL=os.environ.get('TMDB_IMAGES_BASE_URL')
 
 TMDB_IMAGE_CDN_BASE_URL =  os.environ.get('TMDB_IMAGE_CDN_BASE_URL')
 
-_tmdb_image_url_cache={}
+POSTER_CACHE_PATH = os.environ.get('POSTER_CACHE_PATH') or os.path.join(os.path.dirname(current_file_dir), 'poster_cache.sqlite3')
+
+_poster_resolver = None
+
+def get_poster_resolver():
+    """Per-process PosterResolver, created lazily so every forked worker gets its own connections."""
+    global _poster_resolver
+    if _poster_resolver is None:
+        _poster_resolver = PosterResolver(
+            TMDB_API_KEY, TMDB_IMAGES_BASE_URL, TMDB_IMAGE_CDN_BASE_URL,
+            PosterCache(POSTER_CACHE_PATH), DEFAULT_POSTER_URL,
+        )
+    return _poster_resolver
 
 def get_movie_image_url_from_tmdb(tmdb_id):
     
-    if not TMDB_API_KEY or pd.isna(tmdb_id):
+    if pd.isna(tmdb_id):
         return DEFAULT_POSTER_URL
+    return get_poster_resolver().resolve(int(tmdb_id))
+
+def build_recommendation_records(movie_ids):
+    """Title, genres and poster for each recommended movie id, ready for jsonify."""
+    with stage('response_records'):
+        return current_model().movie_metadata.records(movie_ids, get_poster_resolver().resolve_many, default_poster_url=DEFAULT_POSTER_URL)
+
+def compute_next_page(user_id, exclude_movie_ids):
+    """Prefetch job: the page POST /recommend would return once the user has swiped exclude_movie_ids.
+
+    Runs on a prefetch thread in its own app context (and DB session). Returns
+    (movie_ids, records, interaction count, model version) or None when the user
+    would get the popular-movies fallback instead.
+    """
+    model = current_model()
+    state = load_user_state(user_id)
+    with state.lock:
+        if not state.liked_movie_ids:
+            return None
+        exclude_mask = state.interacted | exclusion_mask(exclude_movie_ids, model.movie_id_index, len(model.movie_ids_list))
+        top_indices = rank_movies(state, state.recent_movie_ids(LIKE_RATING)[:CONTENT_SEEDS], state.content_scores, exclude_mask)
+        stamp_count = state.stamp[0]
+    if len(top_indices) == 0:
+        return None
+    movie_ids = [model.movie_ids_list[i] for i in top_indices]
+    return movie_ids, build_recommendation_records(movie_ids), stamp_count, model.version
+
+
+# Speculative next pages (see prefetch.py); PREFETCH_WORKERS=0 turns it off
+page_prefetcher = PagePrefetcher(
+    compute_next_page,
+    max_workers=int(os.environ.get('PREFETCH_WORKERS', PREFETCH_WORKERS)),
+    ttl=float(os.environ.get('PREFETCH_TTL', PREFETCH_TTL)),
+    max_queue=int(os.environ.get('PREFETCH_MAX_QUEUE', PREFETCH_MAX_QUEUE)),
+    max_missed_swipes=int(os.environ.get('PREFETCH_MAX_MISSED_SWIPES', PREFETCH_MAX_MISSED_SWIPES)),
+)
+
+
+def _prefetch_queue_depth():
+    stats = page_prefetcher.stats()
+    return stats['queue_depth'] + stats['running']
+
+
+Gauge('moviescout_prefetch_queue_depth', 'Next-page prefetch jobs queued or running.', function=_prefetch_queue_depth)
+Gauge('moviescout_prefetch_hit_rate', 'Share of POST /recommend calls served a prefetched page.',
+      function=lambda: page_prefetcher.stats()['hit_rate'])
+Gauge('moviescout_prefetch_served_age_seconds', 'Mean age of the prefetched pages served.',
+      function=lambda: page_prefetcher.stats()['mean_served_age_s'])
+Gauge('moviescout_user_state_cache_size', 'Users with cached recommendation state.', function=lambda: len(user_state_cache))
+Gauge('moviescout_scoring_queue_depth', 'Requests waiting for a batched SVD scoring pass.',
+      function=lambda: scoring_batcher.stats()['queue_depth'])
+Gauge('moviescout_scoring_mean_batch_size', 'Mean users per batched SVD scoring pass.',
+      function=lambda: scoring_batcher.stats()['mean_batch_size'] or 0)
+
+
+@model_registry.on_swap
+def drop_model_caches(old, new, kind):
+    # Entries from the previous model are rejected by their version anyway; free the memory right away
+    user_state_cache.clear() # States hold vectors computed from the previous model
+    page_prefetcher.clear() # Pages were ranked with the previous model
+
+
+def schedule_next_page(user_id, served_movie_ids):
+    page_prefetcher.schedule(current_app._get_current_object(), user_id, served_movie_ids)
 
-    tmdb_id = int(tmdb_id) # Ensure it's an integer for the URL
-
-    if tmdb_id in _tmdb_image_url_cache:
-        return _tmdb_image_url_cache[tmdb_id]
-
-    # Construct the API URL for images using the API Key in the query parameter
-    url = f"{TMDB_IMAGES_BASE_URL}{tmdb_id}/images?api_key={TMDB_API_KEY}"
-
-    try:
-        response = requests.get(url, timeout=3) 
-        response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
-        data = response.json()
-
-        file_path = None
-        # Prioritize posters
-        if 'posters' in data and data['posters']:
-            # You can add logic here to pick the best poster (e.g., by vote_average, or with 'en' ISO code)
-            # For simplicity, we'll take the first one.
-            file_path = data['posters'][0].get('file_path')
-        # If no posters, try backdrops
-        elif 'backdrops' in data and data['backdrops']:
-            file_path = data['backdrops'][0].get('file_path')
-        # If no backdrops, try logos
-        elif 'logos' in data and data['logos']:
-            file_path = data['logos'][0].get('file_path')
-
-        if file_path:
-            full_url = f"{TMDB_IMAGE_CDN_BASE_URL}{file_path}"
-            _tmdb_image_url_cache[tmdb_id] = full_url # Store in cache
-            return full_url
-        else:
-            # print(f"No suitable image found for TMDB ID: {tmdb_id}")
-            return DEFAULT_POSTER_URL
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching TMDb image for TMDB ID {tmdb_id}: {e}")
-        return DEFAULT_POSTER_URL
-    except ValueError:
-        print(f"Invalid TMDB ID format: {tmdb_id}")
-        return DEFAULT_POSTER_URL
-    except Exception as e:
-        print(f"An unexpected error occurred while fetching TMDB image for {tmdb_id}: {e}")
-        return DEFAULT_POSTER_URL
 # Routes 
 
 @recommendations_bp.route('/recommend/initial', methods=['GET'])
 @login_required
 def recommend_initial_movies(): 
     user_id = current_user.id
-    user_history = UserInteraction.query.filter_by(user_id=user_id).all()
-    if user_history:
-        recs_ids, all_interacted_movie_ids = generate_recommendations_from_user_history(user_id)
-    else:
-        recs_ids = []
-        all_interacted_movie_ids = set()
-    
-    popular_movie_ids_to_recommend = popular_movies_data['movieId']
-    
-    
+    state = load_user_state(user_id)
+    recs_ids = []
+    if state.history:
+        # Served from the batch job's table when nothing changed since it ran (see materialize.py)
+        recs_ids = load_materialized_recommendations(state)
+        if not recs_ids:
+            recs_ids, _ = generate_recommendations_from_user_history(user_id, state)
     
     if not recs_ids:
-        recs_ids = []
-        for movie_id in popular_movie_ids_to_recommend :
-            if movie_id not in all_interacted_movie_ids:
-                recs_ids.append(movie_id)
-            if len(recs_ids) == recommendation_top_n:
-                break
+        FALLBACKS.inc(path='initial_popular')
+        recs_ids = popular_movie_ids(state.interacted) # Genre-diverse deck of popular movies
     
-    recommended_movies_data = []# If user interaction exists
-    for movie_id in recs_ids:
-        movie_info=combined_data[combined_data['movieId']==movie_id].iloc[0]
-        tmdb_id = movie_info['tmdbId']
-        # Get ONLY the image URL from TMDb
-        poster_url = get_movie_image_url_from_tmdb(tmdb_id)
-        genres_string = movie_info['content']
-        genres_list = genres_string.split(' ')
-        title=movie_info['title']
-        
-        recommended_movies_data.append({
-            "movieId": movie_id,
-            "title": title,
-            "genres": genres_list, # Use genres from your local data, converted to list
-            "poster_url": poster_url
-            })
+    recommended_movies_data = build_recommendation_records(recs_ids)
+    if state.liked_movie_ids:
+        schedule_next_page(user_id, recs_ids) # Precompute what the next POST /recommend will need
 
     return jsonify({
         "userId": user_id, # Frontend still needs the userId for subsequent POSTs
@@ -265,96 +764,59 @@ def give_recommendations():
         return jsonify({"error": "User ID is required."}), 400
     
     
-    # --- 1. Save User Interactions to DB ---
+    # --- 1. Save User Interactions to DB and update the user's cached state ---
+    state = load_user_state(user_id)
+    now = datetime.now()
     try:
-        for movie_id in liked_movie_ids:
-            # Check for existing interaction to prevent duplicates on multiple submits
-            # Query if a specific movie_id, user_id, and rating (5.0 for liked) exists
-            existing_interaction = UserInteraction.query.filter_by(
-                user_id=user_id, movie_id=movie_id, rating=5.0
-            ).first()
-            if not existing_interaction:
-                save_interaction(user_id, movie_id, 5.0) # Calls the helper function
-        for movie_id in disliked_movie_ids:
-            # Check for existing interaction (1.0 for disliked)
-            existing_interaction = UserInteraction.query.filter_by(
-                user_id=user_id, movie_id=movie_id, rating=1.0
-            ).first()
-            if not existing_interaction:
-                save_interaction(user_id, movie_id, 1.0) # Calls the helper function
-        db.session.commit() # Commit all changes at once
+        with state.lock:
+            with stage('ingest'):
+                user_history, changes = ingest_interactions(user_id, liked_movie_ids, disliked_movie_ids, state.history, now)
+            if changes:
+                with stage('fold_in'):
+                    update_user_factors(user_id, changes) # Fold the new swipes into the user's SVD factors
+            with stage('commit'):
+                db.session.commit() # Commit all changes at once
+            if changes:
+                latest = now if state.stamp[1] is None else max(state.stamp[1], now)
+                state.apply_changes(changes, (len(user_history), latest))
+            user_current_liked_movie_ids = state.liked_movie_ids
     except Exception as e:
         db.session.rollback() # Rollback if any error occurs during commit
+        invalidate_user_state(user_id) # The cached history may already include the failed batch
         print(f"Error storing user interactions: {e}")
         return jsonify({"message": "Error storing interactions", "error_details": str(e)}), 500
     
-     # --- 2. Get ALL User's Past Interactions from DB ---
-    user_history = UserInteraction.query.filter_by(user_id=user_id).all()
-    all_interacted_movie_ids = {interaction.movie_id for interaction in user_history}
-    
-    user_current_liked_movie_ids = [
-        interaction.movie_id for interaction in user_history if interaction.rating == 5.0
-    ]
+    all_interacted_movie_ids = set(user_history)
+    recommended_movies_data = None
         
 
-    # --- 3. Generate Hybrid Recommendations ---
+    # --- 2. Generate Hybrid Recommendations ---
     if not user_current_liked_movie_ids and not liked_movie_ids:
         # If user has no likes yet (but has dislikes), or just started, fall back to popular
-        for movie_id in popular_movies_data['movieId'].tolist():
-            if movie_id not in all_interacted_movie_ids:
-                recs_ids.append(movie_id)
-            if len(recs_ids) == recommendation_top_n:
-                break
-        
-        if not recs_ids: # Fallback if even popular ones are all interacted
-             # As a last resort, just provide random movies not seen, if any
-            all_movie_ids_set = set(movie_ids_list)
-            unseen_movie_ids = list(all_movie_ids_set - all_interacted_movie_ids)
-            if unseen_movie_ids:
-                recs_ids = np.random.choice(unseen_movie_ids, min(recommendation_top_n, len(unseen_movie_ids)), replace=False).tolist()
-            else:
-                return jsonify({"message": "No new movies available to recommend."}), 200
+        FALLBACKS.inc(path='popular')
+        recs_ids = popular_movie_ids(state.interacted) # Ranks the whole catalog, so empty only once everything was swiped
+        if not recs_ids:
+            return jsonify({"message": "No new movies available to recommend."}), 200
 
     else:
-        
-        content_scores = get_content_scores(user_current_liked_movie_ids) # Content based filtering
-        svd_scores = get_svd_scores(user_id) # SVD handles cold start users gracefully
-
-        final_scores = blending_alpha * svd_scores + (1 - blending_alpha) * content_scores
-        
-        # Filter out movies the user has already interacted with (liked or disliked)
-        # Convert to set for efficient lookup
-        filtered_indices = [
-            i for i in range(len(movie_ids_list))
-            if movie_ids_list[i] not in all_interacted_movie_ids
-        ]
-
-        if not filtered_indices:
-            return jsonify({"message": "No new movies left to recommend."}), 200
-
-        # Sort and get top_n recommendations
-        top_indices = sorted(filtered_indices, key=lambda i: final_scores[i], reverse=True)[:recommendation_top_n]
-        recs_ids = [movie_ids_list[i] for i in top_indices]
+        # A page precomputed after the previous response, if none of its movies were swiped since
+        prefetched = page_prefetcher.take(user_id, all_interacted_movie_ids, state.stamp[0], current_model().version)
+        if prefetched is not None:
+            recs_ids, recommended_movies_data = prefetched
+        else:
+            # Content based filtering is kept up to date incrementally in the state. Blend it with SVD
+            # scores (cold start users get the unknown-user scores) over the candidates, filter out
+            # movies the user has already interacted with (liked or disliked) and get top_n recommendations
+            with state.lock: # A prefetch job or another swipe batch may be updating the same state
+                top_indices = rank_movies(state, state.recent_movie_ids(LIKE_RATING)[:CONTENT_SEEDS], state.content_scores)
+            if len(top_indices) == 0:
+                return jsonify({"message": "No new movies left to recommend."}), 200
+            recs_ids = [current_model().movie_ids_list[i] for i in top_indices]
+        schedule_next_page(user_id, recs_ids)
         
 
-    # --- 4. Prepare Response ---
+    # --- 3. Prepare Response ---
     
-    recommended_movies_data=[]
-    for movie_id in recs_ids:
-        
-        movie_info=combined_data[combined_data['movieId']==movie_id].iloc[0]
-        #print(movie_info)
-        tmdb_id = movie_info['tmdbId']
-        # Get ONLY the image URL from TMDb
-        poster_url = get_movie_image_url_from_tmdb(tmdb_id)
-        genres_string = movie_info['content']
-        genres_list = genres_string.split(' ')
-        title=movie_info['title']
-        
-        recommended_movies_data.append({
-            "movieId": movie_id,
-            "title": title,
-            "genres": genres_list, # Use genres from your local data, converted to list
-            "poster_url": poster_url
-            })
-    return jsonify({"recommendations": recommended_movies_data})
\ No newline at end of file
+    if recommended_movies_data is None:
+        recommended_movies_data = build_recommendation_records(recs_ids)
+    return jsonify({"recommendations": recommended_movies_data})
@@ -0,0 +1,158 @@
+# candidates.py
+"""Candidate generation: a few hundred movies worth blending, gathered from several sources.
+
+Every source returns catalog indices best first, already filtered by the
+user's exclusion mask and cut to its quota:
+
+- collaborative filtering: the best SVD scores (from the MIPS index when there is one)
+- content: the precomputed top-k content neighbours of the user's recent likes
+- popularity: the most rated movies in the genres of those likes, or across
+  all genres for users without likes
+
+merge_candidates() deduplicates them, and the hybrid blend then scores only
+the merged set instead of the whole catalog.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from ranking import top_n_indices
+
+CANDIDATE_QUOTAS = {'cf': 200, 'content': 200, 'popular': 50}
+CONTENT_SEEDS = 5 # Recent likes whose neighbours are gathered
+NO_GENRE = '(no genres listed)'
+
+
+def first_allowed(order, n, exclude_mask=None):
+    """The first n entries of `order` that are not excluded.
+
+    Only looks at a prefix that doubles until it holds enough allowed items, so
+    the cost is O(n + excluded items met) rather than O(len(order)).
+    """
+    if exclude_mask is None:
+        return order[:n]
+    stop = max(1, n)
+    while True:
+        head = order[:stop]
+        allowed = head[~exclude_mask[head]]
+        if len(allowed) >= n or stop >= len(order):
+            return allowed[:n]
+        stop *= 2
+
+
+def merge_candidates(sources):
+    """Deduplicated union of the given index arrays, in catalog order (ties then break like a full scan)."""
+    sources = [np.asarray(indices, dtype=np.int64) for indices in sources if len(indices)]
+    if not sources:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate(sources))
+
+
+def content_neighbor_candidates(neighbors, seed_rows, n, exclude_mask=None):
+    """Movies most similar to the seed movies, from the top-k neighbour CSR; O(seeds * k)."""
+    if len(seed_rows) == 0 or n <= 0:
+        return np.empty(0, dtype=np.int64)
+    # Slice the seed rows straight out of the CSR arrays (scipy row indexing costs more than the work)
+    spans = [slice(neighbors.indptr[row], neighbors.indptr[row + 1]) for row in seed_rows]
+    row_columns = np.concatenate([neighbors.indices[span] for span in spans])
+    row_values = np.concatenate([neighbors.data[span] for span in spans])
+    # Sum the similarity of each neighbour over the seeds without a catalog-sized vector
+    columns, inverse = np.unique(row_columns, return_inverse=True)
+    values = np.bincount(inverse, weights=row_values, minlength=len(columns))
+    if exclude_mask is not None:
+        keep = ~exclude_mask[columns]
+        columns, values = columns[keep], values[keep]
+    return columns[top_n_indices(values, n)].astype(np.int64)
+
+
+class PopularityIndex:
+    """Catalog indices ranked by popularity (number of ratings), overall and per genre.
+
+    Rankings are computed once at load time; a request only walks the head of
+    the relevant arrays, skipping excluded movies.
+    """
+
+    def __init__(self, order, genre_orders):
+        self.order = order # Catalog indices, most popular first
+        self.genre_orders = genre_orders # genre -> catalog indices of its movies, most popular first
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        # Genres by the popularity of their best movie, so a diverse deck leads with the big genres
+        self.genres = sorted(genre_orders, key=lambda genre: rank[genre_orders[genre][0]])
+
+    @classmethod
+    def build(cls, popularity, movie_genres):
+        """`popularity[i]` and `movie_genres[i]` (an iterable of genre names) describe catalog movie i."""
+        popularity = np.asarray(popularity, dtype=np.float64)
+        order = np.argsort(-popularity, kind='stable') # Ties keep catalog order
+        members = {}
+        for idx in order:
+            for genre in movie_genres[idx]:
+                members.setdefault(genre, []).append(idx)
+        genre_orders = {genre: np.asarray(indices, dtype=np.int64) for genre, indices in members.items()}
+        return cls(order.astype(np.int64), genre_orders)
+
+    def __len__(self):
+        return len(self.order)
+
+    def top(self, n, exclude_mask=None, genre=None):
+        """The n most popular movies overall (or within one genre) that are not excluded."""
+        order = self.order if genre is None else self.genre_orders.get(genre, np.empty(0, dtype=np.int64))
+        return first_allowed(order, n, exclude_mask)
+
+    def diverse(self, n, exclude_mask=None, genres=None):
+        """n popular movies taken round-robin from the given genres (default: all), without repeats."""
+        genres = [genre for genre in (genres or self.genres) if genre in self.genre_orders]
+        if not genres:
+            return self.top(n, exclude_mask)
+        # Each genre can contribute at most n movies; fetch that many and take turns
+        per_genre = np.full((len(genres), n), -1, dtype=np.int64)
+        for row, genre in enumerate(genres):
+            indices = self.top(n, exclude_mask, genre)
+            per_genre[row, :len(indices)] = indices
+        turns = per_genre.T.ravel() # Best of every genre, then the second best of every genre, ...
+        turns = turns[turns >= 0]
+        _, first = np.unique(turns, return_index=True)
+        picked = turns[np.sort(first)][:n]
+        if len(picked) < n: # Few genres with few movies: fill from the overall ranking
+            extra = self.top(n + len(picked), exclude_mask)
+            picked = np.concatenate([picked, extra[~np.isin(extra, picked)][:n - len(picked)]])
+        return picked
+
+
+def movie_genres(content):
+    """Genres of a combined_data `content` string (space-separated genre names)."""
+    content = str(content).replace(NO_GENRE, '')
+    return tuple(genre for genre in content.split(' ') if genre)
+
+
+def count_ratings(ratings_path, id_index, chunk_rows=1_000_000):
+    """Number of ratings per catalog movie, streamed from a MovieLens ratings.csv."""
+    counts = np.zeros(int((id_index >= 0).sum()), dtype=np.int64)
+    for chunk in pd.read_csv(ratings_path, usecols=['movieId'], dtype={'movieId': np.int64}, chunksize=chunk_rows):
+        movie_ids = chunk['movieId'].to_numpy()
+        movie_ids = movie_ids[(movie_ids >= 0) & (movie_ids < len(id_index))]
+        indices = id_index[movie_ids]
+        counts += np.bincount(indices[indices >= 0], minlength=len(counts))
+    return counts
+
+
+def popularity_from_popular_movies(popular_movies_data, id_index):
+    """Fallback ranking from popular_movies.csv alone: its movies first, the rest of the catalog after."""
+    counts = np.zeros(int((id_index >= 0).sum()), dtype=np.int64)
+    for movie_id, num_ratings in zip(popular_movies_data['movieId'], popular_movies_data['num_ratings']):
+        if 0 <= movie_id < len(id_index) and id_index[movie_id] >= 0:
+            counts[id_index[movie_id]] = num_ratings
+    return counts
+
+
+def load_popularity(popularity_path, ratings_path, popular_movies_data, id_index):
+    """Per-movie rating counts: the trained export if present, else counted from ratings.csv."""
+    if popularity_path and os.path.exists(popularity_path):
+        return np.load(popularity_path)
+    if ratings_path and os.path.exists(ratings_path):
+        print(f"{popularity_path} not found, counting ratings in {ratings_path}. Re-run train.py to export it.")
+        return count_ratings(ratings_path, id_index)
+    print("No rating counts available, ranking popularity from popular_movies.csv only.")
+    return popularity_from_popular_movies(popular_movies_data, id_index)
@@ -0,0 +1,271 @@
+# content_catalog.py
+"""Adds or updates movies in the content model without refitting the whole catalog.
+
+train.py fits a ContentFeaturizer (TF-IDF over the genres plus the movie's
+aggregated tags.csv tags) and saves it next to the content index. New or
+changed movies are then turned into feature rows with the fitted vocabulary
+and idf weights, and only their similarities to the existing catalog are
+computed (ContentIndex.upsert): O(new x catalog) instead of refitting and
+comparing every pair of movies. Movie ids are appended to the mappings, the
+metadata tables and the SVD item arrays (as movies without ratings), so the
+server can recommend them from content right away. Genres and tags the fit
+never saw do not count until the next full train.py run.
+
+    python content_catalog.py add new_movies.csv     # movieId,title,genres[,tmdbId]; known ids are updated
+    python content_catalog.py add new_movies.csv --tags tags.csv extra_tags.csv --top-k 200
+
+The trained_models files and, when present, the bundle are rewritten; a
+running backend picks them up through the model watcher or the admin reload.
+"""
+import argparse
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from content_index import CONTENT_TOP_K, ContentIndex
+
+FEATURIZER_FILE = 'trained_content_featurizer.joblib'
+LEGACY_TFIDF_FILE = 'trained_tfIDF.joblib' # Genre-only vectorizer written before tags were used
+
+GENRE_TFIDF_PARAMS = {'stop_words': 'english', 'min_df': 0.1, 'max_df': 0.9, 'ngram_range': (1, 3)}
+# One token per tag (tags are joined with '|'); a tag has to be used on a few movies to say anything
+TAG_TFIDF_PARAMS = {'token_pattern': r'[^|]+', 'min_df': 2, 'sublinear_tf': True}
+# Tags make up TAG_WEIGHT^2 / (1 + TAG_WEIGHT^2) of the similarity of two tagged movies. Off by default:
+# in evaluate.py tags lowered hybrid NDCG@10 (0.1535 genres only, 0.1524 at 0.25, 0.1445 at 1.0)
+TAG_WEIGHT = 0.0
+
+
+def genre_documents(genres):
+    """movies.csv genres ('Action|Comedy') -> the space separated content column of combined_data.csv."""
+    return pd.Series(genres).fillna('').astype(str).str.split('|').str.join(' ')
+
+
+def load_tags(paths):
+    """movieId / tag rows of every existing tags file (MovieLens tags.csv format)."""
+    frames = [pd.read_csv(path, usecols=['movieId', 'tag']) for path in paths if path and os.path.exists(path)]
+    if not frames:
+        return pd.DataFrame({'movieId': pd.Series(dtype=np.int64), 'tag': pd.Series(dtype=str)})
+    return pd.concat(frames, ignore_index=True)
+
+
+def aggregate_tags(tags, movie_ids):
+    """One tag document per movie in movie_ids order: its tags, lowercased and joined by '|' ('' if untagged)."""
+    tags = tags.dropna(subset=['tag'])
+    cleaned = tags['tag'].astype(str).str.replace('|', ' ', regex=False).str.strip().str.lower()
+    cleaned = cleaned[cleaned != '']
+    documents = cleaned.groupby(tags.loc[cleaned.index, 'movieId']).agg('|'.join)
+    return documents.reindex(list(movie_ids)).fillna('').tolist()
+
+
+class ContentFeaturizer:
+    """Fitted vectorizers that turn a movie's genres and tags into one L2-normalized feature row.
+
+    The genre and tag TF-IDF rows both have norm 1; the tag block is scaled by
+    `tag_weight` and the joined row normalized again. Without a tag vectorizer
+    (tag_weight 0, or no tag used on enough movies) the rows are exactly the
+    old genre-only TF-IDF features.
+    """
+
+    def __init__(self, genre_vectorizer, tag_vectorizer=None, tag_weight=TAG_WEIGHT):
+        self.genre_vectorizer = genre_vectorizer
+        self.tag_vectorizer = tag_vectorizer if tag_weight > 0 else None
+        self.tag_weight = float(tag_weight)
+
+    @classmethod
+    def fit(cls, genre_docs, tag_docs, tag_weight=TAG_WEIGHT, genre_params=GENRE_TFIDF_PARAMS,
+            tag_params=TAG_TFIDF_PARAMS):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        genre_vectorizer = TfidfVectorizer(**genre_params).fit(genre_docs)
+        tag_vectorizer = None
+        if tag_weight > 0:
+            try:
+                tag_vectorizer = TfidfVectorizer(**tag_params).fit(tag_docs)
+            except ValueError as e: # No tag reaches min_df
+                print(f"Not using tags for content features: {e}")
+        return cls(genre_vectorizer, tag_vectorizer, tag_weight)
+
+    @property
+    def n_features(self):
+        n_tags = 0 if self.tag_vectorizer is None else len(self.tag_vectorizer.vocabulary_)
+        return len(self.genre_vectorizer.vocabulary_) + n_tags
+
+    def transform(self, genre_docs, tag_docs=None):
+        """Feature rows (float32 CSR) for movies given as genre documents and tag documents."""
+        from sklearn.preprocessing import normalize
+        genres = self.genre_vectorizer.transform(genre_docs) # Rows already have norm 1
+        if self.tag_vectorizer is None:
+            return sparse.csr_matrix(genres, dtype=np.float32)
+        if tag_docs is None:
+            tag_docs = [''] * genres.shape[0]
+        tags = self.tag_vectorizer.transform(tag_docs) * self.tag_weight
+        return sparse.csr_matrix(normalize(sparse.hstack([genres, tags], format='csr')), dtype=np.float32)
+
+    def save(self, path):
+        joblib.dump({'genres': self.genre_vectorizer, 'tags': self.tag_vectorizer, 'tag_weight': self.tag_weight}, path)
+
+    @classmethod
+    def load(cls, models_dir):
+        """The featurizer train.py saved in models_dir; older trainings only have the genre vectorizer."""
+        path = os.path.join(models_dir, FEATURIZER_FILE)
+        if os.path.exists(path):
+            saved = joblib.load(path)
+            return cls(saved['genres'], saved['tags'], saved['tag_weight'])
+        print(f"{path} not found, using the genre-only {LEGACY_TFIDF_FILE}. Re-run train.py to add tags.")
+        return cls(joblib.load(os.path.join(models_dir, LEGACY_TFIDF_FILE)), tag_weight=0.0)
+
+
+# --- Catalog updates ---
+
+def catalog_positions(movie_ids, id_to_index, new_ids):
+    """Catalog positions of new_ids; unknown ids are appended to movie_ids and id_to_index in place."""
+    positions = []
+    for movie_id in new_ids:
+        idx = id_to_index.get(movie_id)
+        if idx is None:
+            idx = id_to_index[movie_id] = len(movie_ids)
+            movie_ids.append(movie_id)
+        positions.append(idx)
+    return np.asarray(positions, dtype=np.int64)
+
+
+def upsert_movies(content_index, movie_ids, id_to_index, featurizer, movies, tag_docs, k=CONTENT_TOP_K):
+    """Featurizes `movies` (movieId, content) and upserts them; movie_ids and id_to_index are extended in place.
+
+    Returns the new ContentIndex.
+    """
+    if content_index.features is None:
+        raise ValueError('The content index has no feature matrix, rebuild it with train.py --force content')
+    if featurizer.n_features != content_index.features.shape[1]:
+        raise ValueError(f'The featurizer has {featurizer.n_features} features, the content index '
+                         f'{content_index.features.shape[1]}; rebuild both with train.py --force content')
+    rows = featurizer.transform(movies['content'], tag_docs)
+    positions = catalog_positions(movie_ids, id_to_index, movies['movieId'].tolist())
+    return content_index.upsert(positions, rows, k=k)
+
+
+def upsert_rows(table, rows):
+    """`table` with the rows sharing a movieId with `rows` replaced in place and the other rows appended."""
+    indexed = table.set_index('movieId')
+    rows = rows.set_index('movieId')[indexed.columns]
+    known = rows.index.isin(indexed.index)
+    indexed.loc[rows.index[known]] = rows[known]
+    return pd.concat([indexed, rows[~known]]).reset_index()
+
+
+def _replace(path, write):
+    """Writes through a temporary file next to `path` so readers never see half a file."""
+    root, ext = os.path.splitext(path)
+    tmp_path = f'{root}.tmp-{os.getpid()}{ext}'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def update_csv(path, rows):
+    """upsert_rows() on a CSV file, written in the file's own format (line endings, integer tmdbIds)."""
+    with open(path, newline='') as f:
+        newline = '\r\n' if f.readline().endswith('\r\n') else '\n' # MovieLens files use CRLF
+    table = upsert_rows(pd.read_csv(path), rows)
+    if 'tmdbId' in table.columns:
+        table['tmdbId'] = table['tmdbId'].astype('Int64') # Written as 862, not 862.0
+    _replace(path, lambda tmp_path: table.to_csv(tmp_path, index=False, lineterminator=newline))
+
+
+def read_new_movies(path, links_path=None):
+    """movieId,title,genres[,tmdbId] rows; the last row wins for repeated ids. tmdbId falls back to links.csv."""
+    movies = pd.read_csv(path).drop_duplicates('movieId', keep='last')
+    missing = {'movieId', 'title', 'genres'} - set(movies.columns)
+    if missing:
+        raise SystemExit(f"{path} is missing the column(s) {', '.join(sorted(missing))}")
+    movies['movieId'] = movies['movieId'].astype(np.int64)
+    if 'tmdbId' not in movies.columns:
+        movies['tmdbId'] = np.nan
+    if links_path and os.path.exists(links_path):
+        links = pd.read_csv(links_path, usecols=['movieId', 'tmdbId']).drop_duplicates('movieId').set_index('movieId')
+        movies['tmdbId'] = movies['tmdbId'].fillna(movies['movieId'].map(links['tmdbId']))
+    movies['content'] = genre_documents(movies['genres']).to_numpy()
+    return movies
+
+
+def update_dataset(dataset_dir, movies):
+    """Upserts the movies into movies.csv (so the next train.py run keeps them) and combined_data.csv."""
+    for name, columns in (('movies.csv', ['movieId', 'title', 'genres']),
+                          ('combined_data.csv', ['movieId', 'title', 'content', 'tmdbId'])):
+        path = os.path.join(dataset_dir, name)
+        if os.path.exists(path):
+            update_csv(path, movies[columns])
+
+
+def update_trained_models(models_dir, featurizer, movies, tag_docs, k):
+    """Upserts the movies into the content index, mappings and rating counts in models_dir."""
+    mappings_path = os.path.join(models_dir, 'recommender_mappings.joblib')
+    index_path = os.path.join(models_dir, 'trained_content_index.npz')
+    mapping_data = joblib.load(mappings_path)
+    movie_ids, id_to_index = mapping_data['Movie_ids'], mapping_data['Movie_id_to_idx']
+    n_before = len(movie_ids)
+    content_index = upsert_movies(ContentIndex.load(index_path), movie_ids, id_to_index, featurizer, movies, tag_docs, k)
+
+    _replace(index_path, content_index.save)
+    _replace(mappings_path, lambda path: joblib.dump(mapping_data, path))
+    popularity_path = os.path.join(models_dir, 'trained_popularity.npy')
+    if os.path.exists(popularity_path): # New movies have no ratings yet
+        popularity = np.load(popularity_path)
+        popularity = np.concatenate([popularity, np.zeros(len(movie_ids) - len(popularity), dtype=popularity.dtype)])
+        _replace(popularity_path, lambda path: np.save(path, popularity))
+    print(f"Updated {models_dir}: {len(movie_ids) - n_before} movies added, "
+          f"{len(movies) - (len(movie_ids) - n_before)} updated, {len(movie_ids)} in the catalog")
+
+
+def update_bundle(bundle_dir, featurizer, movies, tag_docs, k):
+    """Re-exports the bundle with the movies upserted; the SVD factors and popular lists are kept as they are."""
+    from artifacts import export_bundle, open_bundle
+    bundle = open_bundle(bundle_dir)
+    movie_ids = bundle.arrays['movie_ids'].tolist()
+    id_to_index = {movie_id: idx for idx, movie_id in enumerate(movie_ids)}
+    content_index = upsert_movies(bundle.content_index(), movie_ids, id_to_index, featurizer, movies, tag_docs, k)
+    n_added = len(movie_ids) - bundle.manifest['n_movies']
+    popularity = bundle.popularity()
+    if popularity is not None:
+        popularity = np.concatenate([popularity, np.zeros(n_added, dtype=popularity.dtype)])
+    manifest = export_bundle(
+        bundle_dir, bundle.svd_scorer().with_new_items(n_added), content_index, movie_ids,
+        upsert_rows(bundle.combined_data(), movies[['movieId', 'title', 'content', 'tmdbId']]),
+        bundle.popular_movies_data(), bundle.manifest['blending_alpha'], bundle.manifest['recommendation_top_n'],
+        popularity=popularity,
+    )
+    print(f"Wrote bundle {manifest['version']} to {bundle_dir}: {n_added} movies added, {len(movie_ids)} in the catalog")
+
+
+def main(argv=None):
+    import blueprints.recommendations as rec
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    add_parser = sub.add_parser('add', help='add new movies or update existing ones (matched by movieId)')
+    add_parser.add_argument('movies', help='CSV with movieId,title,genres and optionally tmdbId')
+    add_parser.add_argument('--tags', nargs='+', default=[os.path.join(rec.DATASET_DIR, 'tags.csv')],
+                            help='tags files the movies\' tag features are aggregated from')
+    add_parser.add_argument('--top-k', type=int, default=CONTENT_TOP_K, help='neighbours kept per movie')
+    add_parser.add_argument('--no-bundle', action='store_true', help='leave the bundle alone')
+    args = parser.parse_args(argv)
+
+    featurizer = ContentFeaturizer.load(rec.TRAINED_MODELS_DIR)
+    movies = read_new_movies(args.movies, rec.LINKS_DATASET_PATH)
+    tag_docs = aggregate_tags(load_tags(args.tags), movies['movieId'])
+    print(f"Featurizing {len(movies)} movies ({sum(map(bool, tag_docs))} with tags, {featurizer.n_features} features)")
+
+    legacy = os.path.exists(rec.CONTENT_INDEX_PATH) and os.path.exists(rec.MAPPING_DATA_PATH)
+    bundle = not args.no_bundle and os.path.exists(os.path.join(rec.MODEL_BUNDLE_DIR, rec.MANIFEST_NAME))
+    if not (legacy or bundle):
+        raise SystemExit(f"No content index in {rec.TRAINED_MODELS_DIR} or {rec.MODEL_BUNDLE_DIR}, run train.py first")
+    if legacy:
+        update_trained_models(rec.TRAINED_MODELS_DIR, featurizer, movies, tag_docs, args.top_k)
+    if bundle:
+        update_bundle(rec.MODEL_BUNDLE_DIR, featurizer, movies, tag_docs, args.top_k)
+    update_dataset(rec.DATASET_DIR, movies)
+    print("Running servers pick the new catalog up with MODEL_WATCH_INTERVAL set or POST /admin/model/reload")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+# content_index.py
+import hashlib
+
+import numpy as np
+from scipy import sparse
+
+# Neighbours kept per movie; memory is O(catalog * CONTENT_TOP_K) instead of O(catalog^2)
+CONTENT_TOP_K = 200
+
+
+def _topk_rows(block, k):
+    """Returns a boolean mask keeping the k largest values of each row of a dense block.
+
+    Ties at the cut-off keep the lowest column indices, which is the order a stable
+    descending sort over the catalog would pick them in.
+    """
+    n_cols = block.shape[1]
+    if k >= n_cols:
+        return np.ones(block.shape, dtype=bool)
+    threshold = -np.partition(-block, k - 1, axis=1)[:, k - 1][:, None]
+    keep = block > threshold
+    remaining = k - keep.sum(axis=1, keepdims=True)
+    ties = block == threshold
+    keep |= ties & (np.cumsum(ties, axis=1) <= remaining)
+    return keep
+
+
+def _topk_entries(block, k):
+    """(rows, cols, values) of the k largest non-zero values of each row, in row then column order."""
+    keep = _topk_rows(block, k) & (block != 0)
+    rows, cols = np.nonzero(keep)
+    return rows, cols, block[rows, cols]
+
+
+def build_topk_neighbors(similarity_rows, n_rows, k=CONTENT_TOP_K, block_size=512):
+    """Builds a float32 CSR matrix keeping the top-k neighbours of every movie.
+
+    `similarity_rows(start, stop)` returns the dense similarity rows for movies
+    [start, stop). Rows are produced block by block so the full N x N matrix is
+    never materialized.
+    """
+    data, indices, row_counts = [], [], []
+    for start in range(0, n_rows, block_size):
+        block = np.asarray(similarity_rows(start, min(start + block_size, n_rows)), dtype=np.float32)
+        rows, cols, values = _topk_entries(block, k)
+        data.append(values)
+        indices.append(cols.astype(np.int32))
+        row_counts.append(np.bincount(rows, minlength=block.shape[0]))
+    indptr = np.concatenate([[0], np.cumsum(np.concatenate(row_counts))]).astype(np.int64)
+    return sparse.csr_matrix((np.concatenate(data), np.concatenate(indices), indptr), shape=(n_rows, n_rows))
+
+
+class ContentIndex:
+    """Content-based similarity without a dense N x N cosine matrix.
+
+    `features` is the L2-normalized item-feature matrix (e.g. TF-IDF rows) in CSR
+    form, so the cosine similarity of every movie to a set of liked movies is a
+    sparse row-sum over the liked rows followed by one sparse product. That is
+    exactly the row-sum of the old dense matrix at O(nnz) memory. `neighbors`
+    keeps only the top-k neighbours per movie for neighbour lookups; it is not
+    used for scoring because truncating the long runs of tied genre
+    similarities changes the top-N rankings.
+    """
+
+    def __init__(self, features=None, neighbors=None, dense=None):
+        self.features = features
+        self.neighbors = neighbors
+        self.dense = dense # Legacy trained_content_model.npy, only when no sparse index was exported
+        self._version = None # Computed lazily from the features and neighbour lists
+
+    @classmethod
+    def from_features(cls, feature_matrix, k=CONTENT_TOP_K, block_size=512):
+        features = sparse.csr_matrix(feature_matrix, dtype=np.float32)
+        features_t = features.T.tocsc()
+        neighbors = build_topk_neighbors(
+            lambda start, stop: (features[start:stop] @ features_t).toarray(),
+            features.shape[0], k=k, block_size=block_size,
+        )
+        return cls(features=features, neighbors=neighbors)
+
+    @classmethod
+    def from_dense(cls, similarity_matrix, k=CONTENT_TOP_K, block_size=512):
+        """Wraps a (memory-mapped) dense similarity matrix exported by older notebooks."""
+        neighbors = build_topk_neighbors(
+            lambda start, stop: similarity_matrix[start:stop],
+            similarity_matrix.shape[0], k=k, block_size=block_size,
+        )
+        return cls(neighbors=neighbors, dense=similarity_matrix)
+
+    def upsert(self, positions, feature_rows, k=CONTENT_TOP_K, block_size=512):
+        """Returns a new index with the feature rows of some movies replaced or appended.
+
+        `feature_rows[i]` goes to `positions[i]`: the position of an existing movie
+        replaces its row, len(self), len(self) + 1, ... append movies in that order.
+        Only the upserted rows are multiplied with the feature matrix, so the cost
+        is O(upserted x catalog) plus one pass over the neighbour lists instead of
+        from_features' O(catalog^2). Their neighbour lists come out as a rebuild
+        would give them; the other movies' lists are merged with the new
+        similarities, which is exact for appended movies. When a changed movie
+        drops out of another movie's list, the neighbour a rebuild would move up
+        is not recovered, so that list stays approximate until the next full
+        rebuild (scores() reads the features and is always exact).
+        """
+        if self.features is None:
+            raise ValueError('Only an index with a feature matrix can be updated, rebuild it with train.py')
+        n_old = len(self)
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) == 0:
+            return self
+        rows = sparse.csr_matrix(feature_rows, dtype=np.float32)
+        if rows.shape != (len(positions), self.features.shape[1]):
+            raise ValueError(f'Got {rows.shape} feature rows for {len(positions)} positions '
+                             f'and {self.features.shape[1]} features')
+        if len(np.unique(positions)) != len(positions) or (positions < 0).any():
+            raise ValueError('Positions must be unique and non-negative')
+        n_new = n_old + int((positions >= n_old).sum())
+        if not np.array_equal(np.sort(positions[positions >= n_old]), np.arange(n_old, n_new)):
+            raise ValueError(f'New movies must take positions {n_old}, {n_old + 1}, ...')
+
+        source = np.arange(n_new)
+        source[positions] = n_old + np.arange(len(positions))
+        features = sparse.vstack([self.features, rows], format='csr')[source]
+        features_t = features.T.tocsc()
+        upserted = np.zeros(n_new, dtype=bool)
+        upserted[positions] = True
+
+        # Neighbour lists of the other movies, without the entries of movies whose features changed
+        old = self.neighbors.tocoo()
+        keep = ~(upserted[old.row] | upserted[old.col])
+        old_rows, old_cols, old_values = old.row[keep], old.col[keep], old.data[keep]
+        # A new similarity can only enter a full list if it reaches the list's current k-th value
+        threshold = np.full(n_old, -np.inf, dtype=np.float32)
+        full = np.bincount(old_rows, minlength=n_old) >= k
+        row_min = np.full(n_old, np.inf, dtype=np.float32)
+        np.minimum.at(row_min, old_rows, old_values)
+        threshold[full] = row_min[full]
+
+        own, reverse = [], []
+        for start in range(0, len(positions), block_size):
+            chunk = positions[start:start + block_size]
+            block = (features[chunk] @ features_t).toarray()
+            block_rows, cols, values = _topk_entries(block, k)
+            own.append((chunk[block_rows], cols, values))
+            # The same similarities seen from the other movies (cosine is symmetric)
+            block_rows, cols = np.nonzero(block)
+            values = block[block_rows, cols]
+            other = ~upserted[cols]
+            block_rows, cols, values = block_rows[other], cols[other], values[other]
+            enters = values >= threshold[cols]
+            reverse.append((cols[enters], chunk[block_rows[enters]], values[enters]))
+
+        rows_, cols_, values_ = (np.concatenate(parts) for parts in zip(*reverse))
+        touched = np.zeros(n_new, dtype=bool)
+        touched[rows_] = True
+        rows_ = np.concatenate([old_rows, rows_])
+        cols_ = np.concatenate([old_cols, cols_])
+        values_ = np.concatenate([old_values, values_])
+        merge = touched[rows_]
+        # Cut the lists that gained entries back to k: descending similarity, ties to the lowest column
+        order = np.flatnonzero(merge)[np.lexsort((cols_[merge], -values_[merge], rows_[merge]))]
+        sorted_rows = rows_[order]
+        rank = np.arange(len(order)) - np.searchsorted(sorted_rows, sorted_rows)
+        order = order[rank < k]
+
+        own_rows, own_cols, own_values = (np.concatenate(parts) for parts in zip(*own))
+        neighbors = sparse.csr_matrix(
+            (
+                np.concatenate([values_[~merge], values_[order], own_values]).astype(np.float32),
+                (np.concatenate([rows_[~merge], rows_[order], own_rows]),
+                 np.concatenate([cols_[~merge], cols_[order], own_cols])),
+            ),
+            shape=(n_new, n_new),
+        )
+        neighbors.sort_indices()
+        return ContentIndex(features=features, neighbors=neighbors)
+
+    def __len__(self):
+        return self.neighbors.shape[0]
+
+    @property
+    def version(self):
+        """Short fingerprint of the feature values and neighbour lists, so re-weighted features get a new version.
+
+        Arrays are hashed with fixed dtypes, so the same index loaded from the npz
+        file or from a bundle has the same version.
+        """
+        if self._version is None:
+            digest = hashlib.blake2b(digest_size=8)
+            for matrix in (self.features, self.neighbors):
+                if matrix is None:
+                    digest.update(b'none')
+                    continue
+                digest.update(repr(tuple(matrix.shape)).encode())
+                digest.update(np.ascontiguousarray(matrix.data, dtype=np.float32).tobytes())
+                digest.update(np.ascontiguousarray(matrix.indices, dtype=np.int64).tobytes())
+                digest.update(np.ascontiguousarray(matrix.indptr, dtype=np.int64).tobytes())
+            self._version = digest.hexdigest()
+        return self._version
+
+    def similarity_sum(self, indices, columns=None):
+        """Sum of the similarity rows of the given movies (the unnormalized content score).
+
+        `columns` limits the result to those movies (e.g. recommendation candidates).
+        """
+        if len(indices) == 0:
+            return np.zeros(len(self) if columns is None else len(columns))
+        if self.features is None:
+            rows = np.asarray(self.dense[indices], dtype=np.float64)
+            return (rows if columns is None else rows[:, columns]).sum(axis=0)
+        # Accumulate in float64 so incremental add/subtract matches a fresh sum
+        profile = np.asarray(self.features[indices].astype(np.float64).sum(axis=0)).ravel() # n_features
+        features = self.features if columns is None else self.features[columns]
+        return np.asarray(features @ profile, dtype=np.float64)
+
+    def scores(self, liked_indices, columns=None):
+        """Mean cosine similarity of every movie (or of the `columns` movies) to the liked movies."""
+        return self.similarity_sum(liked_indices, columns) / max(1, len(liked_indices))
+
+    def scores_batch(self, liked_rows):
+        """scores() for many users at once.
+
+        `liked_rows` is a (users x movies) 0/1 sparse matrix of liked movies; the
+        result is a dense (users x movies) array.
+        """
+        liked_rows = sparse.csr_matrix(liked_rows, dtype=np.float64)
+        counts = np.maximum(1, liked_rows.getnnz(axis=1))[:, None]
+        if self.features is None:
+            return np.asarray(liked_rows @ self.dense, dtype=np.float64) / counts
+        profiles = (liked_rows @ self.features).toarray() # users x n_features
+        return np.asarray(self.features @ profiles.T, dtype=np.float64).T / counts
+
+    def save(self, path):
+        arrays = {
+            'neighbors_data': self.neighbors.data,
+            'neighbors_indices': self.neighbors.indices,
+            'neighbors_indptr': self.neighbors.indptr,
+            'neighbors_shape': np.asarray(self.neighbors.shape),
+        }
+        if self.features is not None:
+            arrays.update({
+                'features_data': self.features.data,
+                'features_indices': self.features.indices,
+                'features_indptr': self.features.indptr,
+                'features_shape': np.asarray(self.features.shape),
+            })
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            def csr(prefix):
+                return sparse.csr_matrix(
+                    (arrays[f'{prefix}_data'], arrays[f'{prefix}_indices'], arrays[f'{prefix}_indptr']),
+                    shape=tuple(arrays[f'{prefix}_shape']),
+                )
+            features = csr('features') if 'features_data' in arrays else None
+            return cls(features=features, neighbors=csr('neighbors'))
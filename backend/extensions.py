@@ -18,5 +18,5 @@ def init_app_extensions(app):
     db.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth_bp.show_login' # 'blueprint_name.view_function_name'
-    cors.init_app(app, supports_credentials=True, origins=["http://localhost:5173"]) # Crucial for cookies/sessions
+    cors.init_app(app, supports_credentials=True, origins=["http://localhost:5173"], expose_headers=["Server-Timing"]) # Crucial for cookies/sessions
     migrate.init_app(app, db)
\ No newline at end of file
@@ -0,0 +1,207 @@
+# materialize.py
+"""Offline batch materialization of every active user's recommendations.
+
+    python materialize.py [--workers 4] [--chunk-size 256] [--top-m 50] [--force]
+
+Walks the users that have interactions in id order, CHUNK_SIZE users at a
+time, and ranks each chunk as (users x movies) matrix blocks with the loaded
+SVD model and content index. The top-M movie ids go into the
+materialized_recommendations table together with the recommender version and
+the user's (interaction count, latest interaction timestamp) stamp.
+/recommend/initial serves a row while both still match and recomputes otherwise.
+
+Every chunk is committed on its own and users whose row is already fresh are
+skipped, so an interrupted run is resumed by running it again; --force
+recomputes everything. --workers spreads the chunks over processes, each with
+its own app, assets (memory-mapped when loaded from the bundle) and DB connections.
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+MATERIALIZE_TOP_M = 50 # /recommend/initial serves the first recommendation_top_n
+MATERIALIZE_CHUNK_SIZE = 256 # Users per transaction
+MATERIALIZE_BLOCK_SIZE = 64 # Users scored at once; each block holds a few (block x catalog) float64 matrices
+
+_app = None
+
+
+def _get_app():
+    global _app
+    if _app is None:
+        from app import app
+        _app = app
+    return _app
+
+
+def _init_worker():
+    from extensions import db
+    with _get_app().app_context():
+        db.engine.dispose(close=False) # Connections inherited through fork belong to the parent
+
+
+def user_id_ranges(chunk_size):
+    """(first, last) user id of consecutive chunks of users with interactions, by keyset pagination."""
+    from extensions import db
+    from models import User
+    last = 0
+    while True:
+        ids = [user_id for (user_id,) in db.session.query(User.id).filter(
+            User.id > last, User.interactions.any()
+        ).order_by(User.id).limit(chunk_size)]
+        if not ids:
+            return
+        yield ids[0], ids[-1]
+        last = ids[-1]
+
+
+def _load_histories(first, last):
+    """{user_id: {movie_id: rating} oldest first} and {user_id: stamp} for users in [first, last]."""
+    from extensions import db
+    from models import UserInteraction
+    rows = db.session.query(
+        UserInteraction.user_id, UserInteraction.movie_id, UserInteraction.rating, UserInteraction.timestamp
+    ).filter(UserInteraction.user_id.between(first, last)).order_by(
+        UserInteraction.user_id, UserInteraction.timestamp, UserInteraction.id
+    ).all()
+    histories, latest = {}, {}
+    for user_id, movie_id, rating, timestamp in rows:
+        histories.setdefault(user_id, {})[movie_id] = rating
+        if timestamp is not None and (latest.get(user_id) is None or timestamp > latest[user_id]):
+            latest[user_id] = timestamp
+    return histories, {user_id: (len(history), latest.get(user_id)) for user_id, history in histories.items()}
+
+
+def _user_factors(user_ids, histories):
+    """(biases, factors) of the folded-in SVD users: the stored UserFactors, or a fresh fold-in of the history."""
+    from extensions import db
+    from models import UserFactors
+    import blueprints.recommendations as rec
+    model = rec.current_model()
+    scorer = model.svd_scorer
+    stored = {
+        row.user_id: row for row in db.session.query(UserFactors).filter(
+            UserFactors.user_id.in_(user_ids), UserFactors.model_version == scorer.version
+        )
+    }
+    biases = np.empty(len(user_ids))
+    factors = np.empty((len(user_ids), scorer.n_factors))
+    for i, user_id in enumerate(user_ids):
+        row = stored.get(user_id)
+        if row is not None:
+            biases[i], factors[i] = row.bias, np.frombuffer(row.factors, dtype=np.float64)
+            continue
+        # Same solve rebuild_user_factors() would store on the user's next request
+        indexed = [(model.movie_id_to_index_map[m], r) for m, r in histories[user_id].items() if m in model.movie_id_to_index_map]
+        gram, rhs = scorer.fold_in_history([idx for idx, _ in indexed], [r for _, r in indexed])
+        biases[i], factors[i] = scorer.fold_in_solve(gram, rhs)
+    return biases, factors
+
+
+def rank_block(user_ids, histories, top_m):
+    """Top-M catalog indices per user, ranked like generate_recommendations_from_user_history over the full catalog."""
+    import blueprints.recommendations as rec
+    from ranking import batch_top_n, blend_scores
+    from user_state import content_seed_movie_ids
+    model = rec.current_model()
+    id_to_index = model.movie_id_to_index_map
+    n_movies = len(model.movie_ids_list)
+    seed_rows, seed_cols, exclude = [], [], np.zeros((len(user_ids), n_movies), dtype=bool)
+    for i, user_id in enumerate(user_ids):
+        history = histories[user_id]
+        seeds = [id_to_index[m] for m in content_seed_movie_ids(history) if m in id_to_index]
+        seed_rows += [i] * len(seeds)
+        seed_cols += seeds
+        exclude[i, [id_to_index[m] for m in history if m in id_to_index]] = True
+    seeds = sparse.csr_matrix((np.ones(len(seed_rows)), (seed_rows, seed_cols)), shape=(len(user_ids), n_movies))
+
+    biases, factors = _user_factors(user_ids, histories)
+    final_scores = blend_scores(
+        model.svd_scorer.score_factors_batch(biases, factors), model.content_index.scores_batch(seeds), model.blending_alpha
+    )
+    return batch_top_n(final_scores, top_m, exclude)
+
+
+def materialize_range(first, last, top_m, force=False):
+    """Recomputes the stale rows of users in [first, last] and commits them; returns counts for the report."""
+    from extensions import db
+    from models import MaterializedRecommendation
+    import blueprints.recommendations as rec
+    start = time.perf_counter()
+    with _get_app().app_context():
+        model = rec.current_model() # Pinned for the whole chunk
+        histories, stamps = _load_histories(first, last)
+        existing = {
+            row.user_id: (row.model_version, row.n_interactions, row.latest_interaction)
+            for row in db.session.query(
+                MaterializedRecommendation.user_id, MaterializedRecommendation.model_version,
+                MaterializedRecommendation.n_interactions, MaterializedRecommendation.latest_interaction,
+            ).filter(MaterializedRecommendation.user_id.between(first, last))
+        }
+        todo = [
+            user_id for user_id in histories
+            if force or existing.get(user_id) != (model.version, *stamps[user_id])
+        ]
+        rows = []
+        for block_start in range(0, len(todo), MATERIALIZE_BLOCK_SIZE):
+            block = todo[block_start:block_start + MATERIALIZE_BLOCK_SIZE]
+            for user_id, top in zip(block, rank_block(block, histories, top_m)):
+                movie_ids = np.asarray(model.movie_ids_list, dtype=np.int64)[top] if len(top) else np.empty(0, dtype=np.int64)
+                rows.append({
+                    'user_id': user_id,
+                    'model_version': model.version,
+                    'n_interactions': stamps[user_id][0],
+                    'latest_interaction': stamps[user_id][1],
+                    'movie_ids': movie_ids.tobytes(),
+                })
+        if rows:
+            table = MaterializedRecommendation.__table__
+            db.session.execute(table.delete().where(table.c.user_id.in_([row['user_id'] for row in rows])))
+            db.session.execute(table.insert(), rows)
+            db.session.commit()
+    return {'users': len(histories), 'written': len(rows), 'seconds': time.perf_counter() - start}
+
+
+def run(workers, chunk_size, top_m, force):
+    app = _get_app()
+    with app.app_context():
+        ranges = list(user_id_ranges(chunk_size))
+    print(f"Materializing top {top_m} for users in {len(ranges)} chunks of up to {chunk_size} on {workers} process(es)")
+    totals = {'users': 0, 'written': 0}
+    start = time.perf_counter()
+
+    def report(done, first, last, result):
+        totals['users'] += result['users']
+        totals['written'] += result['written']
+        print(f"  [{done}/{len(ranges)}] users {first}-{last}: {result['written']}/{result['users']} recomputed "
+              f"in {result['seconds']:.2f}s")
+
+    if workers <= 1:
+        for done, (first, last) in enumerate(ranges, 1):
+            report(done, first, last, materialize_range(first, last, top_m, force))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(materialize_range, first, last, top_m, force) for first, last in ranges]
+            for done, ((first, last), future) in enumerate(zip(ranges, futures), 1):
+                report(done, first, last, future.result())
+    elapsed = time.perf_counter() - start
+    print(f"Done: {totals['written']} of {totals['users']} active users recomputed in {elapsed:.1f}s "
+          f"({totals['written'] / max(elapsed, 1e-9):.0f} users/s)")
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=1, help='processes computing chunks in parallel')
+    parser.add_argument('--chunk-size', type=int, default=MATERIALIZE_CHUNK_SIZE, help='users per transaction')
+    parser.add_argument('--top-m', type=int, default=MATERIALIZE_TOP_M, help='movies stored per user')
+    parser.add_argument('--force', action='store_true', help='recompute users whose row is still fresh')
+    args = parser.parse_args(argv)
+    run(args.workers, args.chunk_size, args.top_m, args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# metadata.py
+import pandas as pd
+
+
+class MovieMetadata:
+    """Movie metadata indexed once by movieId for building recommendation responses.
+
+    Replaces `combined_data[combined_data['movieId'] == movie_id].iloc[0]` (a full
+    scan per movie) with positional lists and a movieId -> position dict. Genres
+    are split once up front and every value is a plain Python type, so records
+    can go straight into jsonify.
+    """
+
+    def __init__(self, movie_ids, titles, tmdb_ids, genres):
+        self.movie_ids = [int(movie_id) for movie_id in movie_ids]
+        self.titles = [str(title) for title in titles]
+        self.tmdb_ids = [None if pd.isna(tmdb_id) else int(tmdb_id) for tmdb_id in tmdb_ids]
+        self.genres = [tuple(str(content).split(' ')) for content in genres]
+        self.position = {movie_id: pos for pos, movie_id in enumerate(self.movie_ids)}
+
+    @classmethod
+    def from_dataframe(cls, combined_data):
+        """Builds the table from combined_data.csv columns (movieId, title, content, tmdbId)."""
+        return cls(
+            combined_data['movieId'].tolist(),
+            combined_data['title'].tolist(),
+            combined_data['tmdbId'].tolist(),
+            combined_data['content'].tolist(),
+        )
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def __contains__(self, movie_id):
+        return movie_id in self.position
+
+    def get(self, movie_id):
+        """Returns (title, tmdb_id, genres) for a movie id, or None if it is not in the table."""
+        pos = self.position.get(movie_id)
+        if pos is None:
+            return None
+        return self.titles[pos], self.tmdb_ids[pos], self.genres[pos]
+
+    def records(self, movie_ids, resolve_posters, default_poster_url=None):
+        """Response dicts for a batch of movie ids, in order; ids missing from the table are skipped.
+
+        `resolve_posters(tmdb_ids)` returns {tmdb_id: url} and is called once per
+        batch. URLs are not kept here: the poster cache owns their expiry.
+        """
+        positions = []
+        for movie_id in movie_ids:
+            pos = self.position.get(int(movie_id))
+            if pos is None:
+                print(f"Movie ID {movie_id} not found in movie metadata, skipping it.")
+                continue
+            positions.append(pos)
+
+        tmdb_ids = [self.tmdb_ids[pos] for pos in positions if self.tmdb_ids[pos] is not None]
+        poster_urls = resolve_posters(tmdb_ids) if tmdb_ids else {}
+
+        return [
+            {
+                "movieId": self.movie_ids[pos],
+                "title": self.titles[pos],
+                "genres": list(self.genres[pos]),
+                "poster_url": poster_urls.get(self.tmdb_ids[pos]) or default_poster_url,
+            }
+            for pos in positions
+        ]
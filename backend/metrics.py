@@ -0,0 +1,209 @@
+# metrics.py
+"""In-process metrics for the recommender, exposed in Prometheus text format on /metrics.
+
+Counters, gauges and histograms are plain dicts behind a lock, so recording a
+value costs a couple of microseconds. Each worker process keeps its own values;
+Prometheus scrapes every worker (or sums them) as usual.
+
+    with stage('svd_scores'):
+        scores = ...
+
+times a block into moviescout_stage_seconds{stage="svd_scores"}. With PROFILE_HEADER=1
+a request carrying the `X-Profile: 1` header also gets the stages it went through
+in a Server-Timing response header, e.g.
+`Server-Timing: ingest;dur=1.20, rank;dur=0.41, total;dur=9.87` (milliseconds).
+That is for development only: any client could read per-stage timings, e.g. the
+bcrypt time of POST /login, which tells existing usernames from unknown ones.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+# Seconds; covers sub-millisecond scoring stages up to slow TMDB round trips
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_HEADER = 'X-Profile'
+PROFILE_HEADER_ENABLED = os.environ.get('PROFILE_HEADER', '0') == '1' # Opt-in, see the module docstring
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """[(suffix, label text, value)] for the exposition format."""
+        with self._lock:
+            return [('', _labels_text(self.labelnames, key), value) for key, value in sorted(self._values.items())]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Gauge set explicitly, or read from `function()` at scrape time (unlabelled gauges only)."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.function is not None:
+            value = self.function()
+            return [] if value is None else [('', '', value)]
+        return super().samples()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    samples.append(('_bucket', _labels_text(self.labelnames, key, f'le="{_number(bound)}"'), cumulative))
+                labels = _labels_text(self.labelnames, key)
+                samples.append(('_sum', labels, total))
+                samples.append(('_count', labels, cumulative))
+        return samples
+
+
+def render_metrics():
+    """Every registered metric in Prometheus text exposition format 0.0.4."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for suffix, labels, value in metric.samples():
+            lines.append(f"{metric.name}{suffix}{labels} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+# --- Metrics shared across modules ---
+REQUEST_SECONDS = Histogram('moviescout_request_seconds', 'Request latency by endpoint.', ['endpoint', 'method'])
+REQUESTS = Counter('moviescout_requests_total', 'Requests by endpoint and status code.', ['endpoint', 'method', 'status'])
+STAGE_SECONDS = Histogram('moviescout_stage_seconds', 'Time spent in each stage of request handling.', ['stage'])
+FALLBACKS = Counter('moviescout_fallbacks_total', 'Requests served by a fallback path.', ['path'])
+POSTER_CACHE = Counter('moviescout_poster_cache_total', 'Poster lookups served from / missing in the poster cache.', ['result'])
+TMDB_REQUESTS = Counter('moviescout_tmdb_requests_total', 'TMDB image lookups by outcome.', ['outcome'])
+MATERIALIZED = Counter('moviescout_materialized_total', 'Materialized recommendation lookups on /recommend/initial.', ['result'])
+USER_LOADS = Counter('moviescout_user_loads_total', 'Logged-in user lookups by where they were answered.', ['source'])
+LOGIN_THROTTLED = Counter('moviescout_login_throttled_total', 'Logins/signups turned away by the bcrypt limiter.', ['reason'])
+USER_STATE_CACHE = Counter('moviescout_user_state_cache_total', 'Per-user state lookups.', ['result'])
+ASSET_LOAD_SECONDS = Gauge('moviescout_asset_load_seconds', 'Duration of the last recommender asset load.', ['source'])
+ASSET_LOADS = Counter('moviescout_asset_loads_total', 'Recommender asset loads.', ['source'])
+MODEL_SWAPS = Counter('moviescout_model_swaps_total', 'Serving model set by the startup load, a reload or a rollback.', ['kind'])
+MODEL_RELOAD_FAILURES = Counter('moviescout_model_reload_failures_total', 'Reloads rejected by loading or validation.')
+
+
+@contextmanager
+def stage(name):
+    """Times the block into STAGE_SECONDS and, for profiled requests, the Server-Timing breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        if has_request_context():
+            timings = g.get('stage_timings')
+            if timings is not None:
+                timings.append((name, elapsed))
+
+
+def _start_request():
+    g.request_start = time.perf_counter()
+    if PROFILE_HEADER_ENABLED and request.headers.get(PROFILE_HEADER) not in (None, '', '0'):
+        g.stage_timings = []
+
+
+def _finish_request(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method)
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    timings = g.get('stage_timings')
+    if timings is not None:
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings]
+        entries.append(f"total;dur={elapsed * 1000:.2f}")
+        response.headers['Server-Timing'] = ', '.join(entries)
+    return response
+
+
+def init_app_metrics(app):
+    """Records per-request latency and adds the opt-in Server-Timing header."""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -0,0 +1,52 @@
+"""one interaction per user and movie
+
+Revision ID: 3c9a1f2b7d10
+Revises: 
+Create Date: 2026-10-18 09:30:00.000000
+
+Tables are created by db.create_all() in app.py, so this revision only adds what
+create_all cannot add to an existing database: the (user_id, movie_id) unique
+constraint used by the bulk upsert in /recommend. Duplicate rows left by the old
+per-row inserts (e.g. a like and a later dislike of the same movie) are collapsed
+to the most recent one first. Folded-in user factors were built from those
+duplicates, so they are dropped and rebuilt from history on next use.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9a1f2b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+CONSTRAINT_NAME = 'uq_user_interactions_user_movie'
+
+
+def _has_constraint():
+    inspector = sa.inspect(op.get_bind())
+    return any(
+        constraint['name'] == CONSTRAINT_NAME
+        for constraint in inspector.get_unique_constraints('user_interactions')
+    )
+
+
+def upgrade():
+    if _has_constraint():
+        return  # Database was created by create_all() with the current models
+
+    op.execute(
+        "DELETE FROM user_interactions WHERE id NOT IN ("
+        " SELECT MAX(id) FROM user_interactions GROUP BY user_id, movie_id)"
+    )
+    if sa.inspect(op.get_bind()).has_table('user_factors'):
+        op.execute("DELETE FROM user_factors")
+    with op.batch_alter_table('user_interactions') as batch_op:
+        batch_op.create_unique_constraint(CONSTRAINT_NAME, ['user_id', 'movie_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('user_interactions') as batch_op:
+        batch_op.drop_constraint(CONSTRAINT_NAME, type_='unique')
@@ -0,0 +1,37 @@
+"""materialized recommendations table
+
+Revision ID: 7b4e2d9c1a58
+Revises: 3c9a1f2b7d10
+Create Date: 2026-10-18 10:15:00.000000
+
+Holds the per-user top-M lists written by materialize.py. New databases get the
+table from db.create_all() in app.py; this revision adds it to existing ones.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b4e2d9c1a58'
+down_revision = '3c9a1f2b7d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('materialized_recommendations'):
+        return  # Created by create_all() with the current models
+    op.create_table(
+        'materialized_recommendations',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), primary_key=True),
+        sa.Column('model_version', sa.String(length=32), nullable=False),
+        sa.Column('n_interactions', sa.Integer(), nullable=False),
+        sa.Column('latest_interaction', sa.DateTime(), nullable=True),
+        sa.Column('movie_ids', sa.LargeBinary(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('materialized_recommendations')
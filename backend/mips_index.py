@@ -0,0 +1,199 @@
+# mips_index.py
+"""Approximate maximum-inner-product search (MIPS) over the SVD item vectors.
+
+    python mips_index.py build [--lists N] [--pq M] [--out PATH]
+
+A user's SVD estimate is global_mean + bu + [qi, bi] . [pu, 1], so ranking the
+catalog by SVD score is a MIPS problem over the augmented item vectors [qi, bi].
+Items get one extra coordinate sqrt(M^2 - |x|^2) (M = largest item norm), which
+puts them all on a sphere where the largest inner product is also the nearest
+neighbour, and are clustered with spherical k-means into an inverted file (IVF).
+A query scores the centroids, scans the items of the `nprobe` best lists and
+returns the best few hundred; the caller then scores those exactly. nprobe is
+the recall / latency knob. With --pq the scanned items are scored from 8-bit
+product-quantization codes instead of the full vectors, which shrinks the index
+file several times over; in NumPy the table lookups are not faster than the
+float32 product, so leave it off unless memory is the constraint.
+"""
+import argparse
+
+import numpy as np
+
+from ranking import top_n_indices
+
+MIPS_NPROBE = 16
+MIPS_CANDIDATES = 300
+KMEANS_ITERATIONS = 20
+KMEANS_TRAIN_PER_CLUSTER = 64 # k-means runs on a sample of at most this many points per cluster
+PQ_CENTROIDS = 256 # One byte per sub-vector
+
+
+def _assign(vectors, centroids, spherical, chunk_size=8192):
+    """Index of the closest centroid for every row, computed in chunks to bound memory."""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    centroid_norms = None if spherical else (centroids ** 2).sum(axis=1)
+    for start in range(0, len(vectors), chunk_size):
+        products = vectors[start:start + chunk_size] @ centroids.T
+        if spherical:
+            labels[start:start + chunk_size] = products.argmax(axis=1)
+        else:
+            labels[start:start + chunk_size] = (centroid_norms - 2 * products).argmin(axis=1)
+    return labels
+
+
+def kmeans(vectors, n_clusters, rng, n_iter=KMEANS_ITERATIONS, spherical=False):
+    """Lloyd's k-means on a sample of the rows; returns (centroids, labels of every row)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n_clusters = min(n_clusters, len(vectors))
+    sample_size = min(len(vectors), n_clusters * KMEANS_TRAIN_PER_CLUSTER)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = _assign(sample, centroids, spherical)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        filled = counts > 0 # Empty clusters keep their previous centroid
+        centroids[filled] = sums[filled] / counts[filled, None]
+        if spherical:
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids, _assign(vectors, centroids, spherical)
+
+
+class MIPSIndex:
+    """Inverted-file index over [qi, bi] returning SVD candidates for a user vector [pu, 1]."""
+
+    def __init__(self, centroids, list_offsets, list_items, vectors=None, pq_codebooks=None, pq_codes=None,
+                 model_version=None):
+        self.centroids = centroids # n_lists x d, probed by inner product with the query
+        self.list_offsets = list_offsets # Items of list l are list_items[list_offsets[l]:list_offsets[l + 1]]
+        self.list_items = list_items
+        self.vectors = vectors # Item vectors in list order, when not product-quantized
+        self.pq_codebooks = pq_codebooks # n_subspaces x PQ_CENTROIDS x sub_dim
+        self.pq_codes = pq_codes # uint8 codes in list order, n_items x n_subspaces
+        self.model_version = model_version # SVDScorer.version the index was built from
+
+    @staticmethod
+    def item_vectors(svd_scorer):
+        """[qi, bi] per movie; movies unknown to the model are zero vectors, like their SVD item terms."""
+        bi = svd_scorer.bi if svd_scorer.biased else np.zeros(len(svd_scorer.bi))
+        vectors = np.hstack([svd_scorer.qi, bi[:, None]])
+        return np.where(svd_scorer.known_items[:, None], vectors, 0.0).astype(np.float32)
+
+    @staticmethod
+    def query_vector(user_factors):
+        return np.append(np.asarray(user_factors, dtype=np.float32), np.float32(1.0))
+
+    @classmethod
+    def build(cls, svd_scorer, n_lists=None, pq_subspaces=0, seed=0):
+        vectors = cls.item_vectors(svd_scorer)
+        n_items, dim = vectors.shape
+        n_lists = n_lists or max(1, int(round(np.sqrt(n_items))))
+        rng = np.random.default_rng(seed)
+
+        # Map onto the unit sphere (see module docstring) and cluster by cosine
+        norms = np.linalg.norm(vectors, axis=1)
+        max_norm = max(float(norms.max()), 1e-12)
+        extra = np.sqrt(np.maximum(max_norm ** 2 - norms ** 2, 0.0))
+        sphere = np.hstack([vectors, extra[:, None]]) / max_norm
+        centroids, labels = kmeans(sphere, n_lists, rng, spherical=True)
+
+        order = np.argsort(labels, kind='stable').astype(np.int32)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(centroids)))]).astype(np.int64)
+        # A query [q, 1] has 0 in the extra coordinate, so only the first dim columns matter for probing
+        index = cls(centroids[:, :dim].astype(np.float32), list_offsets, order, model_version=svd_scorer.version)
+        if pq_subspaces:
+            index._train_pq(vectors[order], pq_subspaces, rng)
+        else:
+            index.vectors = vectors[order]
+        return index
+
+    def _train_pq(self, vectors, n_subspaces, rng):
+        dim = vectors.shape[1]
+        sub_dim = -(-dim // n_subspaces)
+        padded = np.zeros((len(vectors), sub_dim * n_subspaces), dtype=np.float32)
+        padded[:, :dim] = vectors
+        codebooks, codes = [], []
+        for s in range(n_subspaces):
+            centroids, labels = kmeans(padded[:, s * sub_dim:(s + 1) * sub_dim], PQ_CENTROIDS, rng)
+            book = np.zeros((PQ_CENTROIDS, sub_dim), dtype=np.float32)
+            book[:len(centroids)] = centroids
+            codebooks.append(book)
+            codes.append(labels.astype(np.uint8))
+        self.pq_codebooks = np.stack(codebooks)
+        self.pq_codes = np.stack(codes, axis=1)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.list_items)
+
+    def _scan_scores(self, positions, query):
+        if self.pq_codes is None:
+            return self.vectors[positions] @ query
+        n_subspaces, _, sub_dim = self.pq_codebooks.shape
+        padded = np.zeros(n_subspaces * sub_dim, dtype=np.float32)
+        padded[:len(query)] = query
+        # Asymmetric distance: one lookup table per subspace, then byte lookups per item
+        lut = np.einsum('skd,sd->sk', self.pq_codebooks, padded.reshape(n_subspaces, sub_dim))
+        return lut[np.arange(n_subspaces), self.pq_codes[positions]].sum(axis=1)
+
+    def search(self, query, n_candidates=MIPS_CANDIDATES, nprobe=MIPS_NPROBE, exclude_mask=None):
+        """Catalog indices of up to n_candidates items with the largest approximate [qi, bi] . query."""
+        query = np.asarray(query, dtype=np.float32)
+        probed = top_n_indices(self.centroids @ query, max(1, int(nprobe))) # Always scan at least one list
+        starts, stops = self.list_offsets[probed], self.list_offsets[probed + 1]
+        positions = np.concatenate([np.arange(start, stop) for start, stop in zip(starts, stops)])
+        items = self.list_items[positions]
+        if exclude_mask is not None:
+            keep = ~exclude_mask[items]
+            positions, items = positions[keep], items[keep]
+        top = top_n_indices(self._scan_scores(positions, query), n_candidates)
+        return items[top].astype(np.int64)
+
+    def save(self, path):
+        arrays = {
+            'centroids': self.centroids,
+            'list_offsets': self.list_offsets,
+            'list_items': self.list_items,
+            'model_version': np.asarray(self.model_version or ''),
+        }
+        if self.pq_codes is not None:
+            arrays.update({'pq_codebooks': self.pq_codebooks, 'pq_codes': self.pq_codes})
+        else:
+            arrays['vectors'] = self.vectors
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(
+                arrays['centroids'], arrays['list_offsets'], arrays['list_items'],
+                vectors=arrays['vectors'] if 'vectors' in arrays else None,
+                pq_codebooks=arrays['pq_codebooks'] if 'pq_codebooks' in arrays else None,
+                pq_codes=arrays['pq_codes'] if 'pq_codes' in arrays else None,
+                model_version=str(arrays['model_version']) or None,
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_parser = sub.add_parser('build', help='build the index for the currently trained SVD model')
+    build_parser.add_argument('--lists', type=int, help='number of IVF lists (default sqrt(catalog size))')
+    build_parser.add_argument('--pq', type=int, default=0, help='product-quantize item vectors into this many bytes')
+    build_parser.add_argument('--out', help='defaults to MIPS_INDEX_PATH')
+    args = parser.parse_args(argv)
+
+    import blueprints.recommendations as rec
+    rec.load_recommender_assets()
+    index = MIPSIndex.build(rec.current_model().svd_scorer, n_lists=args.lists, pq_subspaces=args.pq)
+    out = args.out or rec.MIPS_INDEX_PATH
+    index.save(out)
+    print(f"Wrote MIPS index ({len(index)} movies, {index.n_lists} lists{', PQ' if args.pq else ''}) to {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+# model_registry.py
+"""Versioned recommender models that can be swapped while the app keeps serving.
+
+A ModelSnapshot holds one consistent set of artifacts (SVD scorer, content
+index, id maps, metadata, popularity and MIPS indexes) and is never modified
+after loading. ModelRegistry.current is the snapshot new work starts with;
+a reload builds and validates the next snapshot off to the side and then
+replaces `current` with a single assignment, so a request that already
+picked up the old snapshot finishes with it. The replaced snapshots are kept
+(MODEL_HISTORY) for an instant rollback; their memory-mapped arrays stay
+readable even after the bundle directory was replaced on disk.
+
+ArtifactWatcher polls the artifact files and reloads when they change.
+"""
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+MODEL_HISTORY = 2 # Previous snapshots kept for rollback
+MODEL_WATCH_INTERVAL = 0 # Seconds between artifact checks; 0 leaves the watcher off
+
+
+class ModelValidationError(ValueError):
+    """Raised when a loaded artifact set is inconsistent; the current model keeps serving."""
+
+
+class ModelSnapshot:
+    """One loaded artifact set; build a new snapshot instead of changing this one."""
+
+    FIELDS = (
+        'version', # compute_recommender_version() of the scorer, content index and blend weight
+        'artifact_version', # Bundle version, None for the legacy files
+        'source', # 'bundle' or 'legacy'
+        'path',
+        'loaded_at',
+        'svd_model', 'svd_scorer', 'content_index', 'movies_data_df', 'combined_data', 'movie_metadata',
+        'popular_movies_data', 'movie_ids_list', 'movie_id_to_index_map', 'movie_id_index', 'mips_index',
+        'popularity_index', 'blending_alpha', 'recommendation_top_n',
+    )
+
+    def __init__(self, **fields):
+        missing = set(self.FIELDS) - set(fields)
+        if missing:
+            raise TypeError(f"ModelSnapshot is missing {', '.join(sorted(missing))}")
+        for name in self.FIELDS:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"ModelSnapshot is immutable, cannot set {name}")
+
+    def __repr__(self):
+        return f'<ModelSnapshot {self.version} from {self.source}>'
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'artifact_version': self.artifact_version,
+            'source': self.source,
+            'path': self.path,
+            'loaded_at': self.loaded_at.isoformat(timespec='seconds'),
+            'n_movies': len(self.movie_ids_list),
+            'mips_index': self.mips_index is not None,
+        }
+
+
+def validate_snapshot(snapshot):
+    """Checks that every part of the snapshot describes the same catalog; raises ModelValidationError."""
+    errors = []
+    movie_ids = snapshot.movie_ids_list
+    n_movies = len(movie_ids)
+    if n_movies == 0:
+        raise ModelValidationError('The catalog is empty')
+
+    if len(set(movie_ids)) != n_movies:
+        errors.append('movie_ids_list has duplicate ids')
+    id_to_index = snapshot.movie_id_to_index_map
+    if len(id_to_index) != n_movies or any(id_to_index.get(movie_id) != idx for idx, movie_id in enumerate(movie_ids)):
+        errors.append('movie_id_to_index_map does not match movie_ids_list')
+    id_index = snapshot.movie_id_index
+    ids = np.asarray(movie_ids, dtype=np.int64)
+    if ids.min() < 0 or ids.max() >= len(id_index) or not np.array_equal(id_index[ids], np.arange(n_movies)):
+        errors.append('movie_id_index does not match movie_ids_list')
+
+    scorer = snapshot.svd_scorer
+    if scorer.qi.shape != (n_movies, scorer.n_factors) or scorer.bi.shape != (n_movies,):
+        errors.append(f'SVD item factors {scorer.qi.shape} do not match {n_movies} movies')
+    elif not (np.isfinite(scorer.bi).all() and np.isfinite(scorer.qi).all()):
+        errors.append('SVD item factors contain NaN or inf')
+    if scorer.unknown_user_scores.shape != (n_movies,):
+        errors.append('SVD baseline scores do not match the catalog')
+
+    content = snapshot.content_index
+    if len(content) != n_movies:
+        errors.append(f'Content index has {len(content)} movies, the catalog {n_movies}')
+    elif content.neighbors is not None and content.neighbors.shape != (n_movies, n_movies):
+        errors.append(f'Content neighbours are {content.neighbors.shape}')
+    if content.features is not None and content.features.shape[0] != n_movies:
+        errors.append(f'Content features have {content.features.shape[0]} rows for {n_movies} movies')
+
+    if len(snapshot.popularity_index) != n_movies:
+        errors.append(f'Popularity index has {len(snapshot.popularity_index)} movies, the catalog {n_movies}')
+    if snapshot.mips_index is not None and (
+        len(snapshot.mips_index) > n_movies or snapshot.mips_index.model_version != scorer.version
+    ):
+        errors.append('MIPS index was built for a different model')
+    missing_metadata = sum(movie_id not in snapshot.movie_metadata for movie_id in movie_ids)
+    if missing_metadata:
+        errors.append(f'{missing_metadata} movies have no title/genre metadata')
+
+    if not 0.0 <= float(snapshot.blending_alpha) <= 1.0:
+        errors.append(f'Blend weight {snapshot.blending_alpha} is outside [0, 1]')
+    if int(snapshot.recommendation_top_n) < 1:
+        errors.append(f'recommendation_top_n is {snapshot.recommendation_top_n}')
+
+    if errors:
+        raise ModelValidationError('; '.join(errors))
+
+
+class ModelRegistry:
+    """Holds the serving ModelSnapshot and the ones it replaced.
+
+    `loader()` returns a new, not yet validated snapshot. One reload runs at a
+    time; `on_swap(old, new, kind)` callbacks run after every swap, with kind
+    'load' (nothing was serving yet), 'reload' or 'rollback', and
+    `on_failure(error)` after a reload that was rejected.
+    """
+
+    def __init__(self, loader, history=MODEL_HISTORY, validate=validate_snapshot, on_failure=None):
+        self.loader = loader
+        self.validate = validate
+        self.on_failure = on_failure
+        self.current = None
+        self._previous = deque(maxlen=history) # Most recently replaced last
+        self._reload_lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._on_swap = []
+        self.reloading = False
+        self.last_error = None
+        self.last_reload_s = None
+
+    def on_swap(self, callback):
+        self._on_swap.append(callback)
+        return callback
+
+    def _swap(self, snapshot, kind):
+        with self._swap_lock:
+            old = self.current
+            if old is not None and kind != 'rollback': # The rolled-back model is dropped, not kept for rollback
+                self._previous.append(old)
+            self.current = snapshot # Requests that already hold `old` keep using it
+        if old is None:
+            kind = 'load'
+        for callback in self._on_swap:
+            try:
+                callback(old, snapshot, kind)
+            except Exception as e:
+                print(f"Error in model swap callback {callback.__name__}: {e}")
+        return old
+
+    def reload(self):
+        """Loads, validates and swaps in a new snapshot; returns it. On failure the current one keeps serving."""
+        with self._reload_lock:
+            self.reloading = True
+            start = time.perf_counter()
+            try:
+                snapshot = self.loader()
+                self.validate(snapshot)
+            except Exception as e:
+                self.last_error = f'{type(e).__name__}: {e}'
+                if self.on_failure is not None:
+                    self.on_failure(e)
+                raise
+            finally:
+                self.reloading = False
+                self.last_reload_s = time.perf_counter() - start
+            self.last_error = None
+            self._swap(snapshot, 'reload')
+            return snapshot
+
+    def reload_in_background(self):
+        """Starts reload() on a daemon thread; False if a reload is already running."""
+        if self._reload_lock.locked():
+            return False
+
+        def run():
+            try:
+                snapshot = self.reload()
+                print(f"Swapped in recommender model {snapshot.version} from {snapshot.source}")
+            except Exception as e:
+                print(f"Model reload failed, still serving {self.current!r}: {e}")
+
+        threading.Thread(target=run, name='model-reload', daemon=True).start()
+        return True
+
+    def rollback(self):
+        """Makes the most recently replaced snapshot current again; returns it, or None when there is none."""
+        with self._reload_lock:
+            with self._swap_lock:
+                if not self._previous:
+                    return None
+                snapshot = self._previous.pop()
+            self._swap(snapshot, 'rollback')
+            return snapshot
+
+    def status(self):
+        return {
+            'current': self.current.describe() if self.current is not None else None,
+            'previous': [snapshot.describe() for snapshot in reversed(self._previous)],
+            'reloading': self.reloading,
+            'last_error': self.last_error,
+            'last_reload_s': None if self.last_reload_s is None else round(self.last_reload_s, 3),
+        }
+
+
+class ArtifactWatcher:
+    """Reloads the registry when `fingerprint()` (e.g. artifact mtimes) changes.
+
+    A change has to stay the same for one more poll before the reload starts,
+    so files still being written are not picked up halfway. None from
+    `fingerprint()` (artifacts missing, e.g. mid-export) is ignored.
+    """
+
+    def __init__(self, registry, fingerprint, interval=MODEL_WATCH_INTERVAL):
+        self.registry = registry
+        self.fingerprint = fingerprint
+        self.interval = interval
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Starts polling in this process; cheap to call again (forked workers start their own thread)."""
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='model-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        loaded = self.fingerprint()
+        pending = None
+        while not self._stop.wait(self.interval):
+            try:
+                seen = self.fingerprint()
+            except OSError:
+                continue
+            if seen is None or seen == loaded:
+                pending = None
+                continue
+            if seen != pending:
+                pending = seen # Changed since the last poll, wait until it settles
+                continue
+            print(f"Model artifacts changed on disk, reloading ({datetime.now():%H:%M:%S})")
+            try:
+                self.registry.reload()
+                print(f"Swapped in recommender model {self.registry.current.version}")
+            except Exception as e:
+                print(f"Model reload failed, still serving {self.registry.current!r}: {e}")
+            loaded, pending = seen, None # A broken export is not retried until the files change again
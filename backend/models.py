@@ -1,7 +1,20 @@
 # models.py
+import os
 from extensions import db, login_manager
+from flask import session
 from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
 from datetime import datetime
+from metrics import USER_LOADS
+from user_cache import (AuthenticatedUser, UserCache, USER_CACHE_SIZE, USER_CACHE_TTL, SESSION_IDENTITY_KEY,
+                        SESSION_IDENTITY_MAX_AGE, session_identity, store_session_identity)
+
+# Loaded users kept between requests (see user_cache.py); USER_CACHE_TTL=0 turns it off
+user_cache = UserCache(int(os.environ.get('USER_CACHE_SIZE', USER_CACHE_SIZE)), float(os.environ.get('USER_CACHE_TTL', USER_CACHE_TTL)))
+# Trust the identity in the signed session cookie instead of loading the user at all (opt-in)
+SESSION_IDENTITY = os.environ.get('SESSION_IDENTITY', '0') == '1'
+SESSION_IDENTITY_MAX_AGE = float(os.environ.get('SESSION_IDENTITY_MAX_AGE', SESSION_IDENTITY_MAX_AGE))
 
 class User(UserMixin, db.Model):
     __tablename__ = "users"
@@ -24,11 +37,66 @@ class User(UserMixin, db.Model):
 # User loader for Flask-Login (should be defined where db is available)
 @login_manager.user_loader # From extensions.py
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    user_id = int(user_id)
+    if SESSION_IDENTITY:
+        user = session_identity(session, user_id, user_cache, SESSION_IDENTITY_MAX_AGE)
+        if user is not None:
+            USER_LOADS.inc(source='session')
+            return user
+    user = user_cache.get(user_id)
+    if user is not None:
+        USER_LOADS.inc(source='cache')
+    else:
+        USER_LOADS.inc(source='db')
+        row = db.session.get(User, user_id)
+        if row is None:
+            return None
+        user = AuthenticatedUser.from_user(row)
+        user_cache.put(user)
+    if SESSION_IDENTITY:
+        stored = session.get(SESSION_IDENTITY_KEY)
+        if stored and stored.get('id') == user_id and stored.get('password_stamp') != user.password_stamp:
+            return None # Password changed since this session logged in
+        store_session_identity(session, user) # (Re-)issue it, trusted for another SESSION_IDENTITY_MAX_AGE
+    return user
+
+
+# Changed users are only dropped from the cache once the change is committed: invalidating at flush time
+# would let a concurrent request cache the old row again before the commit, and a rollback would still revoke
+_PENDING_INVALIDATIONS = 'user_cache_invalidations' # session.info key: user_id -> revoke_sessions
+
+
+def _invalidate_on_commit(target, revoke_sessions):
+    pending = object_session(target).info.setdefault(_PENDING_INVALIDATIONS, {})
+    pending[target.id] = pending.get(target.id, False) or revoke_sessions
+
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    password_changed = inspect(target).attrs.password.history.has_changes()
+    _invalidate_on_commit(target, revoke_sessions=password_changed)
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    _invalidate_on_commit(target, revoke_sessions=True)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_users(session):
+    for user_id, revoke_sessions in session.info.pop(_PENDING_INVALIDATIONS, {}).items():
+        user_cache.invalidate(user_id, revoke_sessions=revoke_sessions)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_users(session):
+    session.info.pop(_PENDING_INVALIDATIONS, None)
 
 
 class UserInteraction(db.Model):
     __tablename__ = 'user_interactions'
+    # One row per (user, movie); its index also serves every filter_by(user_id=...) lookup
+    __table_args__ = (db.UniqueConstraint('user_id', 'movie_id', name='uq_user_interactions_user_movie'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False) # Foreign key!
     movie_id = db.Column(db.Integer, nullable=False)
@@ -37,4 +105,33 @@ class UserInteraction(db.Model):
 
 
     def __repr__(self):
-        return f'<UserInteraction User:{self.user_id} Movie:{self.movie_id} Rating:{self.rating}>'
\ No newline at end of file
+        return f'<UserInteraction User:{self.user_id} Movie:{self.movie_id} Rating:{self.rating}>'
+
+
+class UserFactors(db.Model):
+    __tablename__ = 'user_factors'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    model_version = db.Column(db.String(32), nullable=False) # SVDScorer.version the factors were solved against
+    bias = db.Column(db.Float, nullable=False)
+    factors = db.Column(db.LargeBinary, nullable=False) # float64 user vector
+    gram = db.Column(db.LargeBinary, nullable=False) # float64 (k+1)x(k+1) normal-equation matrix
+    rhs = db.Column(db.LargeBinary, nullable=False) # float64 (k+1) normal-equation right-hand side
+    n_ratings = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return f'<UserFactors User:{self.user_id} Ratings:{self.n_ratings}>'
+
+
+class MaterializedRecommendation(db.Model):
+    __tablename__ = 'materialized_recommendations'
+    # Written by materialize.py; only served while the model and the user's history match the stamp
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    model_version = db.Column(db.String(32), nullable=False) # recommender_version the list was ranked with
+    n_interactions = db.Column(db.Integer, nullable=False)
+    latest_interaction = db.Column(db.DateTime, nullable=True)
+    movie_ids = db.Column(db.LargeBinary, nullable=False) # int64 top-M movie ids, best first
+    computed_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+    def __repr__(self):
+        return f'<MaterializedRecommendation User:{self.user_id} Version:{self.model_version}>'
\ No newline at end of file
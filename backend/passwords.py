@@ -0,0 +1,77 @@
+# passwords.py
+"""bcrypt hashing and checks off the request threads, with a bounded backlog (see PasswordHasher)."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_WORKERS = 2 # Threads hashing at once; each check keeps a core busy for ~0.3s
+BCRYPT_MAX_PENDING = 16 # Running + queued checks; further logins are turned away with a 429
+BCRYPT_TIMEOUT = 10 # Seconds a request waits for its check before giving up with a 503
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when BCRYPT_MAX_PENDING checks are already running or queued."""
+
+
+class PasswordHasher:
+    """Runs bcrypt on its own small thread pool so a login burst cannot take over the request workers.
+
+    bcrypt releases the GIL, so at most `max_workers` cores hash at any time and
+    the request threads serving recommendations keep theirs. Requests beyond
+    `max_pending` fail fast with PasswordHasherBusy instead of queueing up;
+    one whose check takes longer than `timeout` gets a TimeoutError (the check
+    itself still finishes and frees its slot). max_workers=0 hashes inline on
+    the request thread, as before.
+    """
+
+    def __init__(self, max_workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING, timeout=BCRYPT_TIMEOUT):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None # Created on first use so forked workers each start their own threads
+        self._counts = dict.fromkeys(('completed', 'rejected', 'timed_out'), 0)
+        self._pending = 0
+
+    def _run(self, function, *args):
+        if self.max_workers <= 0:
+            return function(*args)
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counts['rejected'] += 1
+            raise PasswordHasherBusy()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='bcrypt')
+            self._pending += 1
+        try:
+            future = self._executor.submit(function, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            with self._lock:
+                self._counts['timed_out'] += 1
+            raise
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+            self._counts['completed'] += _future is not None
+        self._slots.release()
+
+    def check(self, password, password_hash):
+        """True when `password` matches the stored bcrypt hash."""
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def hash(self, password):
+        return self._run(lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())).decode('utf-8')
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.max_workers, 'pending': self._pending, **self._counts}
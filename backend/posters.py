@@ -0,0 +1,215 @@
+# posters.py
+"""TMDB poster resolution with a persistent, bounded cache.
+
+    python posters.py warm [--top N]    # prefetch posters for popular movies and the top-scored catalog
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import POSTER_CACHE, TMDB_REQUESTS, stage
+
+POSTER_CACHE_MAX_ENTRIES = 50000
+POSTER_CACHE_TTL = 30 * 24 * 3600 # Poster paths rarely change
+POSTER_CACHE_NEGATIVE_TTL = 24 * 3600 # TMDB answered but has no usable image
+POSTER_CACHE_ERROR_TTL = 5 * 60 # Timeouts / 5xx: back off briefly instead of retrying on every request
+
+
+class PosterCache:
+    """SQLite-backed tmdb_id -> poster URL cache with TTL and LRU eviction.
+
+    A stored URL of NULL is a negative result. The file can be shared by every
+    worker on the host; WAL mode lets readers proceed while one worker writes.
+    """
+
+    def __init__(self, path, max_entries=POSTER_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS posters ("
+            " tmdb_id INTEGER PRIMARY KEY,"
+            " url TEXT,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_posters_accessed_at ON posters (accessed_at)")
+
+    def get_many(self, tmdb_ids):
+        """Returns {tmdb_id: url or None} for ids with an unexpired entry; misses are left out."""
+        tmdb_ids = list(tmdb_ids)
+        if not tmdb_ids:
+            return {}
+        now = time.time()
+        placeholders = ','.join('?' * len(tmdb_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT tmdb_id, url FROM posters WHERE tmdb_id IN ({placeholders}) AND expires_at > ?",
+                (*tmdb_ids, now),
+            ).fetchall()
+            if rows:
+                self._conn.executemany(
+                    "UPDATE posters SET accessed_at = ? WHERE tmdb_id = ?", [(now, row[0]) for row in rows]
+                )
+        return dict(rows)
+
+    def set_many(self, entries):
+        """Stores (tmdb_id, url_or_None, ttl_seconds) entries and evicts least recently used overflow."""
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO posters (tmdb_id, url, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    [(tmdb_id, url, now + ttl, now) for tmdb_id, url, ttl in entries],
+                )
+                overflow = self._conn.execute("SELECT COUNT(*) FROM posters").fetchone()[0] - self.max_entries
+                if overflow > 0:
+                    self._conn.execute(
+                        "DELETE FROM posters WHERE tmdb_id IN "
+                        "(SELECT tmdb_id FROM posters ORDER BY accessed_at LIMIT ?)",
+                        (overflow,),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM posters WHERE expires_at <= ?", (time.time(),))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM posters").fetchone()[0]
+
+
+class PosterResolver:
+    """Resolves TMDB ids to poster URLs through the cache, fetching misses concurrently."""
+
+    def __init__(self, api_key, images_base_url, cdn_base_url, cache, default_url,
+                 max_workers=8, timeout=3):
+        self.api_key = api_key
+        self.images_base_url = images_base_url
+        self.cdn_base_url = cdn_base_url
+        self.cache = cache
+        self.default_url = default_url
+        self.timeout = timeout
+        # One pooled session for all lookups instead of a new connection per requests.get
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tmdb')
+
+    @property
+    def enabled(self):
+        return bool(self.api_key and self.images_base_url and self.cdn_base_url)
+
+    def _fetch(self, tmdb_id):
+        """Asks TMDB for one movie's images; returns (tmdb_id, url_or_None, ttl)."""
+        url = f"{self.images_base_url}{tmdb_id}/images"
+        try:
+            response = self.session.get(url, params={'api_key': self.api_key}, timeout=self.timeout)
+            if response.status_code == 404:
+                TMDB_REQUESTS.inc(outcome='not_found')
+                return tmdb_id, None, POSTER_CACHE_NEGATIVE_TTL
+            response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            TMDB_REQUESTS.inc(outcome='error')
+            print(f"Error fetching TMDb image for TMDB ID {tmdb_id}: {e}")
+            return tmdb_id, None, POSTER_CACHE_ERROR_TTL
+
+        file_path = None
+        # Prioritize posters, then backdrops, then logos
+        for kind in ('posters', 'backdrops', 'logos'):
+            if data.get(kind):
+                file_path = data[kind][0].get('file_path')
+                break
+        if not file_path:
+            TMDB_REQUESTS.inc(outcome='no_image')
+            return tmdb_id, None, POSTER_CACHE_NEGATIVE_TTL
+        TMDB_REQUESTS.inc(outcome='ok')
+        return tmdb_id, f"{self.cdn_base_url}{file_path}", POSTER_CACHE_TTL
+
+    def resolve_many(self, tmdb_ids):
+        """Returns {tmdb_id: poster URL} for every id, using default_url when there is no image."""
+        tmdb_ids = list(dict.fromkeys(int(tmdb_id) for tmdb_id in tmdb_ids if tmdb_id is not None))
+        if not self.enabled:
+            return {tmdb_id: self.default_url for tmdb_id in tmdb_ids}
+
+        with stage('poster_cache'):
+            cached = self.cache.get_many(tmdb_ids)
+        misses = [tmdb_id for tmdb_id in tmdb_ids if tmdb_id not in cached]
+        POSTER_CACHE.inc(len(tmdb_ids) - len(misses), result='hit')
+        if misses:
+            POSTER_CACHE.inc(len(misses), result='miss')
+            with stage('tmdb'):
+                fetched = list(self._executor.map(self._fetch, misses))
+            self.cache.set_many(fetched)
+            cached.update({tmdb_id: url for tmdb_id, url, _ in fetched})
+        return {tmdb_id: cached.get(tmdb_id) or self.default_url for tmdb_id in tmdb_ids}
+
+    def resolve(self, tmdb_id):
+        if tmdb_id is None:
+            return self.default_url
+        return self.resolve_many([tmdb_id])[int(tmdb_id)]
+
+
+def warm(top_n, batch_size=200):
+    """Prefetches posters for popular_movies.csv and the catalog's top-scored movies."""
+    import numpy as np
+    import blueprints.recommendations as rec
+
+    rec.load_recommender_assets()
+    model = rec.current_model()
+    resolver = rec.get_poster_resolver()
+    if not resolver.enabled:
+        print("TMDB_API_KEY / TMDB_IMAGES_BASE_URL / TMDB_IMAGE_CDN_BASE_URL are not set, nothing to warm.")
+        return
+
+    # Popular movies first, then the best movies for a user the model knows nothing about
+    movie_ids = [int(movie_id) for movie_id in model.popular_movies_data['movieId']]
+    top_indices = np.argsort(-model.svd_scorer.unknown_user_scores, kind='stable')[:top_n]
+    movie_ids += [model.movie_ids_list[i] for i in top_indices]
+
+    tmdb_ids = []
+    for movie_id in dict.fromkeys(movie_ids):
+        info = model.movie_metadata.get(movie_id)
+        if info is not None and info[1] is not None:
+            tmdb_ids.append(info[1])
+
+    start = time.perf_counter()
+    found = 0
+    for batch_start in range(0, len(tmdb_ids), batch_size):
+        batch = resolver.resolve_many(tmdb_ids[batch_start:batch_start + batch_size])
+        found += sum(url != resolver.default_url for url in batch.values())
+    print(f"Warmed {len(tmdb_ids)} posters ({found} with images) in {time.perf_counter() - start:.1f}s, "
+          f"cache now holds {len(resolver.cache)} entries.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    warm_parser = sub.add_parser('warm', help='prefetch posters into the on-disk cache')
+    warm_parser.add_argument('--top', type=int, default=2000, help='how many top-scored catalog movies to prefetch')
+    args = parser.parse_args(argv)
+    if args.command == 'warm':
+        warm(args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+# prefetch.py
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+PREFETCH_WORKERS = 2
+PREFETCH_TTL = 30 # Seconds a precomputed page stays servable
+PREFETCH_MAX_QUEUE = 64 # Scheduled + running jobs; further requests are dropped
+PREFETCH_MAX_MISSED_SWIPES = 10 # Interactions the page may not have seen (one swipe batch is up to 10)
+PREFETCH_STORE_SIZE = 1024
+
+
+class PrefetchedPage:
+    def __init__(self, movie_ids, records, stamp_count, model_version=None, seq=0):
+        self.movie_ids = movie_ids
+        self.records = records
+        self.stamp_count = stamp_count # User's interaction count when the page was computed
+        self.model_version = model_version # Model the page was ranked with
+        self.seq = seq
+        self.created_at = time.monotonic()
+
+
+class PagePrefetcher:
+    """Computes each user's likely next recommendation page in the background.
+
+    After a response, `schedule` queues a job that runs `compute(user_id,
+    exclude_movie_ids)` on a bounded thread pool inside its own app context, so
+    every job gets its own SQLAlchemy session (Flask-SQLAlchemy scopes sessions
+    to the app context and removes them on teardown). `compute` returns
+    (movie_ids, records, stamp_count, model_version) or None. The next request
+    calls `take`, which only returns the stored page if it is fresh, was ranked
+    with the caller's model and none of its movies were interacted with since;
+    otherwise the caller computes the page inline.
+    Only the newest job per user is kept: a user with a job already queued just
+    updates its exclusions.
+    """
+
+    def __init__(self, compute, max_workers=PREFETCH_WORKERS, ttl=PREFETCH_TTL, max_queue=PREFETCH_MAX_QUEUE,
+                 max_missed_swipes=PREFETCH_MAX_MISSED_SWIPES, max_pages=PREFETCH_STORE_SIZE):
+        self.compute = compute
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.max_queue = max_queue
+        self.max_missed_swipes = max_missed_swipes
+        self.max_pages = max_pages
+        self._lock = threading.Lock()
+        self._executor = None # Created on first use so forked workers each start their own threads
+        self._pages = OrderedDict() # user_id -> PrefetchedPage
+        self._wanted = {} # user_id -> (seq, exclude_movie_ids) of the newest request
+        self._queued = set() # Users with a job submitted but not started
+        self._running = 0
+        self._seq = 0
+        self._counts = dict.fromkeys(
+            ('scheduled', 'dropped', 'computed', 'empty', 'errors', 'hits', 'misses', 'expired', 'invalidated', 'stale'), 0
+        )
+        self._compute_s = 0.0
+        self._served_age_s = 0.0
+        self._served_missed_swipes = 0
+
+    @property
+    def enabled(self):
+        return self.max_workers > 0
+
+    def schedule(self, app, user_id, exclude_movie_ids):
+        """Queues a background computation of the user's next page; never blocks the request."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._seq += 1
+            self._wanted[user_id] = (self._seq, list(exclude_movie_ids))
+            if user_id in self._queued:
+                return # The queued job reads the newest exclusions when it starts
+            if len(self._queued) + self._running >= self.max_queue:
+                self._counts['dropped'] += 1
+                self._wanted.pop(user_id, None)
+                return
+            self._queued.add(user_id)
+            self._counts['scheduled'] += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='prefetch')
+            executor = self._executor
+        executor.submit(self._run, app, user_id)
+
+    def _run(self, app, user_id):
+        with self._lock:
+            self._queued.discard(user_id)
+            request = self._wanted.pop(user_id, None)
+            if request is None:
+                return
+            self._running += 1
+        seq, exclude_movie_ids = request
+        start = time.perf_counter()
+        failed = False
+        try:
+            with app.app_context():
+                result = self.compute(user_id, exclude_movie_ids)
+        except Exception as e:
+            print(f"Error prefetching recommendations for user {user_id}: {e}")
+            result, failed = None, True
+        with self._lock:
+            self._running -= 1
+            self._compute_s += time.perf_counter() - start
+            if result is None:
+                self._counts['errors' if failed else 'empty'] += 1
+                return
+            self._counts['computed'] += 1
+            current = self._pages.get(user_id)
+            if current is not None and current.seq > seq:
+                return # A newer request's page finished first
+            self._pages[user_id] = PrefetchedPage(*result, seq=seq)
+            self._pages.move_to_end(user_id)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def take(self, user_id, interacted_movie_ids, stamp_count, model_version=None):
+        """Removes and returns the user's stored (movie_ids, records) if still valid, else None."""
+        with self._lock:
+            page = self._pages.pop(user_id, None)
+            if page is None:
+                self._counts['misses'] += 1
+                return None
+            age = time.monotonic() - page.created_at
+            missed_swipes = stamp_count - page.stamp_count
+            if age > self.ttl:
+                self._counts['expired'] += 1
+                return None
+            if any(movie_id in interacted_movie_ids for movie_id in page.movie_ids):
+                self._counts['invalidated'] += 1
+                return None
+            if missed_swipes > self.max_missed_swipes or page.model_version != model_version:
+                self._counts['stale'] += 1
+                return None
+            self._counts['hits'] += 1
+            self._served_age_s += age
+            self._served_missed_swipes += missed_swipes
+            return page.movie_ids, page.records
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._wanted.clear() # Queued jobs for these users find nothing to do
+
+    def stats(self):
+        """Queue depth, hit rate and staleness of served pages."""
+        with self._lock:
+            counts = dict(self._counts)
+            lookups = counts['hits'] + counts['misses'] + counts['expired'] + counts['invalidated'] + counts['stale']
+            finished = counts['computed'] + counts['empty'] + counts['errors']
+            return {
+                'enabled': self.enabled,
+                'workers': self.max_workers,
+                'queue_depth': len(self._queued),
+                'running': self._running,
+                'stored_pages': len(self._pages),
+                **counts,
+                'hit_rate': round(counts['hits'] / lookups, 4) if lookups else None,
+                'mean_compute_ms': round(self._compute_s / finished * 1000, 2) if finished else None,
+                'mean_served_age_s': round(self._served_age_s / counts['hits'], 3) if counts['hits'] else None,
+                'mean_served_missed_swipes': (
+                    round(self._served_missed_swipes / counts['hits'], 2) if counts['hits'] else None
+                ),
+            }
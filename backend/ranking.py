@@ -0,0 +1,76 @@
+# ranking.py
+import numpy as np
+
+
+def build_id_index(movie_ids):
+    """Dense movieId -> position array (-1 for ids not in the catalog), for vectorized lookups."""
+    movie_ids = np.asarray(movie_ids, dtype=np.int64)
+    id_index = np.full(int(movie_ids.max()) + 1 if len(movie_ids) else 0, -1, dtype=np.int32)
+    id_index[movie_ids] = np.arange(len(movie_ids), dtype=np.int32)
+    return id_index
+
+
+def lookup_indices(movie_ids, id_index):
+    """Positions of the given movie ids; ids outside the catalog are dropped."""
+    movie_ids = np.fromiter(movie_ids, dtype=np.int64)
+    movie_ids = movie_ids[(movie_ids >= 0) & (movie_ids < len(id_index))]
+    indices = id_index[movie_ids]
+    return indices[indices >= 0]
+
+
+def exclusion_mask(movie_ids, id_index, n_movies):
+    """Boolean mask over the catalog that is True for the given (e.g. already interacted) movie ids."""
+    mask = np.zeros(n_movies, dtype=bool)
+    mask[lookup_indices(movie_ids, id_index)] = True
+    return mask
+
+
+def blend_scores(svd_scores, content_scores, alpha):
+    """Hybrid score: alpha * SVD + (1 - alpha) * content. Works on single rows and (users x movies) matrices."""
+    return alpha * svd_scores + (1 - alpha) * content_scores
+
+
+def top_n_indices(scores, n, exclude_mask=None):
+    """Indices of the n highest scores, best first, skipping excluded positions.
+
+    Uses np.partition to find the cut-off in O(N) and only sorts the items at or
+    above it. Ties keep the lower index first, the same order
+    sorted(range(N), key=scores.__getitem__, reverse=True) produces.
+    """
+    scores = np.asarray(scores)
+    if exclude_mask is not None:
+        candidates = np.flatnonzero(~exclude_mask)
+        candidate_scores = scores[candidates]
+    else:
+        candidates = None
+        candidate_scores = scores
+
+    n = min(int(n), len(candidate_scores))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    cutoff = np.partition(candidate_scores, len(candidate_scores) - n)[len(candidate_scores) - n]
+    top = np.flatnonzero(candidate_scores >= cutoff)
+    top = top[np.argsort(-candidate_scores[top], kind='stable')][:n]
+    return top if candidates is None else candidates[top]
+
+
+def batch_top_n(score_matrix, n, exclude_masks=None):
+    """Row-wise top_n_indices for a (users x movies) score matrix; returns one index array per row."""
+    score_matrix = np.asarray(score_matrix)
+    if exclude_masks is not None:
+        score_matrix = np.where(exclude_masks, -np.inf, score_matrix)
+        n_allowed = (~np.asarray(exclude_masks)).sum(axis=1)
+    else:
+        n_allowed = np.full(score_matrix.shape[0], score_matrix.shape[1])
+
+    n_cols = score_matrix.shape[1]
+    n = min(int(n), n_cols)
+    if n <= 0:
+        return [np.empty(0, dtype=np.int64) for _ in range(score_matrix.shape[0])]
+    cutoffs = np.partition(score_matrix, n_cols - n, axis=1)[:, n_cols - n]
+    results = []
+    for row, cutoff, allowed in zip(score_matrix, cutoffs, n_allowed):
+        top = np.flatnonzero(row >= cutoff)
+        top = top[np.argsort(-row[top], kind='stable')][:min(n, allowed)]
+        results.append(top)
+    return results
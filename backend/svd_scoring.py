@@ -0,0 +1,196 @@
+# svd_scoring.py
+import hashlib
+import numpy as np
+
+# Ridge penalties for folding in app users; chosen defaults (strong enough for a handful of 1/5 swipes), not tuned
+FOLD_IN_REG_FACTORS = 10.0
+FOLD_IN_REG_BIAS = 2.0
+
+
+class SVDScorer:
+    """Vectorized replacement for calling svd_model.predict() once per movie.
+
+    The trained Surprise SVD's global mean, biases and factor matrices are pulled
+    out once and reordered to match movie_ids_list, so scoring the whole catalog
+    for a user is a single matrix-vector product. Results match
+    svd_model.predict(user, movie_id).est, including clipping to the rating
+    scale and the unknown-user / unknown-movie fallbacks.
+    """
+
+    def __init__(self, global_mean, bu, bi, pu, qi, user_raw_ids, rating_scale,
+                 biased=True, known_items=None, version=None):
+        self._version = version # Computed lazily from the item factors when not given
+        self.global_mean = float(global_mean)
+        self.bu = np.asarray(bu)
+        self.bi = np.asarray(bi)  # aligned with movie_ids_list, 0 for movies unknown to the model
+        self.pu = np.asarray(pu)
+        self.qi = np.asarray(qi)  # aligned with movie_ids_list, zero rows for unknown movies
+        self.rating_scale = (float(rating_scale[0]), float(rating_scale[1]))
+        self.biased = bool(biased)
+        if known_items is None:
+            known_items = np.ones(len(self.bi), dtype=bool)
+        self.known_items = np.asarray(known_items, dtype=bool)
+        self.user_raw_ids = np.asarray(user_raw_ids)
+        self.user_raw_to_inner = {raw_id: inner for inner, raw_id in enumerate(self.user_raw_ids.tolist())}
+
+        # Scores for a user the model has never seen; identical for every cold-start user
+        if self.biased:
+            baseline = self.global_mean + self.bi
+        else:
+            baseline = np.full(len(self.bi), self.global_mean)
+        self.unknown_user_scores = self._clip(baseline)
+
+    @classmethod
+    def from_surprise(cls, svd_model, movie_ids):
+        """Builds a scorer from a fitted surprise.SVD, with item rows ordered like movie_ids."""
+        trainset = svd_model.trainset
+        n_items = len(movie_ids)
+        n_factors = svd_model.qi.shape[1]
+
+        bi = np.zeros(n_items, dtype=np.float64)
+        qi = np.zeros((n_items, n_factors), dtype=np.float64)
+        known_items = np.zeros(n_items, dtype=bool)
+        for idx, movie_id in enumerate(movie_ids):
+            try:
+                inner_iid = trainset.to_inner_iid(movie_id)
+            except ValueError:
+                continue  # Movie has no ratings in the trainset; predict() treats it as unknown
+            bi[idx] = svd_model.bi[inner_iid]
+            qi[idx] = svd_model.qi[inner_iid]
+            known_items[idx] = True
+
+        user_raw_ids = [trainset.to_raw_uid(inner_uid) for inner_uid in range(trainset.n_users)]
+        return cls(
+            global_mean=trainset.global_mean,
+            bu=svd_model.bu,
+            bi=bi,
+            pu=svd_model.pu,
+            qi=qi,
+            user_raw_ids=user_raw_ids,
+            rating_scale=trainset.rating_scale,
+            biased=svd_model.biased,
+            known_items=known_items,
+        )
+
+    def with_new_items(self, n_items):
+        """A scorer with n_items movies appended that the model has no ratings for (scored like unknown movies).
+
+        Unknown movies never enter a fold-in or a MIPS candidate list, so the
+        version stays the same and stored UserFactors rows remain valid.
+        """
+        return SVDScorer(
+            global_mean=self.global_mean,
+            bu=self.bu,
+            bi=np.concatenate([self.bi, np.zeros(n_items)]),
+            pu=self.pu,
+            qi=np.vstack([self.qi, np.zeros((n_items, self.n_factors))]),
+            user_raw_ids=self.user_raw_ids,
+            rating_scale=self.rating_scale,
+            biased=self.biased,
+            known_items=np.concatenate([self.known_items, np.zeros(n_items, dtype=bool)]),
+            version=self.version,
+        )
+
+    @property
+    def n_factors(self):
+        return self.qi.shape[1]
+
+    @property
+    def version(self):
+        """Short fingerprint of the item side of the model, used to detect stale folded-in users.
+
+        Only the movies the model knows are hashed (with their positions), so
+        appending unknown movies to the catalog keeps the version.
+        """
+        if self._version is None:
+            known = np.flatnonzero(self.known_items)
+            digest = hashlib.blake2b(digest_size=8)
+            digest.update(known.astype(np.int64).tobytes())
+            digest.update(np.ascontiguousarray(self.qi[known]).tobytes())
+            digest.update(np.ascontiguousarray(self.bi[known]).tobytes())
+            digest.update(repr(self.global_mean).encode())
+            self._version = digest.hexdigest()
+        return self._version
+
+    def _clip(self, scores):
+        lower_bound, higher_bound = self.rating_scale
+        return np.clip(scores, lower_bound, higher_bound)
+
+    def inner_uid(self, user_id):
+        """Returns the model's inner id for a raw user id, or None for users unknown to the model."""
+        return self.user_raw_to_inner.get(user_id)
+
+    def score_factors(self, user_bias, user_factors, indices=None):
+        """Scores every movie (or only the movies at `indices`) for an explicit user bias and factor vector."""
+        qi, bi, known_items = self.qi, self.bi, self.known_items
+        if indices is not None:
+            qi, bi, known_items = qi[indices], bi[indices], known_items[indices]
+        if self.biased:
+            est = self.global_mean + user_bias + bi + qi @ user_factors
+            # predict() only adds the item terms for movies the model has seen
+            est = np.where(known_items, est, self.global_mean + user_bias)
+        else:
+            est = np.where(known_items, qi @ user_factors, self.global_mean)
+        return self._clip(est)
+
+    def score_factors_batch(self, user_biases, user_factors):
+        """score_factors for many users at once: (n_users,) biases and (n_users, k) factors -> (n_users, n_movies)."""
+        user_biases = np.asarray(user_biases, dtype=np.float64)[:, None]
+        if self.biased:
+            est = self.global_mean + user_biases + self.bi + np.asarray(user_factors) @ self.qi.T
+            est = np.where(self.known_items, est, self.global_mean + user_biases)
+        else:
+            est = np.where(self.known_items, np.asarray(user_factors) @ self.qi.T, self.global_mean)
+        return self._clip(est)
+
+    def score(self, user_id):
+        """Scores every movie for a raw user id, like svd_model.predict(user_id, movie_id).est."""
+        inner_uid = self.inner_uid(user_id)
+        if inner_uid is None:
+            return self.unknown_user_scores.copy()
+        return self.score_factors(self.bu[inner_uid], self.pu[inner_uid])
+
+    # --- Online fold-in for users the model was not trained on ---
+    # Item factors stay fixed and the user's bias and factors are the ridge
+    # regression solution of (r - global_mean - bi) on [qi, 1]. An unbiased
+    # model scores qi . pu alone, so there r is fit on [qi, 0]: the bias column
+    # only carries its penalty and solves to exactly 0. The normal equations are
+    # kept as running sums so each new rating is a rank-1 update followed by a
+    # (k+1)x(k+1) solve.
+
+    def fold_in_init(self, reg_factors=FOLD_IN_REG_FACTORS, reg_bias=FOLD_IN_REG_BIAS):
+        """Returns empty normal equations (gram, rhs) for a user with no ratings."""
+        penalty = np.full(self.n_factors + 1, float(reg_factors))
+        penalty[-1] = float(reg_bias)
+        return np.diag(penalty), np.zeros(self.n_factors + 1)
+
+    def fold_in_add(self, gram, rhs, movie_idx, rating, weight=1.0):
+        """Adds (weight=1) or removes (weight=-1) one rating from the normal equations in place."""
+        if not self.known_items[movie_idx]:
+            return  # The model has nothing to say about this movie
+        x = np.append(self.qi[movie_idx], 1.0 if self.biased else 0.0)
+        gram += weight * np.outer(x, x)
+        rhs += weight * (float(rating) - self._fold_in_offset(movie_idx)) * x
+
+    def fold_in_history(self, movie_indices, ratings, reg_factors=FOLD_IN_REG_FACTORS, reg_bias=FOLD_IN_REG_BIAS):
+        """Normal equations (gram, rhs) for a whole rating history, as fold_in_add over every rating would give."""
+        gram, rhs = self.fold_in_init(reg_factors, reg_bias)
+        movie_indices = np.asarray(movie_indices, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        known = self.known_items[movie_indices]
+        movie_indices, ratings = movie_indices[known], ratings[known]
+        x = np.hstack([self.qi[movie_indices], np.full((len(movie_indices), 1), 1.0 if self.biased else 0.0)])
+        gram += x.T @ x
+        rhs += x.T @ (ratings - self._fold_in_offset(movie_indices))
+        return gram, rhs
+
+    def _fold_in_offset(self, movie_indices):
+        """The part of the prediction that does not depend on the user: global_mean + bi, or 0 when unbiased."""
+        if not self.biased:
+            return np.zeros(np.shape(movie_indices))
+        return self.global_mean + self.bi[movie_indices]
+
+    def fold_in_solve(self, gram, rhs):
+        """Solves the normal equations and returns (user_bias, user_factors)."""
+        solution = np.linalg.solve(gram, rhs)
+        return float(solution[-1]), solution[:-1]
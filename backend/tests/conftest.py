@@ -0,0 +1,84 @@
+# tests/conftest.py
+"""Shared fixtures: a Flask app on an in-memory SQLite database and a small synthetic SVD model.
+
+Run from the backend folder with `python -m pytest tests`. Nothing here reads the
+trained artifacts, so the tests run without model/trained_models.
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR) # Backend modules are imported by name, like app.py does
+
+from flask import Flask, g
+
+from extensions import db, init_app_extensions
+from models import User
+from svd_scoring import SVDScorer
+
+
+def make_scorer(n_users=5, n_movies=40, n_factors=6, unknown=(3, 17), seed=0, biased=True):
+    """A random SVD model; the movies at `unknown` have no ratings in it."""
+    rng = np.random.default_rng(seed)
+    known_items = np.ones(n_movies, dtype=bool)
+    known_items[list(unknown)] = False
+    qi = rng.normal(scale=0.3, size=(n_movies, n_factors))
+    bi = rng.normal(scale=0.5, size=n_movies)
+    qi[~known_items], bi[~known_items] = 0.0, 0.0
+    return SVDScorer(
+        global_mean=3.5, bu=rng.normal(scale=0.3, size=n_users), bi=bi,
+        pu=rng.normal(scale=0.3, size=(n_users, n_factors)), qi=qi,
+        user_raw_ids=np.arange(1, n_users + 1), rating_scale=(0.5, 5.0), biased=biased, known_items=known_items,
+    )
+
+
+def make_model(scorer):
+    """The parts of a ModelSnapshot the fold-in code reads, for a catalog of movie ids 100, 101, ..."""
+    movie_ids = list(range(100, 100 + len(scorer.bi)))
+    return SimpleNamespace(
+        svd_scorer=scorer, movie_ids_list=movie_ids,
+        movie_id_to_index_map={movie_id: idx for idx, movie_id in enumerate(movie_ids)},
+    )
+
+
+def make_app(database_uri='sqlite://'):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=database_uri, SQLALCHEMY_TRACK_MODIFICATIONS=False,
+                      SECRET_KEY='test', TESTING=True)
+    init_app_extensions(app)
+    return app
+
+
+@pytest.fixture
+def scorer():
+    return make_scorer()
+
+
+@pytest.fixture
+def app():
+    app = make_app()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def user(app):
+    row = User(username='tester', password='not-a-hash')
+    db.session.add(row)
+    db.session.commit()
+    return row.id
+
+
+@pytest.fixture
+def model(app, scorer):
+    """Pins a minimal model on flask.g, which is where current_model() looks first."""
+    g.model = make_model(scorer)
+    return g.model
@@ -0,0 +1,140 @@
+# tests/test_auth.py
+"""The logged-in user cache, trusted session identities and the bounded bcrypt pool."""
+import threading
+import time
+
+import bcrypt
+import pytest
+
+import models
+import passwords
+from blueprints import auth
+from blueprints.auth import auth_bp
+from conftest import make_app
+from extensions import db
+from models import User
+from passwords import PasswordHasher, PasswordHasherBusy
+from user_cache import UserCache, session_identity, store_session_identity
+
+
+@pytest.fixture
+def user_cache(monkeypatch):
+    """A fresh cache in place of the worker's, used by the loader, the User events and logout."""
+    cache = UserCache(ttl=60)
+    monkeypatch.setattr(models, 'user_cache', cache)
+    monkeypatch.setattr(auth, 'user_cache', cache)
+    return cache
+
+
+def new_account():
+    row = User(username='tester', password=bcrypt.hashpw(b'secret', bcrypt.gensalt(4)).decode('utf-8'))
+    db.session.add(row)
+    db.session.commit()
+    return row
+
+
+@pytest.fixture
+def account(app):
+    return new_account()
+
+
+def change_password(account, password):
+    account.password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(4)).decode('utf-8')
+
+
+def test_password_change_revokes_older_session_identities(account, user_cache):
+    session = {}
+    store_session_identity(session, account)
+    assert session_identity(session, account.id, user_cache) is not None
+
+    change_password(account, 'flushed-only')
+    db.session.flush()
+    assert session_identity(session, account.id, user_cache) is not None # Not committed yet
+    db.session.rollback()
+    assert session_identity(session, account.id, user_cache) is not None # Rolled back: nothing changed
+
+    change_password(account, 'new-secret')
+    db.session.commit()
+    assert session_identity(session, account.id, user_cache) is None
+    time.sleep(0.01)
+    store_session_identity(session, account) # Logging in again after the change works
+    assert session_identity(session, account.id, user_cache) is not None
+
+
+def test_committed_change_drops_the_cached_user(account, user_cache):
+    user_cache.put(models.AuthenticatedUser.from_user(account))
+    account.username = 'renamed'
+    db.session.flush()
+    assert user_cache.get(account.id) is not None # Still the committed row until the commit
+    db.session.commit()
+    assert user_cache.get(account.id) is None
+
+
+def test_logout_drops_the_cache_entry(user_cache):
+    # Requests need their own app contexts, or Flask-Login's user would stay on the shared flask.g
+    app = make_app()
+    app.register_blueprint(auth_bp)
+    with app.app_context():
+        db.create_all()
+        user_id = new_account().id
+    client = app.test_client()
+    assert client.post('/login', json={'username': 'tester', 'password': 'secret'}).status_code == 200
+    assert client.get('/status').get_json()['is_logged_in']
+    assert user_cache.get(user_id) is not None
+
+    assert client.post('/logout').status_code == 200
+    assert user_cache.get(user_id) is None
+    assert not client.get('/status').get_json()['is_logged_in']
+
+
+@pytest.fixture
+def slow_bcrypt(monkeypatch):
+    """Makes bcrypt checks block until `release` is set; `started` counts the checks that began."""
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def checkpw(password, password_hash):
+        started.release()
+        release.wait(5)
+        return True
+
+    monkeypatch.setattr(passwords.bcrypt, 'checkpw', checkpw)
+    yield release, started
+    release.set()
+
+
+def test_hasher_turns_away_checks_beyond_max_pending(slow_bcrypt):
+    release, _ = slow_bcrypt
+    hasher = PasswordHasher(max_workers=1, max_pending=2, timeout=5)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(hasher.check('pw', 'hash'))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    wait_for_pending(hasher, 2) # One check running, the other queued behind it
+    with pytest.raises(PasswordHasherBusy):
+        hasher.check('pw', 'hash')
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == [True, True]
+    assert hasher.stats() == {'workers': 1, 'pending': 0, 'completed': 2, 'rejected': 1, 'timed_out': 0}
+    assert hasher.check('pw', 'hash') # Slots are free again
+
+
+def wait_for_pending(hasher, n):
+    deadline = time.monotonic() + 5
+    while hasher.stats()['pending'] != n:
+        assert time.monotonic() < deadline, f"{hasher.stats()['pending']} checks pending, expected {n}"
+        time.sleep(0.001)
+
+
+def test_hasher_gives_up_after_timeout(slow_bcrypt):
+    release, started = slow_bcrypt
+    hasher = PasswordHasher(max_workers=1, max_pending=2, timeout=0.05)
+    with pytest.raises(TimeoutError):
+        hasher.check('pw', 'hash')
+    assert hasher.stats()['timed_out'] == 1
+    assert started.acquire(timeout=5)
+    release.set() # The check itself still finishes and frees its slot
+    wait_for_pending(hasher, 0)
+    assert hasher.stats()['completed'] == 1
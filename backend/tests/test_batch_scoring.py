@@ -0,0 +1,189 @@
+# tests/test_batch_scoring.py
+"""ScoringBatcher must return exactly what score_top_direct would, on every path it can take."""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from batch_scoring import ScoringBatcher, score_top_direct
+from conftest import make_scorer
+
+N_TOP = 5
+
+
+class BlockingScorer:
+    """Wraps a scorer so a direct score_top call stays in flight until released."""
+
+    def __init__(self, scorer):
+        self.scorer = scorer
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def score_factors(self, bias, factors):
+        self.entered.set()
+        self.release.wait(5)
+        return self.scorer.score_factors(bias, factors)
+
+
+def user_query(scorer, user, exclude=()):
+    """(bias, factors, exclude_mask) for one of the scorer's trained users."""
+    exclude_mask = None
+    if len(exclude):
+        exclude_mask = np.zeros(len(scorer.bi), dtype=bool)
+        exclude_mask[list(exclude)] = True
+    return scorer.bu[user], scorer.pu[user], exclude_mask
+
+
+def assert_same_result(result, scorer, bias, factors, n, exclude_mask):
+    scores, top = result
+    expected_scores, expected_top = score_top_direct(scorer, bias, factors, n, exclude_mask)
+    np.testing.assert_allclose(scores, expected_scores, atol=1e-12)
+    np.testing.assert_array_equal(top, expected_top)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, 'timed out waiting for the batcher'
+        time.sleep(0.001)
+
+
+@pytest.fixture
+def held(monkeypatch):
+    """A batcher whose scoring thread only starts on `start()`, behind one request scoring on its own.
+
+    Requests made while `held` is active find another request in flight, so
+    they are queued, and stay queued until the thread starts: every test sees
+    the batch it set up, whatever the thread timing.
+    """
+    threads = []
+
+    class Held:
+        def __init__(self, **options):
+            options.setdefault('window_ms', 1000)
+            options.setdefault('timeout', 5)
+            self.batcher = ScoringBatcher(**options)
+            monkeypatch.setattr(self.batcher, '_ensure_thread', lambda: None)
+            self.blocker = BlockingScorer(make_scorer())
+            self.spawn(self.blocker, *user_query(self.blocker.scorer, 0))
+            self.blocker.entered.wait(5)
+
+        def spawn(self, scorer, bias, factors, exclude_mask=None, n=N_TOP):
+            box = {}
+            thread = threading.Thread(
+                target=lambda: box.setdefault('result', self.batcher.score_top(scorer, bias, factors, n, exclude_mask)),
+            )
+            thread.start()
+            threads.append(thread)
+            return box
+
+        def start(self):
+            monkeypatch.undo()
+            self.batcher._ensure_thread()
+
+        def finish(self):
+            self.blocker.release.set()
+            for thread in threads:
+                thread.join(5)
+            return self.batcher.stats()
+
+    return Held
+
+
+def test_disabled_batcher_scores_directly(scorer):
+    batcher = ScoringBatcher(window_ms=0)
+    bias, factors, exclude_mask = user_query(scorer, 1, exclude=[0, 1])
+    result = batcher.score_top(scorer, bias, factors, N_TOP, exclude_mask)
+    assert_same_result(result, scorer, bias, factors, N_TOP, exclude_mask)
+    assert batcher.stats()['direct'] == 0 # Not even counted, the batcher is off
+
+
+def test_request_alone_skips_the_queue(scorer):
+    batcher = ScoringBatcher(window_ms=1000)
+    bias, factors, exclude_mask = user_query(scorer, 1)
+    start = time.perf_counter()
+    result = batcher.score_top(scorer, bias, factors, N_TOP, exclude_mask)
+    assert time.perf_counter() - start < 0.5 # Did not wait out the window
+    assert_same_result(result, scorer, bias, factors, N_TOP, exclude_mask)
+    stats = batcher.stats()
+    assert (stats['direct'], stats['batches']) == (1, 0)
+
+
+def test_concurrent_requests_are_batched(held):
+    h = held()
+    scorer = make_scorer(seed=1)
+    queries = [user_query(scorer, 1), user_query(scorer, 2, exclude=[4, 5, 6]), user_query(scorer, 3, exclude=[7])]
+    boxes = [h.spawn(scorer, *query, n=n) for query, n in zip(queries, (N_TOP, 3, 10))]
+    wait_for(lambda: h.batcher._queue.qsize() == len(queries))
+    h.start()
+    stats = h.finish()
+    for box, query, n in zip(boxes, queries, (N_TOP, 3, 10)):
+        assert_same_result(box['result'], scorer, *query[:2], n, query[2])
+    assert (stats['batched'], stats['batches'], stats['mean_batch_size']) == (3, 1, 3.0)
+
+
+def test_batches_are_grouped_by_scorer(held):
+    h = held()
+    old_scorer, new_scorer = make_scorer(seed=1), make_scorer(seed=2) # Before and after a model reload
+    requests = [(old_scorer, user_query(old_scorer, 1)), (new_scorer, user_query(new_scorer, 1)),
+                (old_scorer, user_query(old_scorer, 2, exclude=[0]))]
+    boxes = [h.spawn(scorer, *query) for scorer, query in requests]
+    wait_for(lambda: h.batcher._queue.qsize() == len(requests))
+    h.start()
+    stats = h.finish()
+    for box, (scorer, query) in zip(boxes, requests):
+        assert_same_result(box['result'], scorer, *query[:2], N_TOP, query[2])
+    assert (stats['batched'], stats['single'], stats['batches']) == (2, 1, 2)
+
+
+def test_full_queue_scores_directly(held):
+    h = held(max_queue=1)
+    scorer = make_scorer(seed=1)
+    queued_query, overflow_query = user_query(scorer, 1), user_query(scorer, 2, exclude=[3])
+    queued = h.spawn(scorer, *queued_query)
+    wait_for(lambda: h.batcher._queue.full())
+    overflow = h.spawn(scorer, *overflow_query)
+    wait_for(lambda: 'result' in overflow) # Answered while the queue is still stuck
+    assert h.batcher.stats()['overflow'] == 1
+    assert_same_result(overflow['result'], scorer, *overflow_query[:2], N_TOP, overflow_query[2])
+    h.start()
+    h.finish()
+    assert_same_result(queued['result'], scorer, *queued_query[:2], N_TOP, queued_query[2])
+
+
+def test_slow_batch_falls_back_to_direct_scoring(held):
+    h = held(timeout=0.05)
+    scorer = make_scorer(seed=1)
+    query = user_query(scorer, 1)
+    box = h.spawn(scorer, *query) # The scoring thread never starts, so the batch never comes
+    wait_for(lambda: 'result' in box)
+    stats = h.finish()
+    assert (stats['timed_out'], stats['batches']) == (1, 0)
+    assert_same_result(box['result'], scorer, *query[:2], N_TOP, query[2])
+
+
+def test_concurrent_score_top_matches_direct():
+    scorer = make_scorer(n_users=16, n_movies=300, seed=3)
+    batcher = ScoringBatcher(window_ms=5, max_batch=4)
+    errors = []
+
+    def worker(thread_idx):
+        rng = np.random.default_rng(thread_idx)
+        for _ in range(25):
+            user = int(rng.integers(len(scorer.bu)))
+            query = user_query(scorer, user, exclude=rng.choice(300, size=20, replace=False))
+            n = int(rng.integers(1, 30))
+            try:
+                assert_same_result(batcher.score_top(scorer, *query[:2], n, query[2]), scorer, *query[:2], n, query[2])
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(idx,)) for idx in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert not errors, errors[0]
+    stats = batcher.stats()
+    assert stats['direct'] + stats['batched'] + stats['single'] + stats['overflow'] + stats['timed_out'] >= 200
@@ -0,0 +1,77 @@
+# tests/test_content_index.py
+"""ContentIndex.upsert against a full from_features rebuild."""
+import numpy as np
+import pytest
+from scipy import sparse
+
+from content_index import ContentIndex
+
+K = 6 # Far fewer neighbours than movies with equal genres, so the k-th value is usually tied
+
+
+def genre_features(n_movies, n_genres=8, seed=0):
+    """L2-normalized genre rows like the TF-IDF features; movies with the same genres tie exactly."""
+    rng = np.random.default_rng(seed)
+    rows = (rng.random((n_movies, n_genres)) < 0.3).astype(np.float32)
+    rows[rows.sum(axis=1) == 0, rng.integers(n_genres)] = 1.0
+    return sparse.csr_matrix(rows / np.linalg.norm(rows, axis=1, keepdims=True))
+
+
+def assert_same_matrix(actual, expected):
+    assert actual.shape == expected.shape
+    np.testing.assert_array_equal(actual.toarray(), expected.toarray())
+
+
+def test_ties_reach_the_kth_value():
+    features = genre_features(120)
+    kth = np.sort(ContentIndex.from_features(features, k=K).neighbors.toarray(), axis=1)[:, -K]
+    similarities = (features @ features.T).toarray()
+    # The fixture is only useful if many movies have more candidates at the k-th value than room for them
+    assert ((similarities >= kth[:, None]).sum(axis=1) > K).sum() > 60
+
+
+@pytest.mark.parametrize('block_size', [7, 512])
+def test_appended_movies_match_a_rebuild(block_size):
+    features = genre_features(120)
+    base = ContentIndex.from_features(features[:100], k=K, block_size=block_size)
+    upserted = base.upsert(np.arange(100, 120), features[100:], k=K, block_size=block_size)
+    rebuilt = ContentIndex.from_features(features, k=K)
+    assert_same_matrix(upserted.features, rebuilt.features)
+    assert_same_matrix(upserted.neighbors, rebuilt.neighbors) # Every list, including the old movies'
+    assert upserted.version == rebuilt.version
+
+
+def test_replaced_movies_get_exact_lists_and_features():
+    features = genre_features(120)
+    base = ContentIndex.from_features(features[:110], k=K)
+    changed = genre_features(120, seed=1)
+    positions = np.array([3, 50, 110, 111]) # Two replaced, two appended
+    expected_features = sparse.vstack([features[:110], features[110:112]], format='lil')
+    for position in positions:
+        expected_features[position] = changed[position]
+    expected_features = expected_features.tocsr()
+
+    upserted = base.upsert(positions, changed[positions], k=K, block_size=3)
+    rebuilt = ContentIndex.from_features(expected_features, k=K)
+    assert_same_matrix(upserted.features, rebuilt.features)
+    for position in positions:
+        assert_same_matrix(upserted.neighbors[position], rebuilt.neighbors[position])
+
+    # The other lists may miss a neighbour a rebuild would move up, but hold only true similarities, at most k
+    similarities = (rebuilt.features @ rebuilt.features.T).toarray()
+    neighbors = upserted.neighbors.tocoo()
+    np.testing.assert_array_equal(neighbors.data, similarities[neighbors.row, neighbors.col])
+    assert upserted.neighbors.getnnz(axis=1).max() <= K
+    assert upserted.version != base.version
+
+
+def test_upsert_checks_positions():
+    features = genre_features(20)
+    index = ContentIndex.from_features(features[:10], k=K)
+    assert index.upsert([], features[:0]) is index
+    with pytest.raises(ValueError, match='positions'):
+        index.upsert([11], features[10:11], k=K) # Skips position 10
+    with pytest.raises(ValueError, match='unique'):
+        index.upsert([2, 2], features[10:12], k=K)
+    with pytest.raises(ValueError):
+        index.upsert([10], features[10:12], k=K) # Two rows for one position
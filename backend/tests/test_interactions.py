@@ -0,0 +1,117 @@
+# tests/test_interactions.py
+"""One row per (user, movie): the bulk upsert in ingest_interactions and the migration that added the constraint."""
+import importlib.util
+import os
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+import blueprints.recommendations as rec
+from blueprints.recommendations import ingest_interactions
+from conftest import BACKEND_DIR
+from extensions import db
+from models import UserInteraction
+
+MIGRATION_PATH = os.path.join(BACKEND_DIR, 'migrations', 'versions', '3c9a1f2b7d10_unique_user_movie_interactions.py')
+
+
+def stored_ratings(user_id):
+    rows = UserInteraction.query.filter_by(user_id=user_id).all()
+    assert len(rows) == len({row.movie_id for row in rows}), 'duplicate (user, movie) rows'
+    return {row.movie_id: row.rating for row in rows}
+
+
+@pytest.fixture(params=['upsert', 'fallback'])
+def dialect_path(request, monkeypatch):
+    """Runs a test with the dialect's INSERT ... ON CONFLICT and with the plain insert/update fallback."""
+    if request.param == 'fallback':
+        monkeypatch.setattr(rec, '_UPSERT_BY_DIALECT', {})
+    return request.param
+
+
+def test_repeated_swipes_keep_one_row(app, user, dialect_path):
+    first = datetime(2026, 1, 1)
+    history, changes = ingest_interactions(user, [10, 11], [12], now=first)
+    db.session.commit()
+    assert sorted(changes) == [(10, None, 5.0), (11, None, 5.0), (12, None, 1.0)]
+
+    # Resubmitting the same batch (a retried request) changes nothing
+    history, changes = ingest_interactions(user, [10, 11], [12], history, now=datetime(2026, 1, 2))
+    db.session.commit()
+    assert changes == []
+    assert stored_ratings(user) == {10: 5.0, 11: 5.0, 12: 1.0}
+    assert UserInteraction.query.filter_by(user_id=user, movie_id=10).one().timestamp == first
+
+    # Flipping swipes updates the rows in place
+    later = datetime(2026, 1, 3)
+    history, changes = ingest_interactions(user, [12, 13], [10], history, now=later)
+    db.session.commit()
+    assert sorted(changes) == [(10, 5.0, 1.0), (12, 1.0, 5.0), (13, None, 5.0)]
+    assert stored_ratings(user) == {10: 1.0, 11: 5.0, 12: 5.0, 13: 5.0}
+    assert history == stored_ratings(user)
+    assert UserInteraction.query.filter_by(user_id=user, movie_id=12).one().timestamp == later
+
+
+def test_dislike_wins_within_a_batch(app, user, dialect_path):
+    _, changes = ingest_interactions(user, [20], [20])
+    db.session.commit()
+    assert changes == [(20, None, 1.0)]
+    assert stored_ratings(user) == {20: 1.0}
+
+
+def test_stale_history_is_checked_against_the_database(app, user, dialect_path):
+    ingest_interactions(user, [30], [])
+    db.session.commit()
+    # Another worker's cached history that has not seen the like yet
+    history, changes = ingest_interactions(user, [30, 31], [], history={})
+    db.session.commit()
+    assert changes == [(31, None, 5.0)]
+    assert history == stored_ratings(user) == {30: 5.0, 31: 5.0}
+
+
+def load_migration():
+    spec = importlib.util.spec_from_file_location('migration_3c9a1f2b7d10', MIGRATION_PATH)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    return migration
+
+
+def run_upgrade(connection):
+    with Operations.context(MigrationContext.configure(connection)):
+        load_migration().upgrade()
+
+
+def test_migration_collapses_duplicates_to_the_latest_row(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'old.sqlite3'}")
+    with engine.begin() as connection:
+        # The tables as create_all() made them before the unique constraint
+        connection.exec_driver_sql(
+            "CREATE TABLE user_interactions (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+            "movie_id INTEGER NOT NULL, rating FLOAT NOT NULL, timestamp DATETIME)"
+        )
+        connection.exec_driver_sql("CREATE TABLE user_factors (user_id INTEGER PRIMARY KEY, bias FLOAT)")
+        connection.exec_driver_sql(
+            "INSERT INTO user_interactions (id, user_id, movie_id, rating) VALUES "
+            "(1, 1, 10, 5.0), (2, 1, 11, 5.0), (3, 1, 10, 1.0), (4, 2, 10, 5.0), (5, 1, 10, 5.0), (6, 2, 12, 1.0), "
+            "(7, 2, 12, 5.0)"
+        )
+        connection.exec_driver_sql("INSERT INTO user_factors VALUES (1, 0.1), (2, 0.2)")
+        run_upgrade(connection)
+
+    with engine.begin() as connection:
+        rows = connection.exec_driver_sql(
+            "SELECT id, user_id, movie_id, rating FROM user_interactions ORDER BY id"
+        ).fetchall()
+        assert [tuple(row) for row in rows] == [(2, 1, 11, 5.0), (4, 2, 10, 5.0), (5, 1, 10, 5.0), (7, 2, 12, 5.0)]
+        # Factors folded in from the duplicates are rebuilt on next use
+        assert connection.exec_driver_sql("SELECT COUNT(*) FROM user_factors").scalar() == 0
+        with pytest.raises(sa.exc.IntegrityError):
+            connection.exec_driver_sql("INSERT INTO user_interactions (user_id, movie_id, rating) VALUES (1, 11, 1.0)")
+
+    # Running it again (or on a database create_all() made with the constraint) is a no-op
+    with engine.begin() as connection:
+        run_upgrade(connection)
+        assert connection.exec_driver_sql("SELECT COUNT(*) FROM user_interactions").scalar() == 4
@@ -0,0 +1,26 @@
+# tests/test_metadata.py
+"""MovieMetadata.records leaves poster expiry to the poster cache."""
+from metadata import MovieMetadata
+
+DEFAULT_URL = 'default.png'
+
+
+def test_records_ask_the_resolver_every_time():
+    metadata = MovieMetadata([1, 2, 3], ['A', 'B', 'C'], [10, float('nan'), 30], ['Drama', 'Comedy', 'Drama Comedy'])
+    posters = {10: 'a-old.jpg', 30: DEFAULT_URL}
+    calls = []
+
+    def resolve_posters(tmdb_ids):
+        calls.append(list(tmdb_ids))
+        return {tmdb_id: posters[tmdb_id] for tmdb_id in tmdb_ids}
+
+    records = metadata.records([3, 99, 1, 2], resolve_posters, DEFAULT_URL)
+    assert [(r['movieId'], r['poster_url']) for r in records] == [(3, DEFAULT_URL), (1, 'a-old.jpg'), (2, DEFAULT_URL)]
+    assert records[0]['genres'] == ['Drama', 'Comedy']
+
+    # The poster cache entry expired and was refetched with a new path
+    posters[10] = 'a-new.jpg'
+    assert metadata.records([1], resolve_posters, DEFAULT_URL)[0]['poster_url'] == 'a-new.jpg'
+    assert calls == [[30, 10], [10]]
+    assert metadata.records([2], resolve_posters, DEFAULT_URL)[0]['poster_url'] == DEFAULT_URL
+    assert len(calls) == 2 # Nothing to resolve without a tmdb id
@@ -0,0 +1,43 @@
+# tests/test_metrics.py
+"""/metrics and Server-Timing must not expose worker internals or stage timings to any client."""
+import pytest
+from flask import Flask, jsonify
+
+import metrics
+from blueprints import metrics as metrics_blueprint
+from metrics import init_app_metrics, stage
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    init_app_metrics(app)
+    app.register_blueprint(metrics_blueprint.metrics_bp)
+
+    @app.route('/login', methods=['POST'])
+    def login():
+        with stage('bcrypt'):
+            return jsonify({})
+
+    return app.test_client()
+
+
+def test_metrics_are_off_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(metrics_blueprint, 'METRICS_TOKEN', None)
+    assert client.get('/metrics').status_code == 404
+
+
+def test_metrics_need_the_token(client, monkeypatch):
+    monkeypatch.setattr(metrics_blueprint, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert b'moviescout_stage_seconds' in response.data
+    assert client.get('/metrics', headers={'X-Admin-Token': 'secret'}).status_code == 200
+
+
+def test_server_timing_is_opt_in(client, monkeypatch):
+    assert 'Server-Timing' not in client.post('/login', headers={'X-Profile': '1'}).headers
+    monkeypatch.setattr(metrics, 'PROFILE_HEADER_ENABLED', True)
+    assert 'bcrypt;dur=' in client.post('/login', headers={'X-Profile': '1'}).headers['Server-Timing']
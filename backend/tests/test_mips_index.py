@@ -0,0 +1,27 @@
+# tests/test_mips_index.py
+"""MIPSIndex.search against exact scoring of the augmented item vectors."""
+import numpy as np
+import pytest
+
+from conftest import make_scorer
+from mips_index import MIPSIndex
+
+
+@pytest.fixture
+def index_and_scorer():
+    scorer = make_scorer(n_movies=200, seed=4)
+    return MIPSIndex.build(scorer, n_lists=8), scorer
+
+
+def test_probing_every_list_is_exact(index_and_scorer):
+    index, scorer = index_and_scorer
+    query = MIPSIndex.query_vector(scorer.pu[0])
+    exact = np.argsort(-(MIPSIndex.item_vectors(scorer) @ query), kind='stable')[:10]
+    assert set(index.search(query, 10, nprobe=index.n_lists)) == set(exact)
+
+
+@pytest.mark.parametrize('nprobe', [0, -3])
+def test_nprobe_below_one_scans_one_list(index_and_scorer, nprobe):
+    index, scorer = index_and_scorer
+    query = MIPSIndex.query_vector(scorer.pu[1])
+    np.testing.assert_array_equal(index.search(query, 10, nprobe=nprobe), index.search(query, 10, nprobe=1))
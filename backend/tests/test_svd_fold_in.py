@@ -0,0 +1,185 @@
+# tests/test_svd_fold_in.py
+"""Incremental fold-in must give the same user factors as folding in the whole history again."""
+import threading
+import time
+
+import numpy as np
+import pytest
+from flask import g
+
+from blueprints.recommendations import ingest_interactions, rebuild_user_factors, update_user_factors
+from conftest import make_app, make_model, make_scorer
+from extensions import db
+from models import User, UserFactors, UserInteraction
+from svd_scoring import FOLD_IN_REG_FACTORS
+
+
+def solve_history(scorer, history):
+    """(bias, factors) folded in from a {catalog index: rating} map in one go."""
+    gram, rhs = scorer.fold_in_history(list(history), list(history.values()))
+    return scorer.fold_in_solve(gram, rhs)
+
+
+def test_fold_in_add_matches_history(scorer):
+    gram, rhs = scorer.fold_in_init()
+    history = {}
+    for idx, rating in [(0, 5.0), (1, 1.0), (2, 5.0), (3, 5.0), (4, 1.0), (5, 5.0)]:
+        scorer.fold_in_add(gram, rhs, idx, rating)
+        history[idx] = rating
+    # Un-rate one movie and re-rate another, as a removed or flipped swipe does
+    scorer.fold_in_add(gram, rhs, 2, 5.0, weight=-1.0)
+    del history[2]
+    scorer.fold_in_add(gram, rhs, 4, 1.0, weight=-1.0)
+    scorer.fold_in_add(gram, rhs, 4, 5.0)
+    history[4] = 5.0
+
+    expected_gram, expected_rhs = scorer.fold_in_history(list(history), list(history.values()))
+    np.testing.assert_allclose(gram, expected_gram, atol=1e-12)
+    np.testing.assert_allclose(rhs, expected_rhs, atol=1e-12)
+    bias, factors = scorer.fold_in_solve(gram, rhs)
+    expected_bias, expected_factors = solve_history(scorer, history)
+    assert abs(bias - expected_bias) < 1e-10
+    np.testing.assert_allclose(factors, expected_factors, atol=1e-10)
+
+
+def test_unbiased_fold_in_fits_what_is_scored():
+    # An unbiased model scores qi . pu, so fold-in is plain ridge regression of r on qi without a bias term
+    scorer = make_scorer(biased=False)
+    history = {0: 5.0, 1: 1.0, 4: 5.0, 9: 5.0, 12: 1.0}
+    gram, rhs = scorer.fold_in_init()
+    for idx, rating in history.items():
+        scorer.fold_in_add(gram, rhs, idx, rating)
+    bias, factors = scorer.fold_in_solve(gram, rhs)
+
+    qi, ratings = scorer.qi[list(history)], np.array(list(history.values()))
+    expected = np.linalg.solve(qi.T @ qi + FOLD_IN_REG_FACTORS * np.eye(scorer.n_factors), qi.T @ ratings)
+    assert bias == 0.0
+    np.testing.assert_allclose(factors, expected, atol=1e-10)
+    history_bias, history_factors = solve_history(scorer, history)
+    assert history_bias == 0.0
+    np.testing.assert_allclose(history_factors, expected, atol=1e-10)
+
+
+def test_fold_in_ignores_unknown_movies(scorer):
+    # Movie 3 is unknown to the model, so rating it changes nothing
+    np.testing.assert_array_equal(solve_history(scorer, {0: 5.0, 3: 1.0})[1], solve_history(scorer, {0: 5.0})[1])
+
+
+def test_update_user_factors_matches_rebuild(app, model, user):
+    ids = model.movie_ids_list
+    batches = [
+        ([ids[0], ids[1], ids[3]], [ids[5]]),
+        ([ids[7], 99999], [ids[8], ids[1]]), # Re-rates ids[1]; 99999 is not in the catalog
+        ([ids[5], ids[8]], []), # Re-rates both dislikes
+    ]
+    history = None
+    for liked, disliked in batches:
+        history, changes = ingest_interactions(user, liked, disliked, history)
+        update_user_factors(user, changes)
+        db.session.commit()
+
+    stored = db.session.get(UserFactors, user)
+    incremental_bias, incremental_factors = stored.bias, np.frombuffer(stored.factors, dtype=np.float64).copy()
+    assert stored.model_version == model.svd_scorer.version
+    assert stored.n_ratings == 7
+
+    rebuilt = rebuild_user_factors(user)
+    assert abs(incremental_bias - rebuilt.bias) < 1e-10
+    np.testing.assert_allclose(incremental_factors, np.frombuffer(rebuilt.factors, dtype=np.float64), atol=1e-10)
+
+    index = model.movie_id_to_index_map
+    expected_bias, expected_factors = solve_history(
+        model.svd_scorer, {index[movie_id]: rating for movie_id, rating in history.items() if movie_id in index}
+    )
+    assert abs(incremental_bias - expected_bias) < 1e-10
+    np.testing.assert_allclose(incremental_factors, expected_factors, atol=1e-10)
+
+
+def test_update_user_factors_rebuilds_for_another_model(app, model, user):
+    ids = model.movie_ids_list
+    _, changes = ingest_interactions(user, [ids[0], ids[2]], [ids[4]])
+    update_user_factors(user, changes)
+    db.session.get(UserFactors, user).model_version = 'older-model'
+    _, changes = ingest_interactions(user, [ids[6]], [])
+    stored = update_user_factors(user, changes) # Stale normal equations must not be reused
+
+    expected_bias, _ = solve_history(model.svd_scorer, {0: 5.0, 2: 5.0, 4: 1.0, 6: 5.0})
+    assert stored.model_version == model.svd_scorer.version
+    assert abs(stored.bias - expected_bias) < 1e-10
+
+
+@pytest.fixture
+def shared_db(tmp_path):
+    """An app on a SQLite file, so each thread's app context gets its own connection like a separate worker."""
+    app = make_app(f"sqlite:///{tmp_path / 'shared.sqlite3'}")
+    with app.app_context():
+        db.create_all()
+        user = User(username='tester', password='not-a-hash')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    yield app, make_model(make_scorer()), user_id
+    with app.app_context():
+        db.engine.dispose()
+
+
+def swipe_batch(app, model, user_id, liked, disliked, errors, folded=None, release=None):
+    """What POST /recommend does with a batch in one worker; waits for `release` before committing."""
+    try:
+        with app.app_context():
+            g.model = model
+            _, changes = ingest_interactions(user_id, liked, disliked)
+            update_user_factors(user_id, changes)
+            if folded is not None:
+                folded.set()
+                release.wait(5)
+            db.session.commit()
+    except Exception as e:
+        errors.append(e)
+
+
+def assert_factors_match_history(app, model, user_id):
+    with app.app_context():
+        stored = db.session.get(UserFactors, user_id)
+        history = {row.movie_id: row.rating for row in UserInteraction.query.filter_by(user_id=user_id)}
+        index = model.movie_id_to_index_map
+        expected_bias, expected_factors = solve_history(
+            model.svd_scorer, {index[movie_id]: rating for movie_id, rating in history.items() if movie_id in index}
+        )
+        assert stored.model_version == model.svd_scorer.version
+        assert stored.n_ratings == len(history)
+        assert abs(stored.bias - expected_bias) < 1e-10
+        np.testing.assert_allclose(np.frombuffer(stored.factors, dtype=np.float64), expected_factors, atol=1e-10)
+
+
+def run_overlapping(app, model, user_id, first, second):
+    """Runs two swipe batches in parallel, the second one starting after the first folded in but before it commits."""
+    errors, folded, release = [], threading.Event(), threading.Event()
+    threads = [
+        threading.Thread(target=swipe_batch, args=(app, model, user_id, *first, errors, folded, release)),
+        threading.Thread(target=swipe_batch, args=(app, model, user_id, *second, errors)),
+    ]
+    threads[0].start()
+    assert folded.wait(5)
+    threads[1].start()
+    time.sleep(0.2) # Let the second batch reach the user's lock
+    release.set()
+    for thread in threads:
+        thread.join(10)
+    assert not errors, errors[0]
+
+
+def test_parallel_batches_of_one_user_are_both_folded_in(shared_db):
+    app, model, user_id = shared_db
+    ids = model.movie_ids_list
+    swipe_batch(app, model, user_id, [ids[0], ids[1]], [ids[2]], [])
+    # Both workers see ids[5] as new, and both re-rate ids[2]; each must be counted once
+    run_overlapping(app, model, user_id, ([ids[5], ids[2]], [ids[6]]), ([ids[5], ids[7], ids[2]], [ids[0]]))
+    assert_factors_match_history(app, model, user_id)
+
+
+def test_parallel_first_fold_ins_do_not_collide(shared_db):
+    app, model, user_id = shared_db
+    ids = model.movie_ids_list
+    run_overlapping(app, model, user_id, ([ids[0], ids[1]], []), ([ids[1], ids[4]], [ids[8]]))
+    assert_factors_match_history(app, model, user_id)
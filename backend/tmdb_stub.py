@@ -0,0 +1,75 @@
+# tmdb_stub.py
+"""Local stand-in for the TMDB images API, for exercising the poster cache without network access.
+
+    python tmdb_stub.py --port 8765 --delay 0.05
+    TMDB_API_KEY=stub TMDB_IMAGES_BASE_URL=http://127.0.0.1:8765/3/movie/ \\
+        TMDB_IMAGE_CDN_BASE_URL=https://image.example/t/p/w500 python app.py
+
+Responses are deterministic: ids divisible by 7 are unknown (404), ids
+divisible by 5 have no images, every other id gets one poster.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_IMAGES_PATH = re.compile(r'^/3/movie/(\d+)/images$')
+
+
+def _handler(delay, stats):
+    class TMDBStubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with stats['lock']:
+                stats['requests'] += 1
+            if delay:
+                time.sleep(delay)
+            match = _IMAGES_PATH.match(self.path.split('?', 1)[0])
+            if not match:
+                return self._send(404, {'status_message': 'Not found'})
+            tmdb_id = int(match.group(1))
+            if tmdb_id % 7 == 0:
+                return self._send(404, {'status_message': 'The resource you requested could not be found.'})
+            if tmdb_id % 5 == 0:
+                return self._send(200, {'id': tmdb_id, 'posters': [], 'backdrops': [], 'logos': []})
+            return self._send(200, {'id': tmdb_id, 'posters': [{'file_path': f'/poster-{tmdb_id}.jpg'}]})
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return TMDBStubHandler
+
+
+class _StubServer(ThreadingHTTPServer):
+    request_queue_size = 128 # The default backlog of 5 resets connections under concurrent poster lookups
+
+
+def start_stub_server(port=0, delay=0.0):
+    """Serves the stub on a background thread; returns (server, images_base_url, stats)."""
+    stats = {'requests': 0, 'lock': threading.Lock()}
+    server = _StubServer(('127.0.0.1', port), _handler(delay, stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/3/movie/", stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to sleep before each response')
+    args = parser.parse_args()
+    server, base_url, _ = start_stub_server(args.port, args.delay)
+    print(f"TMDB stub listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
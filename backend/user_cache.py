@@ -0,0 +1,124 @@
+# user_cache.py
+"""Loading the logged-in user without a database round trip on every request.
+
+Flask-Login calls load_user() (models.py) for every @login_required request,
+and the routes only read the user's id and username. UserCache keeps a small
+AuthenticatedUser per user for a few seconds; it is dropped on logout and
+whenever a change to the User row is committed (SQLAlchemy events in models.py). Other workers
+see such a change after at most USER_CACHE_TTL seconds.
+
+With SESSION_IDENTITY=1 the username and a stamp of the password hash also go
+into Flask's signed session cookie at login, and the loader trusts them for
+SESSION_IDENTITY_MAX_AGE seconds without looking at the cache or database.
+After that the identity is checked against the database again (a changed
+password logs the session out) and re-issued. A password change made in this
+worker revokes older session identities immediately.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+
+USER_CACHE_SIZE = 4096
+USER_CACHE_TTL = 60 # Seconds; bounds how long another worker's change goes unnoticed
+SESSION_IDENTITY_MAX_AGE = 900 # Seconds a session identity is trusted before it is re-checked
+SESSION_IDENTITY_KEY = '_identity'
+
+
+def password_stamp(password_hash):
+    """Short fingerprint of a password hash; changes whenever the password does."""
+    return hashlib.blake2b(password_hash.encode('utf-8'), digest_size=6).hexdigest()
+
+
+class AuthenticatedUser(UserMixin):
+    """What the routes need of the logged-in user, detached from any DB session."""
+
+    def __init__(self, user_id, username, password_stamp):
+        self.id = user_id
+        self.username = username
+        self.password_stamp = password_stamp
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, password_stamp(user.password))
+
+    def get_id(self):
+        return str(self.id)
+
+    def __repr__(self):
+        return f'<AuthenticatedUser {self.username}>'
+
+
+class UserCache:
+    """Thread-safe LRU of user_id -> AuthenticatedUser whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._users = OrderedDict() # user_id -> (AuthenticatedUser, expires_at)
+        self._revoked = {} # user_id -> time of the last password change seen by this worker
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            return entry[0]
+
+    def put(self, user):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._users[user.id] = (user, time.monotonic() + self.ttl)
+            self._users.move_to_end(user.id)
+            while len(self._users) > self.maxsize:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id, revoke_sessions=False):
+        """Drops the cached user; `revoke_sessions` also rejects session identities issued before now."""
+        with self._lock:
+            self._users.pop(user_id, None)
+            if revoke_sessions:
+                self._revoked[user_id] = time.time()
+
+    def revoked_after(self, user_id, issued_at):
+        return self._revoked.get(user_id, 0) >= issued_at
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    def __len__(self):
+        return len(self._users)
+
+
+def store_session_identity(session, user):
+    """Puts the user's identity in the signed session; call right after login_user()."""
+    session[SESSION_IDENTITY_KEY] = {
+        'id': user.id,
+        'username': user.username,
+        'password_stamp': password_stamp(user.password) if hasattr(user, 'password') else user.password_stamp,
+        'issued_at': time.time(),
+    }
+
+
+def session_identity(session, user_id, user_cache, max_age=SESSION_IDENTITY_MAX_AGE):
+    """The AuthenticatedUser carried by the session, or None when it is missing, expired or revoked."""
+    identity = session.get(SESSION_IDENTITY_KEY)
+    if not identity or identity.get('id') != user_id:
+        return None
+    issued_at = identity.get('issued_at', 0)
+    if time.time() - issued_at > max_age or user_cache.revoked_after(user_id, issued_at):
+        return None
+    return AuthenticatedUser(user_id, identity['username'], identity['password_stamp'])
@@ -0,0 +1,132 @@
+# user_state.py
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+USER_STATE_CACHE_SIZE = 256 # Each state holds a few catalog-sized vectors (~170 KB for 9.7k movies)
+
+LIKE_RATING = 5.0
+DISLIKE_RATING = 1.0
+CONTENT_SEED_COUNT = 5
+
+
+def content_seed_movie_ids(history, n=CONTENT_SEED_COUNT):
+    """The latest n liked movies, topped up with the latest dislikes; `history` is {movie_id: rating}, oldest first.
+
+    /recommend/initial (and the batch job that precomputes it) takes content scores from these movies.
+    """
+    seeds = [movie_id for movie_id, rating in reversed(history.items()) if rating == LIKE_RATING][:n]
+    if len(seeds) < n:
+        seeds += [movie_id for movie_id, rating in reversed(history.items()) if rating == DISLIKE_RATING][:n - len(seeds)]
+    return seeds
+
+
+class UserState:
+    """Everything the recommender needs about one user, kept between requests.
+
+    The content score sum over all liked movies is maintained incrementally: a new
+    like adds that movie's similarity row, a like turned into a dislike subtracts
+    it. The SVD score vector and the user's folded-in factors are cached until
+    the factors change. `stamp` is (interaction count, latest interaction
+    timestamp) and lets a worker detect writes made by other workers with one
+    aggregate query. `model_version` is the ModelSnapshot the vectors were
+    computed with (see model_registry.py).
+    """
+
+    def __init__(self, user_id, history, stamp, content_index, id_to_index, model_version=None):
+        self.user_id = user_id
+        self.history = dict(history) # movie_id -> rating, oldest first
+        self.stamp = stamp
+        self.model_version = model_version
+        self.interacted = np.zeros(len(content_index), dtype=bool)
+        self.content_sum = np.zeros(len(content_index))
+        self.n_liked_indexed = 0 # Liked movies that contribute to content_sum
+        self.svd_scores = None
+        self.svd_factors = None # (bias, factors) of the folded-in user, for MIPS retrieval
+        self.lock = threading.Lock() # Serializes concurrent swipe batches from the same user
+        self._content_index = content_index
+        self._id_to_index = id_to_index
+
+        liked_indices = []
+        for movie_id, rating in self.history.items():
+            idx = id_to_index.get(movie_id)
+            if idx is None:
+                continue
+            self.interacted[idx] = True
+            if rating == LIKE_RATING:
+                liked_indices.append(idx)
+        if liked_indices:
+            self.content_sum += content_index.similarity_sum(liked_indices)
+            self.n_liked_indexed = len(liked_indices)
+
+    @property
+    def liked_movie_ids(self):
+        return [movie_id for movie_id, rating in self.history.items() if rating == LIKE_RATING]
+
+    def recent_movie_ids(self, rating):
+        """Movie ids with the given rating, most recent first."""
+        return [movie_id for movie_id, r in reversed(self.history.items()) if r == rating]
+
+    def content_scores(self, indices=None):
+        """Mean similarity to all liked movies, same as get_content_scores(liked_movie_ids[, indices])."""
+        content_sum = self.content_sum if indices is None else self.content_sum[indices]
+        return content_sum / max(1, self.n_liked_indexed)
+
+    def apply_changes(self, changes, stamp):
+        """Folds (movie_id, old_rating, new_rating) changes already written to the DB into the state."""
+        added, removed = [], []
+        for movie_id, old_rating, new_rating in changes:
+            self.history.pop(movie_id, None)
+            self.history[movie_id] = new_rating # Re-insert so the dict stays in recency order
+            idx = self._id_to_index.get(movie_id)
+            if idx is None:
+                continue
+            self.interacted[idx] = True
+            if old_rating == LIKE_RATING and new_rating != LIKE_RATING:
+                removed.append(idx)
+            elif new_rating == LIKE_RATING and old_rating != LIKE_RATING:
+                added.append(idx)
+        if added:
+            self.content_sum += self._content_index.similarity_sum(added)
+        if removed:
+            self.content_sum -= self._content_index.similarity_sum(removed)
+        self.n_liked_indexed += len(added) - len(removed)
+        if changes:
+            self.svd_scores = None # Factors were re-solved
+            self.svd_factors = None
+        self.stamp = stamp
+
+
+class UserStateCache:
+    """Thread-safe LRU map of user_id -> UserState with a size bound."""
+
+    def __init__(self, maxsize=USER_STATE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is not None:
+                self._states.move_to_end(user_id)
+            return state
+
+    def put(self, state):
+        with self._lock:
+            self._states[state.user_id] = state
+            self._states.move_to_end(state.user_id)
+            while len(self._states) > self.maxsize:
+                self._states.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._states.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+    def __len__(self):
+        return len(self._states)
@@ -0,0 +1,239 @@
+# evaluate.py
+"""Offline evaluation of the hybrid recommender: precision, recall, NDCG and coverage at several K.
+
+    python evaluate.py                                   # ALPHA 0.0..1.0, K = 5 10 20, on every core
+    python evaluate.py --alphas 0.4 0.6 0.8 --k 5 10 --jobs 4 --out eval.json
+    python evaluate.py --svd-model trained_models/trained_svd.joblib   # skip the refit (model saw the test split)
+
+Ratings are split 80/20 like the notebook and grouped once into user x movie
+sparse matrices. Users are scored in batches with the backend's own code
+(SVDScorer, ContentIndex, blend_scores, batch_top_n), so SVD and content scores
+are computed once per batch as matrix products and every ALPHA is evaluated
+from them in the same pass. User batches are spread over a process pool.
+
+By default the SVD is refit on the training split with the best parameters from
+train.py's last run, and test users are folded in from their training ratings
+the way the backend folds in app users (--users trained uses the fitted user
+factors instead). A movie counts as liked / relevant at --like-rating and above.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+from scipy import sparse
+
+# train.py puts the backend folder on sys.path, so the imports below are the server's modules
+from train import DEFAULT_DATASET_DIR, DEFAULT_OUTPUT_DIR, load_movies, load_ratings, surprise_dataset
+from content_index import ContentIndex
+from ranking import batch_top_n, blend_scores
+from svd_scoring import SVDScorer
+
+DEFAULT_ALPHAS = [round(alpha, 1) for alpha in np.linspace(0.0, 1.0, 11)]
+DEFAULT_KS = [5, 10, 20]
+LIKE_RATING = 4.0
+USER_BATCH_SIZE = 256
+
+
+def split_ratings(ratings, test_size, seed):
+    """Same random 80/20 split of the rating rows as the notebook's train_test_split."""
+    from sklearn.model_selection import train_test_split
+    return train_test_split(ratings, test_size=test_size, random_state=seed)
+
+
+def user_item_matrix(ratings, user_ids, movie_id_to_idx):
+    """users x movies CSR of ratings; rows follow user_ids, columns follow the catalog order."""
+    user_pos = {user_id: pos for pos, user_id in enumerate(user_ids)}
+    rows = np.fromiter((user_pos[user_id] for user_id in ratings['userId'].tolist()), dtype=np.int64, count=len(ratings))
+    cols = np.fromiter((movie_id_to_idx[movie_id] for movie_id in ratings['movieId'].tolist()), dtype=np.int64, count=len(ratings))
+    return sparse.csr_matrix(
+        (ratings['rating'].to_numpy(dtype=np.float64), (rows, cols)), shape=(len(user_ids), len(movie_id_to_idx))
+    )
+
+
+def fit_train_svd(train_ratings, params, seed, movie_ids):
+    from surprise import SVD
+    svd = SVD(random_state=seed, **params)
+    svd.fit(surprise_dataset(train_ratings).build_full_trainset())
+    return SVDScorer.from_surprise(svd, movie_ids)
+
+
+def best_params(output_dir):
+    """Best SVD parameters of train.py's last run, or Surprise's defaults when it has not been run."""
+    try:
+        with open(os.path.join(output_dir, '.train_cache', 'last_run.json')) as f:
+            return json.load(f)['best']['params']
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+# ------------------ BATCH SCORING (runs in pool processes) ------------------
+_context = None
+
+
+def _init_worker(context):
+    global _context
+    _context = context
+
+
+def _svd_scores(context, rows, train_rows):
+    scorer = context['svd_scorer']
+    if context['users'] == 'trained':
+        inner = [scorer.inner_uid(context['user_ids'][row]) for row in rows]
+        if all(inner_uid is not None for inner_uid in inner):
+            return scorer.score_factors_batch(scorer.bu[inner], scorer.pu[inner])
+        return np.vstack([scorer.score(context['user_ids'][row]) for row in rows])
+
+    biases, factors = [], []
+    for i in range(len(rows)):
+        row = train_rows.getrow(i)
+        bias, user_factors = scorer.fold_in_solve(*scorer.fold_in_history(row.indices, row.data))
+        biases.append(bias)
+        factors.append(user_factors)
+    return scorer.score_factors_batch(biases, np.vstack(factors))
+
+
+def _evaluate_users(rows):
+    """Metric sums over a chunk of users: (alphas x ks x [precision, recall, ndcg]) and recommended-item masks."""
+    context = _context
+    alphas, ks = context['alphas'], context['ks']
+    k_max = max(ks)
+    n_movies = context['train'].shape[1]
+    sums = np.zeros((len(alphas), len(ks), 3))
+    recommended = np.zeros((len(alphas), len(ks), n_movies), dtype=bool)
+    discounts = 1.0 / np.log2(np.arange(2, k_max + 2))
+    ideal = np.cumsum(discounts)
+
+    for start in range(0, len(rows), context['batch_size']):
+        batch = rows[start:start + context['batch_size']]
+        train_rows = context['train'][batch]
+        test_rows = context['test'][batch]
+        liked = train_rows.multiply(train_rows >= context['like_rating'])
+        liked.data[:] = 1.0
+
+        svd_scores = _svd_scores(context, batch, train_rows)
+        content_scores = context['content_index'].scores_batch(liked)
+        exclude = train_rows.toarray() != 0
+        relevant = (test_rows >= context['like_rating']).toarray()
+        n_relevant = relevant.sum(axis=1)
+        batch_rows = np.arange(len(batch))[:, None]
+
+        for a, alpha in enumerate(alphas):
+            top_lists = batch_top_n(blend_scores(svd_scores, content_scores, alpha), k_max, exclude)
+            top = np.full((len(batch), k_max), -1, dtype=np.int64)
+            for i, top_indices in enumerate(top_lists):
+                top[i, :len(top_indices)] = top_indices
+            valid = top >= 0
+            hits = relevant[batch_rows, np.maximum(top, 0)] & valid
+            for j, k in enumerate(ks):
+                n_hits = hits[:, :k].sum(axis=1)
+                dcg = (hits[:, :k] * discounts[:k]).sum(axis=1)
+                sums[a, j, 0] += (n_hits / k).sum()
+                sums[a, j, 1] += (n_hits / n_relevant).sum()
+                sums[a, j, 2] += (dcg / ideal[np.minimum(k, n_relevant) - 1]).sum()
+                recommended[a, j, top[:, :k][valid[:, :k]]] = True
+    return sums, recommended
+
+
+def evaluate(context, rows, jobs):
+    """Evaluates the users at `rows`; returns {alpha: {k: metrics}}."""
+    chunks = [chunk for chunk in np.array_split(rows, max(1, jobs * 4)) if len(chunk)]
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(context,)) as pool:
+            parts = list(pool.map(_evaluate_users, chunks))
+    else:
+        _init_worker(context)
+        parts = [_evaluate_users(chunk) for chunk in chunks]
+
+    sums = sum(part[0] for part in parts)
+    recommended = np.logical_or.reduce([part[1] for part in parts])
+    n_movies = context['train'].shape[1]
+    results = {}
+    for a, alpha in enumerate(context['alphas']):
+        results[alpha] = {}
+        for j, k in enumerate(context['ks']):
+            precision, recall, ndcg = sums[a, j] / len(rows)
+            results[alpha][k] = {
+                'precision': round(float(precision), 4),
+                'recall': round(float(recall), 4),
+                'ndcg': round(float(ndcg), 4),
+                'coverage': round(float(recommended[a, j].sum() / n_movies), 4),
+            }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default=DEFAULT_DATASET_DIR)
+    parser.add_argument('--models', default=DEFAULT_OUTPUT_DIR, help='folder with trained_content_index.npz')
+    parser.add_argument('--alphas', type=float, nargs='+', default=DEFAULT_ALPHAS)
+    parser.add_argument('--k', type=int, nargs='+', default=DEFAULT_KS)
+    parser.add_argument('--like-rating', type=float, default=LIKE_RATING)
+    parser.add_argument('--users', choices=['fold-in', 'trained'], default='fold-in')
+    parser.add_argument('--svd-model', help='score with this trained_svd.joblib instead of refitting on the split')
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch-size', type=int, default=USER_BATCH_SIZE)
+    parser.add_argument('--out', help='write the results as JSON')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    movies = load_movies(args.dataset)
+    movie_ids = movies['movieId'].tolist()
+    movie_id_to_idx = {movie_id: idx for idx, movie_id in enumerate(movie_ids)}
+    ratings = load_ratings(args.dataset, movie_ids)
+    train_ratings, test_ratings = split_ratings(ratings, args.test_size, args.seed)
+
+    user_ids = np.unique(ratings['userId'].to_numpy()).tolist()
+    train = user_item_matrix(train_ratings, user_ids, movie_id_to_idx)
+    test = user_item_matrix(test_ratings, user_ids, movie_id_to_idx)
+    # Users with something to learn from and something relevant to find
+    rows = np.flatnonzero((train.getnnz(axis=1) > 0) & ((test >= args.like_rating).getnnz(axis=1) > 0))
+
+    content_index = ContentIndex.load(os.path.join(args.models, 'trained_content_index.npz'))
+    if len(content_index) != len(movie_ids):
+        raise SystemExit("trained_content_index.npz does not match movies.csv, re-run train.py")
+    if args.svd_model:
+        svd_scorer = SVDScorer.from_surprise(joblib.load(args.svd_model), movie_ids)
+    else:
+        params = best_params(args.models)
+        print(f"Fitting SVD on the training split with {params or 'default parameters'}")
+        svd_scorer = fit_train_svd(train_ratings, params, args.seed, movie_ids)
+    prepared = time.perf_counter()
+
+    context = {
+        'svd_scorer': svd_scorer, 'content_index': content_index, 'train': train, 'test': test,
+        'user_ids': user_ids, 'users': args.users, 'like_rating': args.like_rating,
+        'alphas': args.alphas, 'ks': sorted(set(args.k)), 'batch_size': args.batch_size,
+    }
+    results = evaluate(context, rows, args.jobs)
+    done = time.perf_counter()
+
+    print(f"\n{len(rows)} users, {len(args.alphas)} alphas, prepared in {prepared - start:.1f}s, "
+          f"scored in {done - prepared:.1f}s on {args.jobs} processes")
+    print(f"{'alpha':>6} {'K':>4} {'precision':>10} {'recall':>8} {'ndcg':>8} {'coverage':>9}")
+    for alpha, by_k in results.items():
+        for k, metrics in by_k.items():
+            print(f"{alpha:>6.2f} {k:>4} {metrics['precision']:>10.4f} {metrics['recall']:>8.4f} "
+                  f"{metrics['ndcg']:>8.4f} {metrics['coverage']:>9.4f}")
+    k_best = context['ks'][0]
+    best_alpha = max(results, key=lambda alpha: results[alpha][k_best]['ndcg'])
+    print(f"Best ALPHA by NDCG@{k_best}: {best_alpha}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({
+                'params': {key: value for key, value in vars(args).items() if key != 'out'},
+                'users': len(rows),
+                'best_alpha': best_alpha,
+                'results': {str(alpha): {str(k): m for k, m in by_k.items()} for alpha, by_k in results.items()},
+            }, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
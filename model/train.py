@@ -0,0 +1,424 @@
+# train.py
+"""Command-line training pipeline for the hybrid recommender (replaces running model_training.ipynb).
+
+    python train.py                        # search, fit and write the artifacts to trained_models/
+    python train.py --jobs 8 --bundle      # 8 search processes, also export the memory-mapped bundle
+    python train.py --quick                # small grid and 3-fold CV, for smoke runs
+    python train.py --force content fit    # rebuild stages even if their inputs are unchanged
+
+Each stage fingerprints its inputs (file hashes plus parameters) and is skipped
+when the fingerprint and its outputs are unchanged since the last run. Every
+hyperparameter configuration's CV result is cached on its own, so an
+interrupted or widened search only evaluates the missing configurations.
+Fingerprints and search results live in <out>/.train_cache/.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pandas as pd
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(os.path.dirname(MODEL_DIR), 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR) # Same ContentIndex / SVDScorer / bundle code the server loads
+
+from content_index import CONTENT_TOP_K, ContentIndex
+from content_catalog import (FEATURIZER_FILE, GENRE_TFIDF_PARAMS, TAG_TFIDF_PARAMS, TAG_WEIGHT, ContentFeaturizer,
+                             aggregate_tags, load_tags)
+
+DEFAULT_DATASET_DIR = os.path.join(MODEL_DIR, 'dataset')
+DEFAULT_OUTPUT_DIR = os.path.join(MODEL_DIR, 'trained_models')
+
+TOP_N = 5
+ALPHA = 0.6 # Weight for collaborative filtering (CF), (1 - ALPHA) for content-based
+RATING_SCALE = (0.5, 5.0)
+RATINGS_CHUNK_ROWS = 1_000_000
+RATINGS_DTYPES = {'userId': np.int32, 'movieId': np.int32, 'rating': np.float32}
+
+PARAM_GRID = {
+    'n_factors': [50, 100, 150],
+    'n_epochs': [20, 30],
+    'lr_all': [0.005, 0.01],
+    'reg_all': [0.02, 0.05],
+}
+QUICK_PARAM_GRID = {
+    'n_factors': [50, 100],
+    'n_epochs': [20],
+    'lr_all': [0.005],
+    'reg_all': [0.02, 0.05],
+}
+
+
+# ------------------ FINGERPRINTS ------------------
+def _digest(value):
+    return hashlib.blake2b(json.dumps(value, sort_keys=True, default=str).encode(), digest_size=12).hexdigest()
+
+
+class StageCache:
+    """Input fingerprints of the last successful run of each stage, kept in stages.json."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, 'stages.json')
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            with open(self.path) as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+        self.state.setdefault('stages', {})
+        self.state.setdefault('files', {})
+
+    def file_hash(self, path):
+        """Content hash of a file; reused while its size and mtime are unchanged so big CSVs are read once."""
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        known = self.state['files'].get(key)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['hash']
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.state['files'][key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest.hexdigest()}
+        self.save()
+        return digest.hexdigest()
+
+    def is_fresh(self, stage, fingerprint, outputs):
+        return (self.state['stages'].get(stage) == fingerprint
+                and all(os.path.exists(path) for path in outputs))
+
+    def mark(self, stage, fingerprint):
+        self.state['stages'][stage] = fingerprint
+        self.save()
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+# ------------------ STAGE REPORTING ------------------
+def _rss_mb(who):
+    usage = resource.getrusage(who).ru_maxrss
+    return usage / 1024 / (1024 if sys.platform == 'darwin' else 1) # bytes on macOS, KiB on Linux
+
+
+class StageTimer:
+    """Wall time and peak traced memory of one stage (numpy and pandas buffers are traced too)."""
+
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+        self.status = 'ran'
+
+    def __enter__(self):
+        tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall_s = time.perf_counter() - self.start
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        entry = {
+            'stage': self.name,
+            'status': self.status if exc_type is None else 'failed',
+            'wall_s': round(wall_s, 2),
+            'peak_mb': round(peak_mb, 1),
+            'process_max_rss_mb': round(_rss_mb(resource.RUSAGE_SELF), 1),
+            'children_max_rss_mb': round(_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        }
+        self.report.append(entry)
+        print(f"[{self.name}] {entry['status']} in {wall_s:.1f}s, peak {peak_mb:.1f} MB")
+        return False
+
+
+def print_report(report):
+    print(f"\n{'stage':<10} {'status':<24} {'wall s':>8} {'peak MB':>9} {'max RSS MB':>11} {'workers MB':>11}")
+    for entry in report:
+        print(f"{entry['stage']:<10} {entry['status']:<24} {entry['wall_s']:>8.1f} {entry['peak_mb']:>9.1f} "
+              f"{entry['process_max_rss_mb']:>11.1f} {entry['children_max_rss_mb']:>11.1f}")
+
+
+# ------------------ DATA ------------------
+def load_movies(dataset_dir):
+    movies = pd.read_csv(os.path.join(dataset_dir, 'movies.csv'), dtype={'movieId': np.int32})
+    # genres are pipe-separated, so ' '.join(x.split('|')) gives the TF-IDF document
+    movies['content'] = movies['genres'].str.split('|').str.join(' ')
+    return movies.drop(columns=['genres'])
+
+
+def load_ratings(dataset_dir, movie_ids):
+    """Streams ratings.csv in chunks with compact dtypes, keeping only movies in the catalog."""
+    catalog = np.asarray(movie_ids, dtype=np.int32)
+    chunks = []
+    reader = pd.read_csv(
+        os.path.join(dataset_dir, 'ratings.csv'), usecols=list(RATINGS_DTYPES),
+        dtype=RATINGS_DTYPES, chunksize=RATINGS_CHUNK_ROWS,
+    )
+    for chunk in reader:
+        chunks.append(chunk[np.isin(chunk['movieId'].to_numpy(), catalog)])
+    return pd.concat(chunks, ignore_index=True)
+
+
+def surprise_dataset(ratings):
+    from surprise import Dataset, Reader
+    return Dataset.load_from_df(ratings[['userId', 'movieId', 'rating']], Reader(rating_scale=RATING_SCALE))
+
+
+# ------------------ STAGES ------------------
+def train_content(movies, tags, output_dir, k, tag_weight):
+    # The fitted featurizer is saved so content_catalog.py can add movies without refitting
+    tag_docs = aggregate_tags(tags, movies['movieId'])
+    featurizer = ContentFeaturizer.fit(movies['content'], tag_docs, tag_weight=tag_weight)
+    features = featurizer.transform(movies['content'], tag_docs)
+    content_index = ContentIndex.from_features(features, k=k)
+    featurizer.save(os.path.join(output_dir, FEATURIZER_FILE))
+    content_index.save(os.path.join(output_dir, 'trained_content_index.npz'))
+    print(f"Content index: {len(content_index)} movies ({sum(map(bool, tag_docs))} tagged), "
+          f"{features.shape[1]} features, {content_index.neighbors.nnz} neighbour entries")
+
+
+def write_mappings(movies, output_dir, alpha, top_n):
+    movie_ids = movies['movieId'].tolist()
+    joblib.dump({
+        'Movie_ids': movie_ids,
+        'Movie_id_to_idx': {movie_id: idx for idx, movie_id in enumerate(movie_ids)},
+        'ALPHA': alpha,
+        'TOP_N': top_n,
+    }, os.path.join(output_dir, 'recommender_mappings.joblib'))
+
+
+def write_popularity(movies, ratings, output_dir):
+    """Number of ratings per movie in catalog order, for the backend's popularity candidates."""
+    positions = pd.Series(np.arange(len(movies)), index=movies['movieId'].to_numpy())
+    counts = np.bincount(positions.loc[ratings['movieId'].to_numpy()].to_numpy(), minlength=len(movies))
+    np.save(os.path.join(output_dir, 'trained_popularity.npy'), counts.astype(np.int64))
+
+
+_worker_data = None
+
+
+def _init_search_worker(ratings):
+    global _worker_data
+    _worker_data = surprise_dataset(ratings)
+
+
+def _evaluate_config(params, cv, seed):
+    """Runs in a pool process: k-fold CV RMSE of one SVD configuration."""
+    from surprise import SVD
+    from surprise.model_selection import KFold, cross_validate
+    start = time.perf_counter()
+    folds = KFold(n_splits=cv, random_state=seed, shuffle=True)
+    results = cross_validate(SVD(random_state=seed, **params), _worker_data, measures=['rmse'], cv=folds)
+    return {
+        'params': params,
+        'rmse': float(np.mean(results['test_rmse'])),
+        'rmse_std': float(np.std(results['test_rmse'])),
+        'wall_s': round(time.perf_counter() - start, 2),
+    }
+
+
+def search(ratings, ratings_hash, param_grid, cv, seed, jobs, cache_dir, timer):
+    """Grid search over param_grid in a process pool; returns the best result dict."""
+    result_dir = os.path.join(cache_dir, 'search')
+    os.makedirs(result_dir, exist_ok=True)
+    names = sorted(param_grid)
+    configs = [dict(zip(names, values)) for values in itertools.product(*(param_grid[n] for n in names))]
+
+    results, pending = [], []
+    for params in configs:
+        path = os.path.join(result_dir, _digest({'ratings': ratings_hash, 'params': params, 'cv': cv, 'seed': seed}) + '.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                results.append(json.load(f))
+        else:
+            pending.append((params, path))
+    print(f"Search: {len(configs)} configurations, {len(configs) - len(pending)} cached, "
+          f"{len(pending)} to evaluate on {min(jobs, max(1, len(pending)))} processes")
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(pending)), initializer=_init_search_worker,
+                                 initargs=(ratings,)) as pool:
+            futures = {pool.submit(_evaluate_config, params, cv, seed): path for params, path in pending}
+            for future in as_completed(futures):
+                result = future.result()
+                with open(futures[future], 'w') as f:
+                    json.dump(result, f)
+                results.append(result)
+                print(f"  rmse {result['rmse']:.4f} +/- {result['rmse_std']:.4f}  {result['params']}  ({result['wall_s']}s)")
+
+    timer.status = f"ran {len(pending)}/{len(configs)} configs"
+    best = min(results, key=lambda result: (result['rmse'], _digest(result['params'])))
+    print(f"Best RMSE score for SVD: {best['rmse']:.4f}")
+    print(f"Best parameters for SVD: {best['params']}")
+    return best
+
+
+def fit_svd(ratings, params, seed, output_dir):
+    """Refits the best configuration on every rating (the notebook refit on an 80% split)."""
+    from surprise import SVD
+    svd = SVD(random_state=seed, **params)
+    svd.fit(surprise_dataset(ratings).build_full_trainset())
+    joblib.dump(svd, os.path.join(output_dir, 'trained_svd.joblib'))
+    return svd
+
+
+def build_mips(output_dir):
+    from mips_index import MIPSIndex
+    from svd_scoring import SVDScorer
+    mapping_data = joblib.load(os.path.join(output_dir, 'recommender_mappings.joblib'))
+    svd = joblib.load(os.path.join(output_dir, 'trained_svd.joblib'))
+    index = MIPSIndex.build(SVDScorer.from_surprise(svd, mapping_data['Movie_ids']))
+    index.save(os.path.join(output_dir, 'trained_mips_index.npz'))
+    print(f"MIPS index: {index.n_lists} lists over {len(index)} movies")
+
+
+def export(dataset_dir, output_dir, bundle_dir, alpha, top_n):
+    from artifacts import export_bundle
+    from svd_scoring import SVDScorer
+    mapping_data = joblib.load(os.path.join(output_dir, 'recommender_mappings.joblib'))
+    svd = joblib.load(os.path.join(output_dir, 'trained_svd.joblib'))
+    manifest = export_bundle(
+        bundle_dir,
+        SVDScorer.from_surprise(svd, mapping_data['Movie_ids']),
+        ContentIndex.load(os.path.join(output_dir, 'trained_content_index.npz')),
+        mapping_data['Movie_ids'],
+        pd.read_csv(os.path.join(dataset_dir, 'combined_data.csv')),
+        pd.read_csv(os.path.join(dataset_dir, 'popular_movies.csv')),
+        alpha, top_n,
+        popularity=np.load(os.path.join(output_dir, 'trained_popularity.npy')),
+    )
+    print(f"Wrote bundle {manifest['version']} to {bundle_dir}")
+
+
+# ------------------ PIPELINE ------------------
+def run(args):
+    output_dir = os.path.abspath(args.out)
+    os.makedirs(output_dir, exist_ok=True)
+    cache = StageCache(os.path.join(output_dir, '.train_cache'))
+    param_grid = json.loads(args.grid) if args.grid else (QUICK_PARAM_GRID if args.quick else PARAM_GRID)
+    cv = args.cv or (3 if args.quick else 5)
+    forced = set(args.force or [])
+    report = []
+    tracemalloc.start()
+
+    def fresh(stage, fingerprint, outputs):
+        return stage not in forced and 'all' not in forced and cache.is_fresh(stage, fingerprint, outputs)
+
+    with StageTimer(report, 'load'):
+        movies_hash = cache.file_hash(os.path.join(args.dataset, 'movies.csv'))
+        ratings_hash = cache.file_hash(os.path.join(args.dataset, 'ratings.csv'))
+        tags_path = os.path.join(args.dataset, 'tags.csv')
+        tags_hash = cache.file_hash(tags_path) if os.path.exists(tags_path) else None
+        tags = load_tags([tags_path])
+        movies = load_movies(args.dataset)
+        ratings = load_ratings(args.dataset, movies['movieId'])
+        print(f"Loaded {len(movies)} movies and {len(ratings)} ratings "
+              f"({ratings.memory_usage(index=False).sum() / 2**20:.1f} MB in memory)")
+
+    content_outputs = [os.path.join(output_dir, name) for name in ('trained_content_index.npz', FEATURIZER_FILE)]
+    content_fp = _digest({
+        'movies': movies_hash, 'tags': tags_hash, 'tfidf': GENRE_TFIDF_PARAMS, 'tag_tfidf': TAG_TFIDF_PARAMS,
+        'tag_weight': args.tag_weight, 'k': args.content_top_k,
+    })
+    with StageTimer(report, 'content') as timer:
+        if fresh('content', content_fp, content_outputs):
+            timer.status = 'skipped (unchanged)'
+        else:
+            train_content(movies, tags, output_dir, args.content_top_k, args.tag_weight)
+            cache.mark('content', content_fp)
+
+    mappings_path = os.path.join(output_dir, 'recommender_mappings.joblib')
+    mappings_fp = _digest({'movies': movies_hash, 'alpha': args.alpha, 'top_n': args.top_n})
+    with StageTimer(report, 'mappings') as timer:
+        if fresh('mappings', mappings_fp, [mappings_path]):
+            timer.status = 'skipped (unchanged)'
+        else:
+            write_mappings(movies, output_dir, args.alpha, args.top_n)
+            cache.mark('mappings', mappings_fp)
+
+    popularity_fp = _digest({'movies': movies_hash, 'ratings': ratings_hash})
+    with StageTimer(report, 'popularity') as timer:
+        if fresh('popularity', popularity_fp, [os.path.join(output_dir, 'trained_popularity.npy')]):
+            timer.status = 'skipped (unchanged)'
+        else:
+            write_popularity(movies, ratings, output_dir)
+            cache.mark('popularity', popularity_fp)
+
+    with StageTimer(report, 'search') as timer:
+        best = search(ratings, ratings_hash, param_grid, cv, args.seed, args.jobs, cache.cache_dir, timer)
+
+    svd_path = os.path.join(output_dir, 'trained_svd.joblib')
+    fit_fp = _digest({'ratings': ratings_hash, 'movies': movies_hash, 'params': best['params'], 'seed': args.seed})
+    with StageTimer(report, 'fit') as timer:
+        if fresh('fit', fit_fp, [svd_path]):
+            timer.status = 'skipped (unchanged)'
+        else:
+            fit_svd(ratings, best['params'], args.seed, output_dir)
+            cache.mark('fit', fit_fp)
+
+    if args.mips:
+        mips_fp = _digest({'mappings': mappings_fp, 'fit': fit_fp})
+        with StageTimer(report, 'mips') as timer:
+            if fresh('mips', mips_fp, [os.path.join(output_dir, 'trained_mips_index.npz')]):
+                timer.status = 'skipped (unchanged)'
+            else:
+                build_mips(output_dir)
+                cache.mark('mips', mips_fp)
+
+    if args.bundle:
+        bundle_dir = args.bundle_dir or os.path.join(output_dir, 'bundle')
+        bundle_fp = _digest({
+            'content': content_fp, 'mappings': mappings_fp, 'fit': fit_fp, 'popularity': popularity_fp,
+            'combined_data': cache.file_hash(os.path.join(args.dataset, 'combined_data.csv')),
+            'popular_movies': cache.file_hash(os.path.join(args.dataset, 'popular_movies.csv')),
+        })
+        with StageTimer(report, 'bundle') as timer:
+            if fresh('bundle', bundle_fp, [os.path.join(bundle_dir, 'manifest.json')]):
+                timer.status = 'skipped (unchanged)'
+            else:
+                export(args.dataset, output_dir, bundle_dir, args.alpha, args.top_n)
+                cache.mark('bundle', bundle_fp)
+
+    tracemalloc.stop()
+    print_report(report)
+    with open(os.path.join(cache.cache_dir, 'last_run.json'), 'w') as f:
+        json.dump({'best': best, 'cv': cv, 'stages': report}, f, indent=2)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default=DEFAULT_DATASET_DIR, help='folder with movies.csv, ratings.csv and tags.csv')
+    parser.add_argument('--out', default=DEFAULT_OUTPUT_DIR, help='where the backend artifacts are written')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='search processes')
+    parser.add_argument('--cv', type=int, help='folds per configuration (default 5, 3 with --quick)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--grid', help='JSON param grid, e.g. \'{"n_factors": [50, 100], "n_epochs": [20]}\'')
+    parser.add_argument('--quick', action='store_true', help='small grid and 3 folds')
+    parser.add_argument('--alpha', type=float, default=ALPHA)
+    parser.add_argument('--top-n', type=int, default=TOP_N)
+    parser.add_argument('--content-top-k', type=int, default=CONTENT_TOP_K)
+    parser.add_argument('--tag-weight', type=float, default=TAG_WEIGHT, help='weight of tags.csv tags next to genres, 0 = genres only')
+    parser.add_argument('--mips', action='store_true', help='also build the approximate MIPS index (large catalogs)')
+    parser.add_argument('--bundle', action='store_true', help='also export the memory-mapped bundle')
+    parser.add_argument('--bundle-dir', help='bundle location (default <out>/bundle)')
+    parser.add_argument('--force', nargs='+', choices=['content', 'mappings', 'popularity', 'fit', 'mips', 'bundle', 'all'],
+                        help='rebuild these stages even if their inputs are unchanged')
+    run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()